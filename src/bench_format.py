@@ -0,0 +1,258 @@
+# python version 3.8
+# UTF-8 encoding
+"""Micro-benchmarks of the formatting stages of OrgmodeEntry.
+
+A synthetic corpus is generated for each input shape and every entry runs
+through format_entry and through each formatting stage on its own. Stages
+get the input they see inside format_entry (e.g. get_deadline_date gets the
+body with converted dates).
+
+    python bench_format.py --save baseline.json
+    python bench_format.py --compare baseline.json --tolerance 0.1
+
+The results (ops/sec, p50 and p99 per stage in microseconds) are printed as
+JSON. With --compare the script exits with status 1 if a stage got slower
+than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_entry import OrgmodeEntry  # noqa: E402
+
+words = ("Meeting Bericht review draft Projekt Angebot call budget Termin "
+         "release notes Rechnung team Ausstellung anschauen prepare slides "
+         "Kunde follow-up email Entwurf sprint planning").split()
+
+weekdays = ["montag", "monday", "dienstag", "tuesday", "mittwoch",
+            "wednesday", "donnerstag", "thursday", "freitag", "friday",
+            "samstag", "saturday", "sonntag", "sunday"]
+relative_dates = ["heute", "today", "morgen", "tomorrow"]
+
+
+class CorpusGenerator(object):
+    """Generate capture strings ('heading:: body') of a given shape."""
+    shapes = ["short", "long", "dates", "multilingual", "priority",
+              "markers", "mixed"]
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def generate(self, shape, count):
+        make = getattr(self, "make_%s" % shape)
+        return [make() for i in range(count)]
+
+    def text(self, count):
+        return " ".join(self.random.choice(words) for i in range(count))
+
+    def absolute_date(self):
+        day, month = self.random.randint(1, 28), self.random.randint(1, 12)
+        date = self.random.choice(["%s.%s", "%02d.%02d", "%s.%s.2027"]) % (
+            day, month)
+        if self.random.random() < 0.5:
+            date += " %02d:%02d" % (self.random.randint(0, 23),
+                                    self.random.choice([0, 15, 30, 45]))
+        return date
+
+    def relative_date(self, vocabulary=None):
+        word = self.random.choice(vocabulary or weekdays + relative_dates)
+        return self.random.choice([word, word.capitalize(), word.upper()])
+
+    def make_short(self):
+        return "TODO " + self.text(self.random.randint(1, 4))
+
+    def make_long(self):
+        sentences = [self.text(self.random.randint(5, 15)) + "."
+                     for i in range(self.random.randint(20, 60))]
+        return "TODO %s:: %s" % (self.text(4), "  ".join(sentences))
+
+    def make_dates(self):
+        parts = []
+        for i in range(self.random.randint(4, 12)):
+            parts.append(self.text(self.random.randint(1, 4)))
+            if self.random.random() < 0.5:
+                parts.append(self.absolute_date())
+            else:
+                parts.append(self.relative_date())
+        return "TODO %s:: %s" % (self.text(3), " ".join(parts))
+
+    def make_multilingual(self):
+        parts = []
+        for i in range(self.random.randint(3, 8)):
+            parts.append(self.text(self.random.randint(2, 5)))
+            parts.append(self.relative_date(weekdays))
+        return "TODO %s:: %s" % (self.text(3), " ".join(parts))
+
+    def make_priority(self):
+        priority = "#%s " % self.random.choice("ABCabc")
+        heading = self.text(self.random.randint(2, 6))
+        if self.random.random() < 0.5:
+            heading = priority + heading
+        else:
+            heading = heading + " " + priority + self.text(2)
+        return "TODO %s:: %s" % (heading, self.text(8))
+
+    def make_markers(self):
+        body = [self.text(self.random.randint(3, 8))]
+        if self.random.random() < 0.8:
+            body.append("DL: " + self.relative_date())
+        if self.random.random() < 0.8:
+            body.append("S: " + self.relative_date())
+        body.append(self.text(self.random.randint(3, 8)))
+        self.random.shuffle(body)
+        return "TODO %s:: %s" % (self.text(3), " ".join(body))
+
+    def make_mixed(self):
+        shape = self.random.choice(self.shapes[:-1])
+        return getattr(self, "make_%s" % shape)()
+
+
+def get_stage_inputs(org, string):
+    """Return {stage: input} with the input each stage sees in format_entry."""
+    items = org.split_string(org.encode(string))
+    inputs = {"format_entry": string, "add_priority": items[0]}
+    if len(items) == 1:
+        return inputs
+
+    body = items[1]
+    inputs["convert_absolute_date"] = body
+    body = org.convert_absolute_date(body)
+    inputs["replace_date"] = body
+    body = org.replace_date(body)
+    inputs["convert_line_breaks"] = body
+    body = org.convert_line_breaks(body)
+    inputs["get_deadline_date"] = body
+    deadline, body = org.get_deadline_date(body)
+    inputs["get_scheduled_date"] = body
+    scheduled, body = org.get_scheduled_date(body)
+    inputs["remove_double_spaces"] = body
+    return inputs
+
+
+stages = ["format_entry", "convert_absolute_date", "replace_date",
+          "convert_line_breaks", "get_deadline_date", "get_scheduled_date",
+          "remove_double_spaces", "add_priority"]
+
+
+def measure(function, inputs, rounds):
+    """Call function on every input for rounds; return the per call times in seconds."""
+    timer = time.perf_counter
+    samples = []
+    for i in range(rounds):
+        for value in inputs:
+            start = timer()
+            function(value)
+            samples.append(timer() - start)
+    return samples
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    count = len(samples)
+    return {
+        "calls": count,
+        "ops_per_sec": count / sum(samples) if sum(samples) else 0.0,
+        "p50_us": samples[count // 2] * 1e6,
+        "p99_us": samples[min(count - 1, int(count * 0.99))] * 1e6,
+    }
+
+
+def run_benchmarks(shapes, count, rounds, seed):
+    generator = CorpusGenerator(seed)
+    org = OrgmodeEntry()
+    results = {}
+    for shape in shapes:
+        corpus = generator.generate(shape, count)
+        inputs = {stage: [] for stage in stages}
+        for string in corpus:
+            for stage, value in get_stage_inputs(org, string).items():
+                inputs[stage].append(value)
+
+        results[shape] = {}
+        for stage in stages:
+            if not inputs[stage]:
+                continue
+            function = getattr(org, stage)
+            # Warm up (compiles the patterns)
+            measure(function, inputs[stage][:10], 1)
+            results[shape][stage] = summarize(
+                measure(function, inputs[stage], rounds))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the comparison rows and the stages slower than tolerance."""
+    rows, regressions = [], []
+    for shape, stages_ in sorted(results.items()):
+        for stage, result in sorted(stages_.items()):
+            try:
+                reference = baseline["results"][shape][stage]
+            except KeyError:
+                continue
+            ratio = reference["ops_per_sec"] / result["ops_per_sec"]
+            row = {"shape": shape, "stage": stage, "ratio": ratio,
+                   "ops_per_sec": result["ops_per_sec"],
+                   "baseline_ops_per_sec": reference["ops_per_sec"]}
+            rows.append(row)
+            if ratio > 1 + tolerance:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", action="append",
+                        choices=CorpusGenerator.shapes,
+                        help="input shape (default: all)")
+    parser.add_argument("--count", type=int, default=200,
+                        help="entries per shape (default: 200)")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="passes over each corpus (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="FILE",
+                        help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare the results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed slowdown in --compare (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "count": args.count,
+            "rounds": args.rounds,
+            "seed": args.seed,
+        },
+        "results": run_benchmarks(args.shape or CorpusGenerator.shapes,
+                                  args.count, args.rounds, args.seed),
+    }
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        rows, regressions = compare(results["results"], baseline,
+                                    args.tolerance)
+        results["comparison"] = rows
+        results["regressions"] = regressions
+        status = 1 if regressions else 0
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# python version 3.8
+# UTF-8 encoding
+"""Cold-start benchmark of the capture path Alfred runs.
+
+Each cold run starts a new interpreter, imports org_mode_capture_run and
+calls run(entry, action) for the note, inspiration and todo actions, which
+append to temporary inbox files. Warm runs repeat run() in this process.
+
+    python bench_startup.py --runs 20 --budget 80 --import-budget 20
+
+The budgets are in milliseconds; the script exits with status 1 if the
+median cold start or the import time of a cold run exceeds them. The import
+time is that of the child under python -X importtime: the import of
+org_mode_capture_run and the modules its first run() imports.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "py38")
+
+actions = ["note", "inspiration", "todo"]
+
+entry = ("#A Etwas machen:: DL: Morgen S: Heute Ausstellung am 23.09.2014 "
+         "12:00 oder am Montag   bzw. am 22.10 13:00 sollte man anschauen.")
+
+# Runs in the child interpreter: prints the timings (seconds) as a dict
+child = """
+import os
+import sys
+import time
+if "importtime" in sys._xoptions:
+    os.write(2, b"%s\\n")
+start = time.perf_counter()
+from org_mode_capture_run import run
+timings = {"import": time.perf_counter() - start}
+for action in %r:
+    start = time.perf_counter()
+    run(%r, action)
+    timings[action] = time.perf_counter() - start
+print(repr(timings))
+"""
+
+
+def get_environ(directory):
+    """Return the workflow variables (workflow defaults) with inboxes in directory."""
+    environ = dict(os.environ)
+    environ.update({
+        "notes_inbox": os.path.join(directory, "notes.org"),
+        "notes_heading_level": "2",
+        "inspirations_inbox": os.path.join(directory, "inspirations.org"),
+        "inspirations_heading_level": "2",
+        "todos_inbox": os.path.join(directory, "todos.org"),
+        "todos_heading_level": "2",
+        "delimiter": ":: ",
+        "use_priority_tags": "1",
+        "priority_tag": "#",
+        "add_creation_date": "1",
+        "replace_absolute_dates": "1",
+        "replace_relative_dates": "1",
+        "convert_scheduled": "1",
+        "scheduled_pattern": "S: ",
+        "convert_deadlines": "1",
+        "deadline_pattern": "DL: ",
+        "smart_line_break": "1",
+        "line_break_pattern": r"\s\s",
+        "cleanup_spaces": "1",
+    })
+    environ["PYTHONPATH"] = os.pathsep.join(
+        [source] + [p for p in [environ.get("PYTHONPATH")] if p])
+    # Compiled bytecode is part of a normal start
+    environ.pop("PYTHONDONTWRITEBYTECODE", None)
+    return environ
+
+
+# Written to stderr by the child before the capture starts
+marker = "capture start"
+
+
+def get_child_script():
+    return child % (marker, actions, entry)
+
+
+def measure_cold(environ, runs):
+    """Start runs interpreters; return the wall time and the child timings of each."""
+    script = get_child_script()
+    results = []
+    for i in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", script], env=environ,
+                                check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        total = time.perf_counter() - start
+        timings = ast.literal_eval(output)
+        timings["total"] = total
+        results.append(timings)
+    return results
+
+
+def measure_warm(environ, runs):
+    """Repeat run() in this process after one warm up call per action."""
+    saved = dict(os.environ)
+    os.environ.update(environ)
+    if source not in sys.path:
+        sys.path.insert(0, source)
+    try:
+        from org_mode_capture_run import run
+
+        results = []
+        for action in actions:
+            run(entry, action)
+        for i in range(runs):
+            timings = {}
+            for action in actions:
+                start = time.perf_counter()
+                run(entry, action)
+                timings[action] = time.perf_counter() - start
+            results.append(timings)
+        return results
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def measure_imports(environ):
+    """Return the imports of a cold run as [(module, self, cumulative, top level)].
+
+    The times are in seconds, from the child (import and run() of each
+    action) under python -X importtime.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", get_child_script()],
+        env=environ, check=True, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, universal_newlines=True).stderr
+
+    # Each line is "import time: self | cumulative | name"; the imports of a
+    # module are listed before it and indented deeper. Only the imports after
+    # the marker are kept (the interpreter start comes first), also those of
+    # run(): the modules it imports on first use.
+    rows = []
+    lines = output.splitlines()
+    for line in lines[lines.index(marker) + 1:]:
+        if line.startswith("import time:") and "self [us]" not in line:
+            rows.append(line[len("import time:"):].split("|"))
+
+    return [(name.strip(), int(own) / 1e6, int(cumulative) / 1e6,
+             not name.startswith("   "))
+            for own, cumulative, name in rows]
+
+
+def summarize(results):
+    """Return the median and maximum of each timing in milliseconds."""
+    summary = {}
+    for key in results[0]:
+        values = [result[key] * 1000 for result in results]
+        summary[key] = {
+            "median": statistics.median(values),
+            "max": max(values),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10,
+                        help="number of cold starts (default: 10)")
+    parser.add_argument("--warm-runs", type=int, default=100,
+                        help="number of warm runs (default: 100)")
+    parser.add_argument("--budget", type=float,
+                        help="maximum median cold start in ms")
+    parser.add_argument("--import-budget", type=float,
+                        help="maximum import time of a cold run in ms")
+    parser.add_argument("--top", type=int, default=15,
+                        help="number of modules in the import breakdown")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        environ = get_environ(directory)
+        cold = summarize(measure_cold(environ, args.runs))
+        # After the cold runs, so that the bytecode is cached
+        imports = measure_imports(environ)
+        warm = summarize(measure_warm(environ, args.warm_runs))
+
+    import_time = sum(cumulative for name, own, cumulative, top in imports
+                      if top) * 1000
+    imports = sorted(imports, key=lambda item: item[1], reverse=True)
+    failures = []
+    if args.budget is not None and cold["total"]["median"] > args.budget:
+        failures.append("cold start %.1f ms exceeds the budget of %.1f ms" %
+                        (cold["total"]["median"], args.budget))
+    if args.import_budget is not None and import_time > args.import_budget:
+        failures.append("import time %.1f ms exceeds the budget of %.1f ms" %
+                        (import_time, args.import_budget))
+
+    if args.json:
+        print(json.dumps({
+            "cold": cold,
+            "warm": warm,
+            "import_time": import_time,
+            "imports": [{"module": name, "self": own * 1000,
+                         "cumulative": cumulative * 1000}
+                        for name, own, cumulative, top in imports[:args.top]],
+            "failures": failures,
+        }, indent=2))
+    else:
+        print("Cold start (%s runs)        median      max" % args.runs)
+        for key, value in cold.items():
+            print("  %-24s %8.2f ms %8.2f ms" % (key, value["median"], value["max"]))
+        print("Warm run (%s runs)          median      max" % args.warm_runs)
+        for key, value in warm.items():
+            print("  %-24s %8.2f ms %8.2f ms" % (key, value["median"], value["max"]))
+        print("Imports of a cold run: %.2f ms" % import_time)
+        for name, own, cumulative, top in imports[:args.top]:
+            print("  %-24s %8.2f ms self %8.2f ms cumulative" %
+                  (name, own * 1000, cumulative * 1000))
+        for failure in failures:
+            print("FAIL: %s" % failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
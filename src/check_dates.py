@@ -0,0 +1,98 @@
+# python version 3.8
+# UTF-8 encoding
+"""Check the incremental date scan of the live preview against full scans.
+
+Random queries are typed, edited and deleted character by character as in
+the preview; after every keystroke the dates found by DateMatcher.find,
+which rescans only the changed end of the query, must be those of a scan
+of the whole query.
+
+    python check_dates.py --sequences 500 --seed 1
+
+Exits with status 1 if a scan differs.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_dates import DateMatcher  # noqa: E402
+
+# Date expressions of the locale packs and other words
+words = [
+    "tomorrow", "today", "next friday", "fri 14:00", "in 3 days", "+2w",
+    "01.10", "01.10 15:00", "23.09.2014 12:00", "on monday", "mon",
+    "morgen", "übermorgen", "nächsten Montag", "in 2 Wochen", "am 22.10",
+    "call", "Bob", "report", "at", "in", "next", "3", "days", "15:00", "DL:",
+    "S:", "  "
+]
+
+
+def get_edits(random):
+    """Yield the queries of a random edit sequence."""
+    text = ""
+    for step in range(random.randint(1, 12)):
+        kind = random.random()
+        if kind < 0.6:
+            # Typed at the end
+            for character in " " * bool(text) + random.choice(words):
+                text += character
+                yield text
+        elif kind < 0.8 and text:
+            # Deleted from the end
+            for count in range(random.randint(1, min(len(text), 12))):
+                text = text[:-1]
+                yield text
+        else:
+            # Changed in the middle
+            position = random.randint(0, len(text))
+            text = text[:position] + random.choice(words) + \
+                text[position + random.randint(0, 5):]
+            yield text
+
+
+def check(sequences, seed):
+    """Return the list of problems found."""
+    today = datetime.date(2026, 10, 18)
+    full = DateMatcher()
+    tables = full.get_tables()
+    # A scan is only continued with the same options: a matcher per options
+    incremental = {}
+    for options in [(True, True), (True, False)]:
+        incremental[options] = DateMatcher(tables=tables)
+    generator = random.Random(seed)
+    problems = []
+    for sequence in range(sequences):
+        for matcher in incremental.values():
+            matcher.previous = None
+        for text in get_edits(generator):
+            for (absolute, relative), matcher in incremental.items():
+                full.previous = None
+                expected = full.find(text, today, absolute, relative)
+                found = matcher.find(text, today, absolute, relative)
+                if found != expected:
+                    problems.append("%r: %r instead of %r" %
+                                    (text, found, expected))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sequences", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    problems = check(args.sequences, args.seed)
+    for problem in problems[:20]:
+        print(problem)
+    print("%s edit sequences: %s" %
+          (args.sequences, "FAILED" if problems else "OK"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
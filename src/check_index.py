@@ -0,0 +1,125 @@
+# python version 3.8
+# UTF-8 encoding
+"""Check the updates of the headline index against rebuilt indexes.
+
+An org file is changed at random: captures appended with extend(), text
+appended by other programs (also in the middle of a line), edits before
+the end (also ones that keep the size, such as TODO to DONE) and
+truncations picked up by update(). After each step the index must have
+the headlines of an index built from scratch.
+
+    python check_index.py --steps 2000 --seed 1
+
+Exits with status 1 if an index differs.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_index import HeadlineIndex  # noqa: E402
+
+words = ["alpha", "beta", "TODO", "DONE", "[#A]", "report", "über", "Straße",
+         "x1", "42", ":tag:", "*", "**"]
+lines = ["DEADLINE: <2026-10-20 Tue>", "SCHEDULED: <2026-10-19 Mon 9:00>",
+         "DEADLINE: <2026-11-01 Sun> SCHEDULED: <2026-10-30 Fri>",
+         ":PROPERTIES:\n:CREATED: [2026-10-18 Sun]\n:END:", "", "body text"]
+
+
+def get_text(random):
+    """Return random org text, starting with a headline or not."""
+    parts = []
+    for number in range(random.randint(1, 3)):
+        if random.random() < 0.8:
+            parts.append("\n%s %s" % ("*" * random.randint(1, 3), " ".join(
+                random.choice(words) for _ in range(random.randint(0, 4)))))
+        for _ in range(random.randint(0, 3)):
+            parts.append("\n" + random.choice(lines))
+    text = "".join(parts)
+    if random.random() < 0.3:
+        # Continues the last line of the file
+        text = text[random.randint(1, 6):]
+    return text.encode("utf-8")
+
+
+def get_headlines(path):
+    index = HeadlineIndex(path).update()
+    return index.headlines, index.last_offset
+
+
+def rebuild(path):
+    index = HeadlineIndex(path)
+    os.remove(index.index_file)
+    return get_headlines(path)
+
+
+def append(path, data):
+    with open(path, "ab") as org_file:
+        offset = org_file.tell()
+        org_file.write(data)
+    return offset
+
+
+def check(steps, seed):
+    """Return the list of problems found."""
+    generator = random.Random(seed)
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "inbox.org")
+        open(path, "wb").close()
+        HeadlineIndex(path).update()
+        for step in range(steps):
+            kind = generator.random()
+            data = get_text(generator)
+            if kind < 0.5:
+                # A capture
+                HeadlineIndex(path).extend(append(path, data), data)
+            elif kind < 0.8:
+                # Another program; seen by the next update
+                append(path, data)
+            else:
+                with open(path, "rb") as org_file:
+                    content = org_file.read()
+                position = generator.randint(0, len(content))
+                if kind < 0.85:
+                    # Same size: TODO to DONE, a digit of a date
+                    content = content.replace(b"TODO", b"DONE", 1) \
+                        if generator.random() < 0.5 else \
+                        content[:position] + content[position:].replace(
+                            b"2026", b"2027", 1)
+                elif kind < 0.9:
+                    content = content[:position] + data + content[position:]
+                else:
+                    content = content[:position]
+                with open(path, "wb") as org_file:
+                    org_file.write(content)
+            if generator.random() < 0.3:
+                found = get_headlines(path)
+                expected = rebuild(path)
+                if found != expected:
+                    problems.append("step %s: %s headlines instead of %s" %
+                                    (step, len(found[0]), len(expected[0])))
+                    # Go on from a correct index
+                    continue
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    problems = check(args.steps, args.seed)
+    for problem in problems[:20]:
+        print(problem)
+    print("%s steps: %s" % (args.steps, "FAILED" if problems else "OK"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
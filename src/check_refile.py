@@ -0,0 +1,135 @@
+# python version 3.8
+# UTF-8 encoding
+"""Check refiled entries and the headline index against rebuilt indexes.
+
+Entries are refiled at random under existing, nested and missing headings,
+by copying the file or by moving its tail in place, while other text is
+appended to the file. After each refile the index must have the headlines
+of an index built from scratch, and the entry must be the last child of
+its heading, with its subtree one level below it.
+
+    python check_refile.py --steps 500 --seed 1
+
+Exits with status 1 if an index or an entry is wrong.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_index import HeadlineIndex  # noqa: E402
+from org_mode_refile import Refiler  # noqa: E402
+
+headings = ["Inbox", "Projects", "Projects/Website", "Projects/Website/Blog",
+            "Work/Alpha", "Someday", "Reading/Books/2026"]
+start = ("#+TITLE: Tasks\n* Inbox\n* Projects :work:\n** Website\n"
+         "   Text of the website\n* Reading\n")
+appends = ["\n* Someday", "\n** TODO [#A] Review", "\nSome text",
+           "\n* Projects", "\n   DEADLINE: <2026-10-20 Tue>"]
+tags_pattern = re.compile(r'[ \t]+:\S+:$')
+
+
+def get_entry(random, number):
+    """Return an entry with a random level and maybe a child."""
+    level = "*" * random.randint(1, 3)
+    entry = "\n%s TODO entry %s\n   body of %s" % (level, number, number)
+    if random.random() < 0.5:
+        entry += "\n%s* child %s" % (level, number)
+    return entry
+
+
+def get_headlines(path):
+    index = HeadlineIndex(path).update()
+    return index.headlines, index.last_offset
+
+
+def rebuild(path):
+    index = HeadlineIndex(path)
+    os.remove(index.index_file)
+    return get_headlines(path)
+
+
+def get_title(headline):
+    return tags_pattern.sub("", headline.title)
+
+
+def check_entry(headlines, heading, number):
+    """Return a problem with the position of entry number, or None."""
+    titles = [title for title in heading.split("/") if title]
+    positions = [i for i, headline in enumerate(headlines)
+                 if get_title(headline) == "entry %s" % number]
+    if len(positions) != 1:
+        return "entry %s found %s times" % (number, len(positions))
+    i = positions[0]
+    level = headlines[i].level
+    # The ancestors, the parent first
+    ancestors = []
+    for headline in reversed(headlines[:i]):
+        if headline.level < level:
+            ancestors.append(headline)
+            level = headline.level
+    if not ancestors or get_title(ancestors[0]) != titles[-1] or \
+            headlines[i].level != ancestors[0].level + 1:
+        return "entry %s is not a child of %s" % (number, titles[-1])
+    path = iter(reversed([get_title(headline) for headline in ancestors]))
+    if not all(title in path for title in titles):
+        return "entry %s is not below %s" % (number, heading)
+    end = i + 1
+    while end < len(headlines) and headlines[end].level > headlines[i].level:
+        end += 1
+    if end < len(headlines) and headlines[end].level > ancestors[0].level:
+        return "entry %s is not the last child of %s" % (number, titles[-1])
+    return None
+
+
+def check(steps, seed):
+    """Return the list of problems found."""
+    generator = random.Random(seed)
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tasks.org")
+        with open(path, "w") as org_file:
+            org_file.write(start)
+        for step in range(steps):
+            if generator.random() < 0.2:
+                # Another program; seen by the next refile
+                with open(path, "a") as org_file:
+                    org_file.write(generator.choice(appends))
+            heading = generator.choice(headings)
+            refiler = Refiler(path, heading,
+                              shift_in_place=generator.random() < 0.5)
+            refiler.insert(get_entry(generator, step))
+            found = get_headlines(path)
+            expected = rebuild(path)
+            if found != expected:
+                differs = [i for i, (headline, other) in enumerate(
+                    zip(found[0], expected[0])) if headline != other]
+                problems.append("step %s: the index differs from a rebuilt "
+                                "one from headline %s on" % (step, min(
+                                    differs or [len(found[0])])))
+            problem = check_entry(expected[0], heading, step)
+            if problem is not None:
+                problems.append("step %s: %s" % (step, problem))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    problems = check(args.steps, args.seed)
+    for problem in problems[:20]:
+        print(problem)
+    print("%s steps: %s" % (args.steps, "FAILED" if problems else "OK"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
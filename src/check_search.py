@@ -0,0 +1,139 @@
+# python version 3.8
+# UTF-8 encoding
+"""Check the updates of the search index against rebuilt indexes.
+
+An org file is changed at random: captures appended with extend(), text
+appended by other programs (also in the middle of a word), edits before
+the end (also ones that keep the size) and truncations picked up by
+update(). After each step the index, its log included, must have the
+headlines, terms and search results of an index built from scratch.
+
+    python check_search.py --steps 1000 --seed 1
+
+Exits with status 1 if an index differs.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_search import SearchIndex  # noqa: E402
+
+words = ["alpha", "beta", "gamma", "über", "straße", "report", "call", "bob",
+         "x1", "42", "kappa", "theta", "<2026-10-18 Sun>", ":PROPERTIES:",
+         ":END:"]
+
+
+def get_text(random):
+    """Return random org text, starting with a headline or not."""
+    parts = []
+    for number in range(random.randint(1, 3)):
+        if random.random() < 0.8:
+            parts.append("\n%s " % ("*" * random.randint(1, 3)))
+        else:
+            parts.append("\n")
+        parts.append(" ".join(random.choice(words)
+                              for _ in range(random.randint(0, 5))))
+    text = "".join(parts)
+    if random.random() < 0.3:
+        # Continues the last line of the file, maybe a word of it
+        text = text[1:] if random.random() < 0.5 else random.choice(words)
+    return text.encode("utf-8")
+
+
+def get_state(index):
+    """Return the headlines and the postings of an index."""
+    count = index.get_count()
+    terms = index.get_prefixed("")
+    postings = {}
+    for term, number in terms.items():
+        numbers = list(index.get_postings(term, number))
+        if numbers:
+            postings[term] = numbers
+    return ([index.get_offset(number) for number in range(count)],
+            [index.get_line(number) for number in range(count)],
+            postings, index.state[:5])
+
+
+def rebuild(path):
+    index = SearchIndex(path)
+    for name in [index.index_file, index.log_file]:
+        if os.path.exists(name):
+            os.remove(name)
+    return index.update()
+
+
+def append(path, data):
+    with open(path, "ab") as org_file:
+        offset = org_file.tell()
+        org_file.write(data)
+    return offset
+
+
+def check(steps, seed, log_size):
+    """Return the list of problems found."""
+    generator = random.Random(seed)
+    SearchIndex.log_size = log_size
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "inbox.org")
+        open(path, "wb").close()
+        SearchIndex(path).update()
+        for step in range(steps):
+            kind = generator.random()
+            data = get_text(generator)
+            if kind < 0.5:
+                # A capture
+                SearchIndex(path).extend(append(path, data), data)
+            elif kind < 0.8:
+                # Another program; seen by the next update
+                append(path, data)
+            else:
+                with open(path, "rb") as org_file:
+                    content = org_file.read()
+                position = generator.randint(0, len(content))
+                if kind < 0.85:
+                    # Same size: a word replaced by another one
+                    content = content[:position] + content[position:].replace(
+                        b"alpha", b"gamma", 1)
+                elif kind < 0.9:
+                    content = content[:position] + data + content[position:]
+                else:
+                    content = content[:position]
+                with open(path, "wb") as org_file:
+                    org_file.write(content)
+            if generator.random() < 0.3:
+                found = SearchIndex(path).update()
+                state = get_state(found)
+                query = generator.choice(words)[:generator.randint(1, 4)]
+                results = found.search(query)
+                expected = rebuild(path)
+                if state != get_state(expected) or \
+                        results != expected.search(query):
+                    problems.append("step %s: the index differs from a "
+                                    "rebuilt one" % step)
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    problems = []
+    # With a log that is merged often and one that is not
+    for log_size in [300, SearchIndex.log_size]:
+        problems.extend(check(args.steps, args.seed, log_size))
+    for problem in problems[:20]:
+        print(problem)
+    print("%s steps: %s" % (args.steps, "FAILED" if problems else "OK"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# python version 3.8
+# UTF-8 encoding
+"""Check that rotated inbox files are read through their shards.
+
+Entries with deadlines are added to an inbox file that is rolled over to
+shards every few entries (plain and gzipped); afterwards the shards must
+hold every entry exactly once, and the agenda and the search must find
+each of them.
+
+    python check_shards.py --entries 200 --rotate-size 2000
+
+Exits with status 1 if an entry is missing or duplicated.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_agenda import get_agenda  # noqa: E402
+from org_mode_entry import OrgmodeEntry  # noqa: E402
+from org_mode_rotate import InboxRotator, get_shards, open_shard  # noqa: E402
+from org_mode_search import search  # noqa: E402
+
+now = datetime.datetime(2026, 10, 1, 9, 0)
+
+
+def get_entry(number):
+    return "TODO Entry%s report:: DL: in %s days  Zeile mit Umlauten äöü" % (
+        number, number % 60)
+
+
+def add_entries(path, entries, rotate_size, compress):
+    org = OrgmodeEntry()
+    org.inbox_file = path
+    org.now = now
+    org.index_headlines = True
+    org.index_search = True
+    org.writer.rotator = InboxRotator(max_size=rotate_size, compress=compress)
+    for number in range(entries):
+        org.add_entry(get_entry(number))
+
+
+def check(path, entries):
+    """Return the list of problems found in the shards of path."""
+    problems = []
+    shards = get_shards(path)
+    if len(shards) < 2:
+        problems.append("the file was not rotated")
+
+    # Every entry in exactly one shard
+    found = {}
+    for shard in shards:
+        with open_shard(shard) as shard_file:
+            for line in shard_file:
+                if line.startswith("* "):
+                    heading = line.split()[2]
+                    found[heading] = found.get(heading, 0) + 1
+    for number in range(entries):
+        count = found.get("Entry%s" % number, 0)
+        if count != 1:
+            problems.append("Entry%s is %s times in the shards" %
+                            (number, count))
+
+    # Every deadline in the agenda (the overdue ones included), with and
+    # without the headline index
+    today = now.date() + datetime.timedelta(days=30)
+    for indexed in [(), {path}]:
+        items = get_agenda([path], today, 30, indexed=indexed)
+        titles = [item.title.split()[0] for item in items]
+        if sorted(titles) != sorted("Entry%s" % number
+                                    for number in range(entries)):
+            problems.append("%s agenda items instead of %s" %
+                            (len(titles), entries))
+
+    # Every entry found by the search, the latest first
+    results = search([path], "report", limit=entries + 1)
+    headings = [heading.split()[2] for shard, line, heading in results]
+    expected = ["Entry%s" % number for number in reversed(range(entries))]
+    if headings != expected:
+        problems.append("search found %s entries instead of %s" %
+                        (len(headings), entries))
+    for number in [0, entries // 2, entries - 1]:
+        results = search([path], "entry%s report" % number)
+        if [heading.split()[2] for shard, line, heading in results] != \
+                ["Entry%s" % number]:
+            problems.append("search did not find Entry%s" % number)
+    for shard, line, heading in search([path], "entry0 report"):
+        with open_shard(shard) as shard_file:
+            lines = shard_file.read().split("\n")
+        if lines[line - 1] != heading:
+            problems.append("wrong line %s of Entry0 in %s" % (line, shard))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--rotate-size", type=int, default=2000,
+                        help="bytes per shard")
+    args = parser.parse_args(argv)
+
+    problems = []
+    for compress in [False, True]:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "inbox.org")
+            add_entries(path, args.entries, args.rotate_size, compress)
+            problems.extend("%s%s" % ("gzip: " if compress else "", problem)
+                            for problem in check(path, args.entries))
+
+    for problem in problems[:20]:
+        print(problem)
+    print("%s entries in shards of %s bytes: %s" %
+          (args.entries, args.rotate_size, "FAILED" if problems else "OK"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
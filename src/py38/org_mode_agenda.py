@@ -0,0 +1,287 @@
+# python version 3.8
+# UTF-8 encoding
+"""Agenda of the inbox files for an Alfred Script Filter.
+
+    python org_mode_agenda.py "{query}"
+
+lists the open headlines with a DEADLINE or SCHEDULED date in the next
+agenda_days days (workflow variable, default 7) and the overdue ones, from
+todos_inbox, notes_inbox, inspirations_inbox and their targets. A query
+starting with a number sets the days ("30 report"); the other words filter
+the titles.
+
+The headlines of the files with index_headlines are read from their
+headline index (see org_mode_index), which scans only the changed end of a
+file; other files are scanned completely. The shards the files were rotated
+to (see org_mode_rotate) are read as well. The dated headlines of each file
+are kept in the file agenda_cache of the workflow's data directory, so an
+unchanged file is not read at all.
+"""
+import datetime
+import os
+import sys
+from collections import namedtuple
+
+AgendaItem = namedtuple("AgendaItem", [
+    "date", "kind", "timestamp", "todo", "priority", "title", "path"
+])
+
+# Headlines in these states are not listed
+done_keywords = ["DONE", "CANCELLED"]
+
+# Workflow variables of the listed files
+inbox_variables = ["todos_inbox", "notes_inbox", "inspirations_inbox"]
+
+
+def get_agenda_files(environ=None):
+    """Return the inbox files of the actions and of their targets."""
+    from org_mode_config import get_targets
+
+    environ = os.environ if environ is None else environ
+    paths = []
+    for name in inbox_variables:
+        candidates = [environ.get(name)]
+        candidates.extend(path for path, options in get_targets(
+            environ, name.replace("_inbox", "_targets")))
+        for path in candidates:
+            if path and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def get_indexed_files(environ=None):
+    """Return the set of the inbox files and targets with index_headlines."""
+    from org_mode_config import get_boolean, get_targets, target_options
+
+    environ = os.environ if environ is None else environ
+    default = get_boolean(environ, "index_headlines")
+    option = target_options.index("index_headlines")
+    paths = set()
+    for name in inbox_variables:
+        if default and environ.get(name):
+            paths.add(environ.get(name))
+        for path, options in get_targets(
+                environ, name.replace("_inbox", "_targets")):
+            if default if options[option] is None else options[option]:
+                paths.add(path)
+    return paths
+
+
+class Agenda(object):
+    """Dated headlines of org files, cached by the state of each file.
+
+    The headline index is used for the files in indexed (and their shards);
+    it is not created for the others.
+    """
+    def __init__(self, cache_file=None, indexed=()):
+        self.cache_file = cache_file
+        self.indexed = indexed
+        # path => [size, mtime, inode, number of headlines, items]; an item
+        # is (headline number, date, kind, timestamp, todo, priority, title)
+        self.files = {}
+        self.changed = False
+
+    def load(self):
+        import marshal
+
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file, "rb") as cache_file:
+                files = marshal.loads(cache_file.read())
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            return
+        if isinstance(files, dict):
+            self.files = files
+
+    def save(self):
+        import marshal
+
+        if self.cache_file is None or not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        temporary_file = "%s.%s.tmp" % (self.cache_file, os.getpid())
+        with open(temporary_file, "wb") as cache_file:
+            marshal.dump(self.files, cache_file)
+        os.replace(temporary_file, self.cache_file)
+        self.changed = False
+
+    def get_items(self, paths, today, days):
+        """Return the AgendaItems of paths up to days after today, by date.
+
+        Overdue items are included. The shards of paths (see
+        org_mode_rotate) are read as well, except those with dates after end
+        only.
+        """
+        from org_mode_rotate import get_shards
+
+        end = (today + datetime.timedelta(days=days)).isoformat()
+        items = []
+        for path in paths:
+            indexed = path in self.indexed
+            for shard in get_shards(path, last_date=end):
+                for item in self.get_file_items(shard, indexed):
+                    if item[1] <= end:
+                        items.append(AgendaItem(*item[1:], path=shard))
+        self.save()
+        # Deadlines first, then by priority
+        items.sort(key=lambda item: (item.date, item.kind != "deadline",
+                                     item.priority or "~", item.title))
+        return items
+
+    def get_file_items(self, path, indexed=False):
+        """Return the dated open headlines of path (from the cache if it did not change).
+
+        With indexed the headlines are read from the headline index of path.
+        """
+        from org_mode_index import HeadlineIndex
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if self.files.pop(path, None) is not None:
+                self.changed = True
+            return []
+        cached = self.files.get(path)
+        state = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        if cached is not None and cached[:3] == state:
+            return cached[4]
+        if indexed and not path.endswith(".gz"):
+            index = HeadlineIndex(path).update()
+            records = index.records
+            # The index may have seen a newer state of the file
+            state = [index.size, index.mtime, index.inode]
+        else:
+            # Scanned completely (compressed shards have no headline index)
+            records = self.read_records(path)
+        items = self.get_record_items(records)
+        self.files[path] = state + [len(records), items]
+        self.changed = True
+        return items
+
+    @staticmethod
+    def read_records(path):
+        """Return the headline index records of an org file or a compressed shard, without an index."""
+        from org_mode_index import HeadlineIndex
+        from org_mode_rotate import open_shard
+
+        with open_shard(path, "rb") as shard:
+            data = shard.read()
+        return HeadlineIndex.format_records(HeadlineIndex(path).scan(data), 0)
+
+    @staticmethod
+    def get_record_items(records):
+        """Return the items of the index records."""
+        items = []
+        for number in range(len(records)):
+            (delta, level, todo, priority, created, deadline, scheduled,
+             title) = records[number].split("\t", 7)
+            if not deadline and not scheduled or todo in done_keywords:
+                continue
+            for kind, timestamp in [("deadline", deadline),
+                                    ("scheduled", scheduled)]:
+                if timestamp:
+                    items.append((number, timestamp[:10], kind, timestamp,
+                                  todo or None, priority or None, title))
+        return items
+
+
+def get_agenda(paths, today=None, days=7, cache_file=None, indexed=()):
+    """Return the AgendaItems of the org files paths (see Agenda.get_items).
+
+    The headline index is used for the paths in indexed.
+    """
+    if today is None:
+        today = datetime.date.today()
+    agenda = Agenda(cache_file, indexed)
+    agenda.load()
+    return agenda.get_items(paths, today, days)
+
+
+def format_when(item, today):
+    """Return e.g. "Deadline today", "Scheduled in 3 days" or "Deadline 2 days ago"."""
+    try:
+        date = datetime.date(int(item.date[:4]), int(item.date[5:7]),
+                             int(item.date[8:10]))
+    except ValueError:
+        return "%s %s" % (item.kind.capitalize(), item.timestamp)
+    delta = (date - today).days
+    if delta == 0:
+        when = "today"
+    elif delta == 1:
+        when = "tomorrow"
+    elif delta > 1:
+        when = "in %s days" % delta
+    elif delta == -1:
+        when = "yesterday"
+    else:
+        when = "%s days ago" % -delta
+    return "%s %s" % (item.kind.capitalize(), when)
+
+
+def format_agenda(items, today, query=""):
+    """Return the Alfred JSON of the items whose titles contain every word of query."""
+    import json
+
+    words = query.lower().split()
+    result = []
+    for item in items:
+        title = item.title
+        if item.priority:
+            title = "[#%s] %s" % (item.priority, title)
+        if item.todo:
+            title = "%s %s" % (item.todo, title)
+        if not all(word in title.lower() for word in words):
+            continue
+        result.append({
+            "title": title,
+            "subtitle": "%s  <%s>  %s" % (format_when(item, today),
+                                          item.timestamp,
+                                          os.path.basename(item.path)),
+            "arg": item.path,
+            "text": {"copy": title, "largetype": title}
+        })
+    if not result:
+        result.append({"title": "Nothing due", "valid": False})
+    return json.dumps({"items": result}, ensure_ascii=False)
+
+
+def format_error(error):
+    """Return the Alfred JSON of an invalid workflow variable."""
+    import json
+
+    return json.dumps({"items": [{"title": "Invalid agenda settings",
+                                  "subtitle": str(error), "valid": False}]},
+                      ensure_ascii=False)
+
+
+def main(argv=None):
+    from org_mode_config import ConfigError, get_number
+
+    argv = sys.argv[1:] if argv is None else argv
+    query = " ".join(argv).strip()
+    try:
+        days = get_number(os.environ, "agenda_days", int, minimum=0)
+        indexed = get_indexed_files()
+    except ConfigError as error:
+        # Shown in Alfred instead of a traceback
+        print(format_error(error))
+        return 0
+    if days is None:
+        days = 7
+    number, space, rest = query.partition(" ")
+    if number.isdigit():
+        days, query = int(number), rest
+
+    data_directory = os.environ.get("alfred_workflow_data")
+    cache_file = None
+    if data_directory:
+        cache_file = os.path.join(data_directory, "agenda_cache")
+    today = datetime.date.today()
+    items = get_agenda(get_agenda_files(), today, days, cache_file, indexed)
+    print(format_agenda(items, today, query))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,78 +1,99 @@
 import os
+import sys
 
-from org_mode_entry import OrgmodeEntry
+from org_mode_config import create_entry, load_config
 
 
-def convert_boolean(string):
-    if string == "1":
-        return True
-    else:
-        return False
+def run(entry, action):
+    org = configure(action)
+    return capture(org, entry, os.getenv("stats_file"))
 
 
-def run(entry, action):
-    org = OrgmodeEntry()
-
-    if action == "note":
-        # Entries are added to the following orgmode file (use an absolute path):
-        org.inbox_file = os.getenv("notes_inbox")
-        # heading level of entry
-        org.heading_suffix = "\n%s " % ("*" *
-                                        int(os.getenv("notes_heading_level")))
-    elif action == "inspiration":
-        # Entries are added to the following orgmode file (use an absolute path):
-        org.inbox_file = os.getenv("inspirations_inbox")
-        # heading level of entry
-        org.heading_suffix = "\n%s " % (
-            "*" * int(os.getenv("inspirations_heading_level")))
-    else:
-        # Entry is a todo
-        # Entries are added to the following orgmode file (use an absolute path):
-        org.inbox_file = os.getenv("todos_inbox")
-        # heading level of entry
-        org.heading_suffix = "\n%s " % ("*" *
-                                        int(os.getenv("todos_heading_level")))
-
-    # tag to separate the head from the body of the entry
-    org.delimiter = str(os.getenv("delimiter"))
-
-    # use priority tags: #b => [#B]
-    org.use_priority_tags = convert_boolean(os.getenv("use_priority_tags"))
-    # tag that marks a priority value
-    # Default: #
-    org.priority_tag = str(os.getenv("priority_tag"))
-
-    # add a creation date
-    org.add_creation_date = convert_boolean(os.getenv("add_creation_date"))
-
-    # convert absolute dates like 01.10 15:00 into orgmode dates => <2016-10-01 Sun 15:00>
-    org.replace_absolute_dates = convert_boolean(
-        os.getenv("replace_absolute_dates"))
-
-    # convert relative dates like monday or tomorrow into orgmode dates
-    org.replace_relative_dates = convert_boolean(
-        os.getenv("replace_relative_dates"))
-
-    # Convert a schedule pattern into an org scheduled date
-    # Default: "S: "
-    org.convert_scheduled = convert_boolean(os.getenv("convert_scheduled"))
-    org.scheduled_pattern = str(os.getenv("scheduled_pattern"))
-
-    # Convert a deadline pattern into an org deadline
-    # Default: "DL: "
-    org.convert_deadlines = convert_boolean(os.getenv("convert_deadlines"))
-    org.deadline_pattern = str(os.getenv("deadline_pattern"))
-
-    # convert a pattern into a linebreak
-    org.smart_line_break = convert_boolean(os.getenv("smart_line_break"))
-    # two spaces
-    # Default: "\s\s"
-    org.line_break_pattern = os.getenv("line_break_pattern")
-
-    # Cleanup spaces (double, leading, and trailing)
-    org.cleanup_spaces = convert_boolean(os.getenv("cleanup_spaces"))
-
-    entry = 'TODO ' + entry
-    message = org.add_entry(entry)
+def capture(org, entry, stats_file=None):
+    """Add an entry with a configured OrgmodeEntry.
+
+    With stats_file (workflow variable) the formatting stages and the write
+    are recorded and added to the stats in that file.
+    """
+    if stats_file:
+        from org_mode_stats import FormatStats
+
+        org.stats = FormatStats()
+    try:
+        entry = 'TODO ' + entry
+        message = org.add_entry(entry)
+
+        if org.spool is not None:
+            # Write the entry to inbox_file in the background
+            org.spool.start_flusher()
+
+        if stats_file:
+            org.stats.dump(stats_file)
+    finally:
+        # The daemon keeps org for the next captures
+        org.stats = None
 
     return message
+
+
+def run_batch(entries, action):
+    """Add an iterable of entries with one grouped append and return a summary."""
+    org = configure(action)
+
+    # File name => error of the targets that failed
+    failures = {}
+    messages = org.add_entries(('TODO ' + entry for entry in entries),
+                               failures=failures)
+    if org.spool is not None:
+        org.spool.flush()
+
+    # The targets get the entries as well (see add_entries_to_targets)
+    filenames = [target.get_filename() for target in [org] + org.targets
+                 if target.get_filename() not in failures]
+    lines = ["Added %s entries to %s." % (len(messages), ", ".join(filenames))]
+    for filename, error in failures.items():
+        lines.append("Failed to add the entries to %s: %s" % (filename, error))
+    return "\n".join(lines)
+
+
+def read_entries(stream, separator="\n", size=1 << 16):
+    """Yield the non-empty entries of a text stream split at separator."""
+    rest = ""
+    for chunk in iter(lambda: stream.read(size), ""):
+        items = (rest + chunk).split(separator)
+        rest = items.pop()
+        for item in items:
+            if item:
+                yield item
+    if rest:
+        yield rest
+
+
+def configure(action, environ=None):
+    """Set up an OrgmodeEntry for an action from the workflow variables.
+
+    The variables are read from environ (default: os.environ); they are
+    checked and parsed only once per combination (see org_mode_config).
+    Invalid variables raise org_mode_config.ConfigError.
+    """
+    return create_entry(load_config(action, environ))
+
+
+def main(argv=None):
+    import argparse
+
+    # Batch capture: entries are read from stdin
+    parser = argparse.ArgumentParser(
+        description="Add the entries read from stdin to an org-mode file.")
+    parser.add_argument("action", choices=["todo", "note", "inspiration"])
+    parser.add_argument("-0", "--null", action="store_true",
+                        help="entries are separated by NUL instead of line breaks")
+    args = parser.parse_args(argv)
+
+    separator = "\0" if args.null else "\n"
+    message = run_batch(read_entries(sys.stdin, separator), args.action)
+    print(message)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+# python version 3.8
+# UTF-8 encoding
+"""Validated and cached capture settings.
+
+load_config reads the workflow variables of an action once, checks them
+and derives everything the capture needs besides the input (the vocabulary
+tables of the date matcher, the sizes, the paths) into an immutable
+CaptureConfig. The configurations are cached by the values of the variables,
+in this process and in the file config_cache of the workflow's data
+directory, so a capture with unchanged settings skips the checks and the
+setup. create_entry turns a configuration into an OrgmodeEntry.
+"""
+import os
+from collections import namedtuple
+
+# Workflow variables the configurations depend on
+variables = [
+    "notes_inbox", "notes_heading_level", "inspirations_inbox",
+    "inspirations_heading_level", "todos_inbox", "todos_heading_level",
+    "delimiter", "use_priority_tags", "priority_tag", "add_creation_date",
+    "replace_absolute_dates", "replace_relative_dates", "convert_scheduled",
+    "scheduled_pattern", "convert_deadlines", "deadline_pattern",
+    "smart_line_break", "line_break_pattern", "cleanup_spaces",
+    "spool_directory", "index_headlines", "duplicate_window",
+    "keep_duplicates", "alfred_workflow_data", "notes_refile_heading",
+    "inspirations_refile_heading", "todos_refile_heading", "notes_datetree",
+    "inspirations_datetree", "todos_datetree", "rotate_size", "rotate_period",
+    "compress_shards", "date_locales", "notes_targets", "inspirations_targets",
+    "todos_targets", "index_search", "notes_template", "inspirations_template",
+    "todos_template"
+]
+
+# Workflow variable prefix of the actions
+prefixes = {"note": "notes", "inspiration": "inspirations", "todo": "todos"}
+
+CaptureConfig = namedtuple("CaptureConfig", [
+    "action", "inbox_file", "heading_level", "refile_heading", "datetree",
+    "delimiter", "use_priority_tags", "priority_tag", "add_creation_date",
+    "replace_absolute_dates", "replace_relative_dates", "date_locales",
+    "date_cache", "date_tables", "convert_scheduled", "scheduled_pattern",
+    "convert_deadlines", "deadline_pattern", "smart_line_break",
+    "line_break_pattern", "cleanup_spaces", "index_headlines", "index_search",
+    "recent_entries_file", "duplicate_window", "skip_duplicates",
+    "rotate_size", "rotate_period", "compress_shards", "spool_directory",
+    "targets", "template"
+])
+
+# Options a target can set for itself (see get_targets)
+target_options = ["heading_level", "refile_heading", "datetree",
+                  "add_creation_date", "use_priority_tags", "index_headlines"]
+
+# Configurations kept in the cache file
+cache_size = 16
+# Parsed configurations of this process: key => CaptureConfig
+configs = {}
+
+
+class ConfigError(ValueError):
+    """A workflow variable is missing or invalid."""
+
+
+def load_config(action, environ=None):
+    """Return the CaptureConfig of an action (cached) from the workflow variables.
+
+    The variables are read from environ (default: os.environ).
+    """
+    environ = os.environ if environ is None else environ
+    key = get_key(action, environ)
+    config = configs.get(key)
+    if config is not None:
+        return config
+
+    cache_file = get_cache_file(environ)
+    cache = load_cache(cache_file) if cache_file else {}
+    if key in cache:
+        config = CaptureConfig(*cache[key])
+    else:
+        config = build_config(action, environ)
+        if cache_file:
+            cache[key] = tuple(config)
+            save_cache(cache_file, cache)
+    configs[key] = config
+    return config
+
+
+def get_key(action, environ):
+    """Return the key of the action, the workflow variables and the code they are parsed with.
+
+    The key is hashed by the dicts of the caches; hashlib would take longer
+    to import than a cache lookup takes.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    items = [action]
+    items.extend("%s=%s" % (name, environ.get(name)) for name in variables)
+    for name in ["org_mode_config.py", "org_mode_dates.py",
+                 "org_mode_locales.py"]:
+        try:
+            items.append(str(os.stat(os.path.join(directory, name)).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+    return "\0".join(items)
+
+
+def get_cache_file(environ):
+    data_directory = environ.get("alfred_workflow_data")
+    if not data_directory:
+        return None
+    return os.path.join(data_directory, "config_cache")
+
+
+def load_cache(path):
+    import marshal
+
+    try:
+        with open(path, "rb") as cache_file:
+            cache = marshal.loads(cache_file.read())
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_cache(path, cache):
+    import marshal
+
+    # Keep the newest configurations
+    cache = dict(list(cache.items())[-cache_size:])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_file = "%s.%s.tmp" % (path, os.getpid())
+    with open(temporary_file, "wb") as cache_file:
+        marshal.dump(cache, cache_file)
+    os.replace(temporary_file, path)
+
+
+def build_config(action, environ):
+    """Check the workflow variables of an action and derive its CaptureConfig."""
+    from org_mode_entry import OrgmodeEntry
+
+    if action not in prefixes:
+        raise ConfigError("Unknown action: %s (use one of %s)" %
+                          (action, ", ".join(sorted(prefixes))))
+    getenv = environ.get
+    prefix = prefixes[action]
+    # Defaults of the optional variables
+    defaults = OrgmodeEntry()
+
+    # Entries are added to the following orgmode file (use an absolute path)
+    inbox_file = getenv("%s_inbox" % prefix)
+    if not inbox_file:
+        raise ConfigError("Workflow variable %s_inbox is not set (the org "
+                          "file the %ss are added to)" % (prefix, action))
+    # heading level of entry
+    heading_level = get_number(environ, "%s_heading_level" % prefix, int,
+                               minimum=1, required=True)
+    # file the entries into a datetree: "created", "deadline" or "scheduled"
+    datetree = check_datetree("%s_datetree" % prefix,
+                              getenv("%s_datetree" % prefix) or None)
+    # layout of the entries (see org_mode_template)
+    template = getenv("%s_template" % prefix) or None
+    if template is not None:
+        check_template("%s_template" % prefix, template)
+
+    # Convert a schedule pattern into an org scheduled date and a deadline
+    # pattern into an org deadline; the patterns are regular expressions
+    convert_scheduled = get_boolean(environ, "convert_scheduled")
+    scheduled_pattern = getenv("scheduled_pattern") or defaults.scheduled_pattern
+    convert_deadlines = get_boolean(environ, "convert_deadlines")
+    deadline_pattern = getenv("deadline_pattern") or defaults.deadline_pattern
+    # convert a pattern (two spaces) into a linebreak
+    smart_line_break = get_boolean(environ, "smart_line_break")
+    line_break_pattern = getenv("line_break_pattern") or \
+        defaults.line_break_pattern
+    for name, pattern, enabled in [
+            ("scheduled_pattern", scheduled_pattern, convert_scheduled),
+            ("deadline_pattern", deadline_pattern, convert_deadlines),
+            ("line_break_pattern", line_break_pattern, smart_line_break)]:
+        if enabled:
+            check_pattern(name, pattern)
+
+    # Languages of the date expressions, e.g. "en,de,fr"
+    date_locales = defaults.date_locales
+    if getenv("date_locales"):
+        date_locales = tuple(code.strip().lower()
+                             for code in getenv("date_locales").split(",")
+                             if code.strip())
+    replace_absolute_dates = get_boolean(environ, "replace_absolute_dates")
+    replace_relative_dates = get_boolean(environ, "replace_relative_dates")
+    date_tables = None
+    if replace_absolute_dates or replace_relative_dates:
+        from org_mode_dates import DateMatcher
+
+        try:
+            date_tables = DateMatcher(locales=date_locales).get_tables()
+        except ValueError as error:
+            raise ConfigError("Workflow variable date_locales: %s" % error)
+
+    # Data of the workflow: the resolved dates of the day and the recent
+    # entries
+    data_directory = getenv("alfred_workflow_data")
+    date_cache = None
+    if data_directory:
+        date_cache = os.path.join(data_directory, "date_table")
+
+    # Skip entries that were captured within duplicate_window seconds before
+    # (e.g. by a double-fired hotkey)
+    duplicate_window = get_number(environ, "duplicate_window", float,
+                                  minimum=0) or None
+    recent_entries_file = None
+    if duplicate_window:
+        recent_entries_file = os.path.join(
+            data_directory or os.path.expanduser("~/.org-mode-capture"),
+            "recent_entries")
+
+    # Roll the inbox file over to a shard when it grows larger than
+    # rotate_size MB or was started in an earlier rotate_period
+    rotate_size = get_number(environ, "rotate_size", float, minimum=0)
+    if rotate_size:
+        rotate_size = int(rotate_size * (1 << 20))
+    rotate_period = getenv("rotate_period") or None
+    if rotate_period is not None:
+        from org_mode_rotate import period_formats
+
+        if rotate_period not in period_formats:
+            raise ConfigError("Workflow variable rotate_period must be one of "
+                              "%s, not %r" % (", ".join(sorted(period_formats)),
+                                              rotate_period))
+
+    # Commit entries to a local journal and write them to the inbox files in
+    # the background (for inbox files on slow or synced volumes)
+    spool_directory = getenv("spool_directory") or None
+    # Add the entries to these org files as well
+    targets = get_targets(environ, "%s_targets" % prefix)
+    refile_heading = getenv("%s_refile_heading" % prefix) or None
+    if spool_directory is not None:
+        # The journal only appends; refiled entries are inserted
+        refiled = [inbox_file] if refile_heading or datetree else []
+        for path, options in targets:
+            values = dict(zip(target_options, options))
+            for option, value in [("refile_heading", refile_heading),
+                                  ("datetree", datetree)]:
+                if values[option] is not None:
+                    value = values[option]
+                if value and path not in refiled:
+                    refiled.append(path)
+        if refiled:
+            raise ConfigError("Workflow variable spool_directory cannot be "
+                              "used with refile_heading or datetree (%s)" %
+                              ", ".join(refiled))
+
+    return CaptureConfig(
+        action=action,
+        inbox_file=inbox_file,
+        heading_level=heading_level,
+        # heading to insert the entries under (instead of appending them)
+        refile_heading=refile_heading,
+        datetree=datetree,
+        # tag to separate the head from the body of the entry
+        delimiter=getenv("delimiter") or defaults.delimiter,
+        # use priority tags: #b => [#B]
+        use_priority_tags=get_boolean(environ, "use_priority_tags"),
+        priority_tag=getenv("priority_tag") or defaults.priority_tag,
+        add_creation_date=get_boolean(environ, "add_creation_date"),
+        replace_absolute_dates=replace_absolute_dates,
+        replace_relative_dates=replace_relative_dates,
+        date_locales=date_locales,
+        date_cache=date_cache,
+        date_tables=date_tables,
+        convert_scheduled=convert_scheduled,
+        scheduled_pattern=scheduled_pattern,
+        convert_deadlines=convert_deadlines,
+        deadline_pattern=deadline_pattern,
+        smart_line_break=smart_line_break,
+        line_break_pattern=line_break_pattern,
+        # Cleanup spaces (double, leading, and trailing)
+        cleanup_spaces=get_boolean(environ, "cleanup_spaces"),
+        # Keep a headline index next to the inbox file
+        index_headlines=get_boolean(environ, "index_headlines"),
+        # Keep a search index next to the inbox file
+        index_search=get_boolean(environ, "index_search"),
+        recent_entries_file=recent_entries_file,
+        duplicate_window=duplicate_window,
+        skip_duplicates=not get_boolean(environ, "keep_duplicates"),
+        rotate_size=rotate_size or None,
+        rotate_period=rotate_period,
+        compress_shards=get_boolean(environ, "compress_shards"),
+        spool_directory=spool_directory,
+        targets=targets,
+        template=template
+    )
+
+
+def get_targets(environ, name):
+    """Return the other org files of an action, one line per file.
+
+    A line is the path followed by options that differ from the action's,
+    separated by "|":
+
+        ~/org/projects.org | heading_level=2 | refile_heading=Website
+
+    Returns a tuple of (path, options) with options a tuple of the values of
+    target_options, None for the action's value.
+    """
+    targets = []
+    for line in (environ.get(name) or "").split("\n"):
+        fields = [field.strip() for field in line.split("|")]
+        if not fields[0]:
+            continue
+        options = dict.fromkeys(target_options)
+        for field in fields[1:]:
+            option, equals, value = field.partition("=")
+            option = option.strip()
+            if option not in options or not equals:
+                raise ConfigError("Workflow variable %s: unknown option %r of "
+                                  "%s (use %s)" % (name, field, fields[0],
+                                                   ", ".join(target_options)))
+            value = value.strip()
+            label = "%s option %s" % (name, option)
+            if option == "heading_level":
+                value = get_number({label: value}, label, int, minimum=1,
+                                   required=True)
+            elif option == "datetree":
+                value = check_datetree(label, value or None)
+            elif option in ["add_creation_date", "use_priority_tags",
+                            "index_headlines"]:
+                value = get_boolean({label: value}, label)
+            options[option] = value
+        targets.append((os.path.expanduser(fields[0]), tuple(options[option]
+                                         for option in target_options)))
+    return tuple(targets)
+
+
+def check_datetree(name, datetree):
+    if datetree not in [None, "created", "deadline", "scheduled"]:
+        raise ConfigError("Workflow variable %s must be created, deadline or "
+                          "scheduled, not %r" % (name, datetree))
+    return datetree
+
+
+def get_boolean(environ, name):
+    """Return a checkbox variable ("1" or "0"; unset is False)."""
+    value = environ.get(name)
+    if value in [None, "", "0"]:
+        return False
+    if value == "1":
+        return True
+    raise ConfigError("Workflow variable %s must be 0 or 1, not %r" %
+                      (name, value))
+
+
+def get_number(environ, name, kind, minimum=None, required=False):
+    """Return a number variable (None if it is unset and not required)."""
+    value = environ.get(name)
+    if value is None or value == "":
+        if required:
+            raise ConfigError("Workflow variable %s is not set" % name)
+        return None
+    try:
+        number = kind(value)
+    except ValueError:
+        raise ConfigError("Workflow variable %s must be a number, not %r" %
+                          (name, value))
+    if minimum is not None and number < minimum:
+        raise ConfigError("Workflow variable %s must be at least %s, not %r" %
+                          (name, minimum, value))
+    return number
+
+
+def check_pattern(name, pattern):
+    import re
+
+    try:
+        re.compile(pattern)
+    except re.error as error:
+        raise ConfigError("Workflow variable %s is no valid regular "
+                          "expression (%s): %r" % (name, error, pattern))
+
+
+def check_template(name, template):
+    from org_mode_template import TemplateError, get_template
+
+    try:
+        get_template(template)
+    except TemplateError as error:
+        raise ConfigError("Workflow variable %s: %s" % (name, error))
+
+
+def create_entry(config):
+    """Return an OrgmodeEntry set up with a CaptureConfig."""
+    from org_mode_entry import OrgmodeEntry
+
+    org = OrgmodeEntry()
+    org.inbox_file = config.inbox_file
+    org.heading_suffix = "\n%s " % ("*" * config.heading_level)
+    org.refile_heading = config.refile_heading
+    org.datetree = config.datetree
+    org.delimiter = config.delimiter
+    org.use_priority_tags = config.use_priority_tags
+    org.priority_tag = config.priority_tag
+    org.add_creation_date = config.add_creation_date
+    org.replace_absolute_dates = config.replace_absolute_dates
+    org.replace_relative_dates = config.replace_relative_dates
+    org.date_locales = config.date_locales
+    org.date_cache = config.date_cache
+    org.date_tables = config.date_tables
+    org.convert_scheduled = config.convert_scheduled
+    org.scheduled_pattern = config.scheduled_pattern
+    org.convert_deadlines = config.convert_deadlines
+    org.deadline_pattern = config.deadline_pattern
+    org.smart_line_break = config.smart_line_break
+    org.line_break_pattern = config.line_break_pattern
+    org.cleanup_spaces = config.cleanup_spaces
+    org.index_headlines = config.index_headlines
+    org.index_search = config.index_search
+    if config.template is not None:
+        from org_mode_template import get_template
+
+        org.template = get_template(config.template)
+
+    if config.recent_entries_file is not None:
+        from org_mode_recent import RecentEntries
+
+        org.recent_entries = RecentEntries(config.recent_entries_file,
+                                           config.duplicate_window)
+        org.skip_duplicates = config.skip_duplicates
+
+    if config.rotate_size is not None or config.rotate_period is not None:
+        from org_mode_rotate import InboxRotator
+
+        org.writer.rotator = InboxRotator(config.rotate_size,
+                                          config.rotate_period,
+                                          config.compress_shards)
+
+    if config.spool_directory is not None:
+        from org_mode_spool import CaptureSpool
+
+        org.spool = CaptureSpool(config.spool_directory)
+        org.spool.writer.rotator = org.writer.rotator
+
+    for path, options in config.targets:
+        # The action's configuration with the options of the target
+        values = {option: value
+                  for option, value in zip(target_options, options)
+                  if value is not None}
+        org.targets.append(create_entry(config._replace(
+            inbox_file=path, targets=(), **values)))
+    return org
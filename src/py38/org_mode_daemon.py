@@ -0,0 +1,182 @@
+# python version 3.8
+# UTF-8 encoding
+"""Optional capture daemon.
+
+The daemon keeps configured OrgmodeEntry instances (with their compiled
+patterns) in memory and serves capture requests over a Unix domain socket:
+
+    python org_mode_daemon.py serve
+
+Alfred scripts call capture() instead of org_mode_capture_run.run(); it
+falls back to an in-process capture if no daemon is running or it does not
+answer in time:
+
+    from org_mode_daemon import capture
+    print(capture('''{query}''', "todo"))
+
+Script Filters call org_mode_preview.preview() the same way; the daemon
+formats the preview without adding the entry.
+
+Only the client part is imported on every capture, so this module must not
+import org_mode_entry at module level. The client uses the C modules _socket
+and marshal because socket and json take longer to import than a capture
+takes in the daemon.
+"""
+import _socket
+import marshal
+import os
+import sys
+
+
+def get_socket_path(environ=None):
+    """Return the socket path (workflow variable daemon_socket or a per-user default)."""
+    environ = os.environ if environ is None else environ
+    path = environ.get("daemon_socket")
+    if not path:
+        name = "org-mode-capture-%s.sock" % os.getuid()
+        path = os.path.join(environ.get("TMPDIR") or "/tmp", name)
+    return path
+
+
+def capture(entry, action, path=None, timeout=5.0):
+    """Add an entry through the daemon or, if it is not running, in-process.
+
+    A daemon that does not answer within timeout seconds is treated as not
+    running as well.
+    """
+    if path is None:
+        path = get_socket_path()
+    request = {"entry": entry, "action": action, "environ": dict(os.environ)}
+
+    try:
+        response = send(path, request, timeout)
+    except OSError:
+        # No daemon, or a hung one (the timeout is an OSError as well)
+        from org_mode_capture_run import run
+        return run(entry, action)
+
+    if "error" in response:
+        raise RuntimeError("Capture daemon: %s" % response["error"])
+    return response["message"]
+
+
+def send(path, request, timeout=5.0):
+    """Send one request to the daemon and return its response."""
+    client = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(marshal.dumps(request))
+        client.shutdown(_socket.SHUT_WR)
+        response = b"".join(iter(lambda: client.recv(1 << 16), b""))
+    finally:
+        client.close()
+    return marshal.loads(response)
+
+
+class CaptureDaemon(object):
+    """Serve capture requests with warm OrgmodeEntry instances."""
+    def __init__(self, path):
+        self.path = path
+        # action => (configuration key, OrgmodeEntry)
+        self.configs = {}
+        # action => InboxWriter; the inbox files stay open between captures.
+        # One per action, as each has its own rotation settings.
+        self.writers = {}
+
+    def get_entry(self, action, environ):
+        """Return the OrgmodeEntry of an action; reload it if the configuration changed."""
+        from org_mode_capture_run import configure
+        from org_mode_config import variables
+
+        key = tuple(environ.get(name) for name in variables)
+        config = self.configs.get(action)
+        if config is None or config[0] != key:
+            from org_mode_writer import InboxWriter
+
+            config = (key, configure(action, environ))
+            writer = self.writers.get(action)
+            if writer is None:
+                writer = self.writers[action] = InboxWriter(keep_open=True)
+            writer.rotator = config[1].writer.rotator
+            config[1].writer = writer
+            self.configs[action] = config
+        return config[1]
+
+    def handle(self, request):
+        from org_mode_capture_run import capture as add_entry
+
+        try:
+            org = self.get_entry(request["action"], request["environ"])
+            if request.get("preview"):
+                from org_mode_preview import format_preview
+
+                return {"message": format_preview(org, request["entry"])}
+            return {"message": add_entry(org, request["entry"],
+                                         request["environ"].get("stats_file"))}
+        except Exception as error:
+            return {"error": "%s: %s" % (type(error).__name__, error)}
+
+    def serve(self):
+        import socket
+
+        # Import the formatter once, before the first request
+        import org_mode_capture_run  # noqa: F401
+        import org_mode_writer  # noqa: F401
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.path)
+            os.chmod(self.path, 0o600)
+            server.listen(16)
+            while True:
+                connection, address = server.accept()
+                with connection:
+                    self.serve_connection(connection)
+        finally:
+            server.close()
+            for writer in self.writers.values():
+                writer.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def serve_connection(self, connection):
+        request = b"".join(iter(lambda: connection.recv(1 << 16), b""))
+        try:
+            response = self.handle(marshal.loads(request))
+        except (EOFError, ValueError, TypeError) as error:
+            response = {"error": "Invalid request: %s" % error}
+        connection.sendall(marshal.dumps(response))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="org-mode capture daemon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="run the daemon")
+    serve.add_argument("--socket", help="path of the Unix domain socket")
+    add = subparsers.add_parser("capture", help="add an entry")
+    add.add_argument("action", choices=["todo", "note", "inspiration"])
+    add.add_argument("entry")
+    add.add_argument("--socket", help="path of the Unix domain socket")
+    args = parser.parse_args(argv)
+
+    path = args.socket or get_socket_path()
+    if args.command == "serve":
+        import signal
+
+        # Remove the socket on termination as well
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            CaptureDaemon(path).serve()
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(capture(args.entry, args.action, path))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,630 @@
+# python version 3.8
+# UTF-8 encoding
+import _thread
+import datetime
+import marshal
+import os
+import re
+
+from org_mode_locales import locale_packs
+
+# Tokens of a text; existing org timestamps are single tokens so that they
+# are never converted again
+token_pattern = re.compile(r'''
+    (?P<timestamp>[<\[]\d{4}-\d{2}-\d{2}[^>\]\n]*[>\]])
+  | (?P<iso>\d{4}-\d{2}-\d{2}(?![\d-]))
+  | (?P<date>\d{1,2}\.\d{1,2}\.(?:\d{4})?(?!\d)|\d{1,2}\.\d{1,2}(?![\d.]))
+  | (?P<time>\d{1,2}:\d{2}(?:-\d{1,2}:\d{2})?(?![\d:]))
+  | (?P<shift>(?:\.\+|\+\+|[+-])\d+[dwmy](?![^\W_]))
+  | (?P<number>\d+)
+  | (?P<word>[^\W\d_]+)
+''', re.VERBOSE)
+word_char = re.compile(r'\w')
+# Between the words of a phrase: spaces, a hyphen (après-demain) or an
+# apostrophe (aujourd'hui)
+separators = ["-", "'", "’"]
+
+# Token sequences and their meaning; <...> is a class of tokens. The
+# phrases of the locale packs (multi-word relative dates, end of month) are
+# added to them.
+phrases = [
+    (["<relative>"], "relative"),
+    (["<weekday>"], "weekday"),
+    (["<next>", "<weekday>"], "weekday"),
+    (["<weekday>", "<next_after>"], "weekday"),
+    (["<next>", "<unit>"], "next_unit"),
+    (["<unit>", "<next_after>"], "next_unit"),
+    (["<in>", "<number>", "<unit>"], "in_units"),
+    (["<shift>"], "shift"),
+    (["<date>"], "date"),
+    (["<iso>"], "iso"),
+]
+# Token classes whose tokens are passed to the resolve methods
+value_classes = ["<relative>", "<weekday>", "<unit>", "<number>", "<shift>",
+                 "<date>", "<iso>"]
+# Phrases that are absolute dates (replace_absolute_dates)
+absolute_actions = ["date", "iso"]
+
+
+class DateMatcher(object):
+    """Find and convert date expressions into org timestamps.
+
+    Supported expressions (with the locale packs of org_mode_locales, e.g.
+    English and German):
+        today, morgen, übermorgen, day after tomorrow, friday, next friday,
+        fri 14:00, next week, in 3 days, in 2 wochen, +2w, -1d,
+        end of month, monatsende, 01.10, 01.10.2026, 2026-10-01
+    followed by an optional time or time range (14:00, at 10:00-11:30) and
+    an optional repeater (+1w, ++1m, .+1d). weekdays and relative_dates
+    add words to the packs.
+
+    The phrases of all packs are compiled once into one trie over tokens,
+    and every word of the packs is mapped to its token classes, so a token
+    costs the same with any number of packs. A text is split into tokens
+    with a single regular expression and the trie is only entered at tokens
+    that can start a phrase. The dates are looked up in the DateTable of
+    the day, which is cached in cache_file if given.
+    """
+    # Attributes derived from the locale packs (see get_tables)
+    table_names = [
+        "weekdays", "abbreviations", "relative_dates", "units", "end_phrases",
+        "words", "time_words", "trie", "time_prefixes", "word_edges",
+        "max_tokens", "start_kinds", "start_words"
+    ]
+
+    def __init__(self, weekdays=None, relative_dates=None,
+                 date_format="<%s-%s-%s %s>", cache_file=None,
+                 locales=("en", "de"), tables=None):
+        self.locales = tuple(locales)
+        self.date_format = date_format
+        self.cache_file = cache_file
+        self.table = None
+        # (options, string, tokens, matches) of the last find
+        self.previous = None
+
+        vocabulary = self.get_vocabulary_key(weekdays, relative_dates)
+        if tables is not None and tables.get("vocabulary") == vocabulary:
+            # Derived before, e.g. by a cached configuration
+            for name in self.table_names:
+                setattr(self, name, tables[name])
+        else:
+            self.build(weekdays, relative_dates)
+
+    def get_vocabulary_key(self, weekdays, relative_dates):
+        return (self.locales, tuple(sorted((weekdays or {}).items())),
+                tuple(sorted((relative_dates or {}).items())))
+
+    def get_tables(self, weekdays=None, relative_dates=None):
+        """Return the derived attributes for a later instance (marshal can store them)."""
+        tables = dict((name, getattr(self, name)) for name in self.table_names)
+        tables["vocabulary"] = self.get_vocabulary_key(weekdays, relative_dates)
+        return tables
+
+    def build(self, weekdays, relative_dates):
+        """Merge the locale packs and compile the phrases."""
+        # The merged vocabulary
+        self.weekdays = {}
+        self.abbreviations = {}
+        self.relative_dates = {}
+        self.units = {}
+        self.end_phrases = {}
+        self.words = {"<next>": set(), "<next_after>": set(), "<in>": set()}
+        self.time_words = set()
+        for code in self.locales:
+            try:
+                pack = locale_packs[code]
+            except KeyError:
+                raise ValueError("Unknown date locale: %s (use one of %s)" %
+                                 (code, ", ".join(sorted(locale_packs))))
+            self.weekdays.update(pack.get("weekdays", {}))
+            self.abbreviations.update(pack.get("abbreviations", {}))
+            self.relative_dates.update(pack.get("relative", {}))
+            self.units.update(pack.get("units", {}))
+            self.end_phrases.update(pack.get("end", {}))
+            for name in ["next", "next_after", "in"]:
+                self.words["<%s>" % name].update(pack.get(name, []))
+            self.time_words.update(pack.get("at", []))
+        self.weekdays.update((word.lower(), weekday)
+                             for word, weekday in (weekdays or {}).items())
+        self.relative_dates.update((word.lower(), delta)
+                                   for word, delta in (relative_dates or {}).items())
+
+        self.trie = self.compile(self.get_phrases())
+        # Time words ("at", "a las") as tuples of tokens
+        self.time_prefixes = self.compile(
+            [(self.split(words), "at") for words in self.time_words])
+        # Word => the trie edges it can follow, the literal first
+        self.word_edges = {}
+        for edge in ["<relative>", "<weekday>", "<next>", "<next_after>",
+                     "<in>", "<unit>"]:
+            for word in self.get_vocabulary(edge):
+                self.word_edges.setdefault(word, [word]).append(edge)
+
+        # Tokens an expression can span (phrase, time words, time, repeater)
+        self.max_tokens = max(len(tokens) for tokens, action, fixed in
+                              self.get_phrases()) + \
+            max([len(self.split(words)) for words in self.time_words] or [0]) + 2
+
+        # Tokens that can start a phrase
+        self.start_kinds = set(kind for kind in ["shift", "date", "iso"]
+                               if "<%s>" % kind in self.trie)
+        self.start_words = set(edge for edge in self.trie
+                               if not edge.startswith("<"))
+        for edge in self.trie:
+            if edge is not None and edge.startswith("<") and \
+                    edge[1:-1] not in self.start_kinds:
+                self.start_words.update(self.get_vocabulary(edge) or [])
+
+    def get_phrases(self):
+        """Return the phrases as (tokens, action, fixed values)."""
+        result = []
+        for tokens, action in phrases:
+            result.append((tokens, action, []))
+            # Words of several tokens ("dentro de") as literal tokens
+            for edge, words in self.words.items():
+                if edge not in tokens:
+                    continue
+                for word in words:
+                    split = self.split(word)
+                    if len(split) > 1:
+                        position = tokens.index(edge)
+                        result.append((tokens[:position] + split +
+                                       tokens[position + 1:], action, []))
+        for word, delta in self.relative_dates.items():
+            tokens = self.split(word)
+            if len(tokens) > 1:
+                result.append((tokens, "relative", [word]))
+        for words, action in self.end_phrases.items():
+            result.append((self.split(words), action, []))
+        return result
+
+    @staticmethod
+    def split(words):
+        """Return the tokens of a phrase of a locale pack."""
+        return [match.group().lower() for match in token_pattern.finditer(words)]
+
+    @staticmethod
+    def compile(phrases):
+        """Return the trie of the phrases: {token or class: node, None: (action, values)}."""
+        trie = {}
+        for phrase in phrases:
+            tokens, action = phrase[0], phrase[1]
+            node = trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = (action, list(phrase[2]) if len(phrase) > 2 else [])
+        return trie
+
+    def get_signature(self):
+        """Return everything besides the day the timestamps depend on."""
+        return (self.date_format, self.locales,
+                tuple(sorted(self.weekdays.items())),
+                tuple(sorted(self.relative_dates.items())))
+
+    def get_vocabulary(self, edge):
+        """Return the tokens of a class of tokens, None if there are too many."""
+        if edge == "<relative>":
+            return [word for word in self.relative_dates
+                    if len(self.split(word)) == 1]
+        if edge == "<weekday>":
+            return list(self.weekdays) + list(self.abbreviations)
+        if edge in self.words:
+            return [word for word in self.words[edge]
+                    if len(self.split(word)) == 1]
+        if edge == "<unit>":
+            return list(self.units)
+        if edge == "<number>":
+            return [str(number) for number in range(1, DateTable.max_number + 1)]
+        if edge == "<date>":
+            return ["%s.%s" % (day, month)
+                    for month in range(1, 13) for day in range(1, 32)]
+        if edge.startswith("<"):
+            return None
+        return [edge]
+
+    def get_table(self, today):
+        """Return the DateTable of a day (from cache_file, else built and saved)."""
+        table = self.table
+        if table is None or table.today != today:
+            table = DateTable(self, today)
+            # Without a cache file the dates are resolved on first use
+            if self.cache_file is not None and not table.load(self.cache_file):
+                table.build()
+                table.save(self.cache_file)
+            # Set when it is complete, for the other threads
+            self.table = table
+        return table
+
+    def get_edges(self, kind, text):
+        """Return the trie edges a token can follow, the literal first."""
+        if kind == "word":
+            return self.word_edges.get(text) or [text]
+        return ["<%s>" % kind]
+
+    # Matching
+    def tokenize(self, string, position=0):
+        return [(match.lastgroup, match.group().lower(), match.start(),
+                 match.end()) for match in token_pattern.finditer(string, position)]
+
+    def find(self, string, today=None, absolute=True, relative=True):
+        """Return (start, end, timestamp) of the date expressions in string.
+
+        The tokens and matches of the previous string are reused up to
+        shortly before the first difference, so a string that is typed
+        character by character (a live preview) is not scanned again.
+        """
+        if today is None:
+            today = datetime.date.today()
+        table = self.get_table(today)
+        options = (today.toordinal(), absolute, relative)
+        tokens, matches, i = self.resume(string, options)
+        start_kinds, start_words = self.start_kinds, self.start_words
+        while i < len(tokens):
+            kind, text = tokens[i][0], tokens[i][1]
+            if kind not in start_kinds and text not in start_words:
+                i += 1
+                continue
+            result = self.match(string, tokens, i, table, absolute, relative)
+            if result is None:
+                i += 1
+                continue
+            end, timestamp = result
+            matches.append((tokens[i][2], tokens[end - 1][3], timestamp))
+            i = end
+        self.previous = (options, string, tokens, matches)
+        return matches
+
+    def resume(self, string, options):
+        """Return the tokens, the matches and the token to continue a find with."""
+        previous = self.previous
+        if previous is None or previous[0] != options:
+            return self.tokenize(string), [], 0
+        old_string, old_tokens, old_matches = previous[1:]
+        if old_string == string:
+            return old_tokens, list(old_matches), len(old_tokens)
+
+        # Tokens that end before the first difference (their lookahead
+        # included), less those an expression there could continue with
+        same = get_common_prefix(old_string, string)
+        i = 0
+        while i < len(old_tokens) and old_tokens[i][3] < same:
+            i += 1
+        i = max(0, i - self.max_tokens)
+        position = old_tokens[i][2] if i < len(old_tokens) else same
+        matches = []
+        for match in old_matches:
+            if match[1] > position:
+                # Scan again from the start of a match that is cut
+                position = min(position, match[0])
+                break
+            matches.append(match)
+        while i > 0 and old_tokens[i - 1][3] > position:
+            i -= 1
+        tokens = old_tokens[:i] + self.tokenize(string, position if i else 0)
+        return tokens, matches, i
+
+    def match(self, string, tokens, i, table, absolute=True, relative=True):
+        """Return (index after the expression, timestamp) of an expression at token i."""
+        start = tokens[i][2]
+        if start > 0 and word_char.match(string, start - 1):
+            return None
+        best = self.walk(string, tokens, i, self.trie, [])
+        if best is None:
+            return None
+        end, (action, fixed), values = best
+        values = fixed + values
+        if (action in absolute_actions and not absolute) or \
+                (action not in absolute_actions and not relative):
+            return None
+        timestamp = table.get(action, values)
+        if timestamp is None:
+            return None
+
+        # Optional time and repeater
+        time, repeater = None, None
+        j = end
+        if j < len(tokens) and tokens[j][1] in self.time_prefixes:
+            # "at 10:00"
+            prefix = self.walk(string, tokens, j, self.time_prefixes, [], 1)
+            if prefix is not None and prefix[0] < len(tokens) and \
+                    tokens[prefix[0]][0] == "time":
+                j = prefix[0]
+        if j < len(tokens) and tokens[j][0] == "time" and \
+                self.is_separated(string, tokens, j):
+            time = self.get_time(tokens[j][1])
+            if time is not None:
+                end = j + 1
+        if end < len(tokens) and tokens[end][0] == "shift" and \
+                tokens[end][1][0] != "-" and \
+                self.is_separated(string, tokens, end):
+            repeater = tokens[end][1]
+            end += 1
+
+        if end - i == 1 and action == "weekday" and \
+                values[0] not in self.weekdays:
+            # A bare abbreviation is rather a word ("sat", "sun")
+            return None
+        position = tokens[end - 1][3]
+        if position < len(string) and word_char.match(string, position):
+            return None
+        return end, self.add_time(timestamp, time, repeater)
+
+    def walk(self, string, tokens, i, node, values, depth=0):
+        """Return the longest phrase from token i on as (end, action, values)."""
+        best = None
+        if None in node:
+            best = (i, node[None], values)
+        if i >= len(tokens) or (depth and not self.is_separated(string, tokens, i)):
+            return best
+        kind, text = tokens[i][0], tokens[i][1]
+        for edge in self.get_edges(kind, text):
+            child = node.get(edge)
+            if child is None:
+                continue
+            # Keep the values of the token classes
+            captured = values + [text] if edge in value_classes else values
+            result = self.walk(string, tokens, i + 1, child, captured, depth + 1)
+            if result is not None and (best is None or result[0] > best[0]):
+                best = result
+        return best
+
+    @staticmethod
+    def is_separated(string, tokens, i):
+        """Check that only a separator of words separates token i from the one before."""
+        gap = string[tokens[i - 1][3]:tokens[i][2]]
+        return gap.isspace() or gap in separators
+
+    def replace(self, string, today=None, absolute=True, relative=True):
+        """Return string with all date expressions replaced and their number."""
+        parts = []
+        position = 0
+        count = 0
+        for start, end, timestamp in self.find(string, today, absolute,
+                                               relative):
+            parts.append(string[position:start])
+            parts.append(timestamp)
+            position = end
+            count += 1
+        if not count:
+            return string, 0
+        parts.append(string[position:])
+        return ''.join(parts), count
+
+    def parse(self, string, today=None):
+        """Return the timestamp of a string that is one date expression, else None."""
+        if today is None:
+            today = datetime.date.today()
+        string = string.strip()
+        tokens = self.tokenize(string)
+        if not tokens:
+            return None
+        result = self.match(string, tokens, 0, self.get_table(today))
+        if result is None or result[0] != len(tokens):
+            return None
+        return result[1]
+
+    # Resolving dates
+    def resolve_relative(self, today, word):
+        return today + datetime.timedelta(days=self.relative_dates[word])
+
+    def resolve_weekday(self, today, word):
+        # The next one, a week ahead on the same weekday
+        delta = (self.get_weekday(word) - today.weekday()) % 7 or 7
+        return today + datetime.timedelta(days=delta)
+
+    def resolve_next_unit(self, today, unit):
+        return self.add(today, 1, self.units[unit])
+
+    def resolve_in_units(self, today, number, unit):
+        return self.add(today, int(number), self.units[unit])
+
+    def resolve_shift(self, today, shift):
+        if not shift[0] in "+-" or shift[1] == "+":
+            # Repeaters (.+1d, ++1w) are no dates
+            return None
+        return self.add(today, int(shift[:-1]), shift[-1])
+
+    @staticmethod
+    def resolve_end_of_week(today):
+        return today + datetime.timedelta(days=6 - today.weekday())
+
+    def resolve_end_of_month(self, today):
+        return self.add(today.replace(day=1), 1, "m") - datetime.timedelta(days=1)
+
+    @staticmethod
+    def resolve_end_of_year(today):
+        return today.replace(month=12, day=31)
+
+    def resolve_date(self, today, text):
+        items = text.split(".")
+        day, month = int(items[0]), int(items[1])
+        try:
+            if len(items) == 3 and items[2]:
+                return datetime.date(int(items[2]), month, day)
+            # Without year: its next occurrence
+            date = datetime.date(today.year, month, day)
+        except ValueError:
+            if (day, month) != (29, 2):
+                return None
+            date = None
+        if date is None or date <= today:
+            try:
+                date = datetime.date(today.year + 1, month, day)
+            except ValueError:
+                # 29.02 of a year before a common year
+                return None
+        return date
+
+    @staticmethod
+    def resolve_iso(today, text):
+        try:
+            return datetime.date(*[int(item) for item in text.split("-")])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def add(date, number, unit):
+        """Add days, weeks, months or years (d, w, m, y) to a date."""
+        if unit == "d":
+            return date + datetime.timedelta(days=number)
+        if unit == "w":
+            return date + datetime.timedelta(weeks=number)
+        if unit == "m":
+            month = date.month - 1 + number
+            year, month = date.year + month // 12, month % 12 + 1
+        else:
+            year, month = date.year + number, date.month
+        # The last day of a shorter month
+        for day in range(date.day, date.day - 4, -1):
+            try:
+                return date.replace(year=year, month=month, day=day)
+            except ValueError:
+                continue
+        return None
+
+    def get_weekday(self, word):
+        return self.weekdays.get(word, self.abbreviations.get(word))
+
+    @staticmethod
+    def get_time(text):
+        """Normalize 9:00 and 9:00-10:30 to HH:MM; return None if invalid."""
+        times = []
+        for item in text.split("-"):
+            hours, minutes = item.split(":")
+            if int(hours) > 23 or int(minutes) > 59:
+                return None
+            times.append("%02d:%s" % (int(hours), minutes))
+        return "-".join(times)
+
+    def format_timestamp(self, date, time=None, repeater=None):
+        return self.add_time(self.format_date(date), time, repeater)
+
+    def format_date(self, date):
+        items = date.strftime("%Y %m %d %a").split(" ")
+        return self.date_format % tuple(items)
+
+    @staticmethod
+    def add_time(timestamp, time=None, repeater=None):
+        """Add a time and a repeater inside the brackets of a timestamp."""
+        extra = "".join(" " + item for item in (time, repeater) if item)
+        if not extra:
+            return timestamp
+        if timestamp[-1:] in ">]":
+            return timestamp[:-1] + extra + timestamp[-1]
+        return timestamp + extra
+
+
+def get_common_prefix(a, b):
+    """Return the length of the common prefix of two strings."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class DateTable(object):
+    """The org timestamps of the date phrases of one day.
+
+    The phrases made of a limited vocabulary (today, next friday, in 3 days,
+    end of month, 01.10, ...) are resolved once when the table is built,
+    all others (+10d, 01.10.2027, 2027-01-01) on first use. As the table
+    only changes at midnight it is cached in a file for the next captures
+    (see DateMatcher.get_table).
+    """
+    max_number = 31  # "in 1 day" to "in 31 years" are built
+
+    def __init__(self, matcher, today):
+        self.matcher = matcher
+        self.today = today
+        # Key (see get_key) => timestamp (None: no valid date)
+        self.timestamps = {}
+
+    def get_key(self, action, values):
+        """Return the key of a phrase; phrases of the same date share it."""
+        matcher = self.matcher
+        if action == "relative":
+            values = [str(matcher.relative_dates[values[0]])]
+        elif action == "weekday":
+            values = [str(matcher.get_weekday(values[0]))]
+        elif action == "next_unit":
+            values = [matcher.units[values[0]]]
+        elif action == "in_units":
+            values = [str(int(values[0])), matcher.units[values[1]]]
+        elif action == "date":
+            # 01.10 and 1.10. are the same date
+            values = [".".join(str(int(item))
+                               for item in values[0].split(".") if item)]
+        return "\t".join([action] + list(values))
+
+    def get(self, action, values):
+        """Return the timestamp of a phrase (None if it is no valid date)."""
+        key = self.get_key(action, values)
+        try:
+            return self.timestamps[key]
+        except KeyError:
+            timestamp = self.resolve(action, values)
+            self.timestamps[key] = timestamp
+            return timestamp
+
+    def resolve(self, action, values):
+        matcher = self.matcher
+        date = getattr(matcher, "resolve_%s" % action)(self.today, *values)
+        return None if date is None else matcher.format_date(date)
+
+    def build(self):
+        """Resolve all phrases whose token classes have a vocabulary."""
+        for tokens, action, fixed in self.matcher.get_phrases():
+            choices = []
+            for token in tokens:
+                if token not in value_classes:
+                    continue
+                vocabulary = self.matcher.get_vocabulary(token)
+                if vocabulary is None:
+                    break
+                choices.append(vocabulary)
+            else:
+                for values in self.get_combinations(choices):
+                    self.get(action, fixed + values)
+
+    @staticmethod
+    def get_combinations(choices):
+        combinations = [[]]
+        for vocabulary in choices:
+            combinations = [values + [value] for values in combinations
+                            for value in vocabulary]
+        return combinations
+
+    def load(self, path):
+        """Load the table from a cache file; return False if it is outdated."""
+        try:
+            with open(path, "rb") as cache_file:
+                # loads is faster than reading the file in small pieces
+                cache = marshal.loads(cache_file.read())
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            return False
+        if not isinstance(cache, dict) or \
+                cache.get("day") != self.today.toordinal() or \
+                cache.get("signature") != self.matcher.get_signature():
+            return False
+        self.timestamps = cache["timestamps"]
+        return True
+
+    def save(self, path):
+        cache = {
+            "day": self.today.toordinal(),
+            "signature": self.matcher.get_signature(),
+            "timestamps": self.timestamps
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Threads of a process may save at once
+        temporary_file = "%s.%s.%s.tmp" % (path, os.getpid(),
+                                           _thread.get_ident())
+        with open(temporary_file, "wb") as cache_file:
+            marshal.dump(cache, cache_file)
+        os.replace(temporary_file, path)
@@ -0,0 +1,150 @@
+# python version 3.8
+# UTF-8 encoding
+import bisect
+import marshal
+import os
+import re
+
+from org_mode_refile import Refiler
+
+# Datetree headings: "2026", "2026-10 October" and "2026-10-18 Sunday"
+node_patterns = [
+    re.compile(r'(\d{4})(?:[ \t]|$)'),
+    re.compile(r'(\d{4}-\d{2})(?:[ \t]|$)'),
+    re.compile(r'(\d{4}-\d{2}-\d{2})(?:[ \t]|$)')
+]
+record_pattern = re.compile(r'^\d+\t(\d+)\t(?:[^\t\n]*\t){5}([^\n]*)$',
+                            re.MULTILINE)
+
+
+class DatetreeRefiler(Refiler):
+    """Insert entries into the day node of an org datetree.
+
+    The year, month and day headings (* 2026 / ** 2026-10 October /
+    *** 2026-10-18 Sunday) are created on demand in date order; level is
+    the level of the year headings. The datetree nodes are kept in a sorted
+    list of keys ("2026", "2026-10", "2026-10-18") and offsets, so a day is
+    found by binary search. The list is cached next to the file
+    (.<name>.datetree) and rebuilt from the headline index only if the file
+    was changed otherwise.
+    """
+    def __init__(self, path, date, level=1, shift_in_place=False):
+        super(DatetreeRefiler, self).__init__(path, "", shift_in_place)
+        self.date = date
+        self.level = level
+        directory, name = os.path.split(os.path.abspath(path))
+        self.cache_file = os.path.join(directory, ".%s.datetree" % name)
+        self.keys = []
+        self.offsets = []
+
+    def get_titles(self):
+        date = self.date
+        return [
+            date.strftime("%Y"),
+            date.strftime("%Y-%m %B"),
+            date.strftime("%Y-%m-%d %A")
+        ]
+
+    def get_keys(self):
+        date = self.date
+        return [
+            date.strftime("%Y"),
+            date.strftime("%Y-%m"),
+            date.strftime("%Y-%m-%d")
+        ]
+
+    def insert(self, string):
+        offset, data = super(DatetreeRefiler, self).insert(string)
+        self.add_nodes(offset, data)
+        return offset, data
+
+    def find_target(self):
+        """Return (level, insertion offset, missing titles) of the day node."""
+        self.load_nodes()
+        keys, offsets = self.keys, self.offsets
+        level, end = self.level - 1, None
+        titles = self.get_titles()
+        parent = ""
+        for depth, key in enumerate(self.get_keys()):
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                level = self.level + depth
+                end = self.get_node_end(offsets[i], level)
+                parent = key + "-"
+                continue
+            # Before the next node of the same parent (in date order)
+            if i < len(keys) and keys[i].startswith(parent) and \
+                    keys[i].count("-") == depth and \
+                    (end is None or offsets[i] < end):
+                return level, offsets[i], titles[depth:]
+            return level, end, titles[depth:]
+        return level, end, []
+
+    def get_node_end(self, offset, level):
+        """Return the offset after the subtree of the node at offset (None: end of file)."""
+        index_offsets = self.index.offsets
+        i = bisect.bisect_left(index_offsets, offset)
+        end = self.get_subtree_end(level, i + 1, len(index_offsets))
+        return self.get_offset(end)
+
+    # The cached datetree nodes
+    def load_nodes(self):
+        """Load the nodes from the cache or build them from the headline index."""
+        index = self.index
+        state = (index.size, index.mtime, index.inode)
+        try:
+            with open(self.cache_file, "rb") as cache_file:
+                cache = marshal.load(cache_file)
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            cache = None
+        if cache is not None and cache["state"] == state and \
+                cache["level"] == self.level:
+            self.keys, self.offsets = cache["keys"], cache["offsets"]
+            return
+
+        nodes = []
+        records = record_pattern.findall(index.get_text())
+        for offset, (level, title) in zip(index.offsets, records):
+            key = self.get_node_key(int(level), title)
+            if key is not None:
+                nodes.append((key, offset))
+        nodes.sort()
+        self.keys = [key for key, offset in nodes]
+        self.offsets = [offset for key, offset in nodes]
+        self.save_nodes()
+
+    def get_node_key(self, level, title):
+        depth = level - self.level
+        if 0 <= depth < len(node_patterns):
+            match = node_patterns[depth].match(title)
+            if match is not None:
+                return match.group(1)
+        return None
+
+    def add_nodes(self, offset, data):
+        """Update the nodes for data inserted at offset."""
+        shift = len(data)
+        self.offsets = [
+            node_offset + shift if node_offset >= offset else node_offset
+            for node_offset in self.offsets
+        ]
+        for headline in self.index.scan(data, base=offset):
+            key = self.get_node_key(headline.level, headline.title)
+            if key is not None:
+                i = bisect.bisect_left(self.keys, key)
+                self.keys.insert(i, key)
+                self.offsets.insert(i, headline.offset)
+        self.save_nodes()
+
+    def save_nodes(self):
+        index = self.index
+        cache = {
+            "state": (index.size, index.mtime, index.inode),
+            "level": self.level,
+            "keys": self.keys,
+            "offsets": self.offsets
+        }
+        temporary_file = "%s.%s.tmp" % (self.cache_file, os.getpid())
+        with open(temporary_file, "wb") as cache_file:
+            marshal.dump(cache, cache_file)
+        os.replace(temporary_file, self.cache_file)
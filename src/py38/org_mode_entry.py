@@ -1,16 +1,33 @@
 # python version 3.8
 # UTF-8 encoding
-import codecs
-import datetime
+import os
 import re
-import unicodedata
+from _thread import allocate_lock
+from collections import namedtuple
+from functools import partial
+from time import perf_counter
+
+from org_mode_transform import TransformEngine
+from org_mode_writer import InboxWriter
+
+# A formatted entry (see OrgmodeEntry.format): heading and body (None: the
+# capture had none) as in the messages, the TODO keyword and the priority
+# letter of the heading (or None), the DEADLINE and SCHEDULED timestamps, the
+# time of creation if the entry has a creation date, and the text written
+# to the org file
+Entry = namedtuple("Entry", ["heading", "todo", "priority", "deadline",
+                             "scheduled", "created", "body", "text"])
+
+# TODO keyword and priority of a formatted heading (see org_mode_index)
+heading_pattern = re.compile(
+    r'(?:(TODO|NEXT|WAITING|DONE|CANCELLED)(?:\s+|$))?(?:\[#(\w)\])?')
 
 
 class OrgmodeEntry(object):
     """Convert a generic text into an org-mode heading with an optional body and add it to an orgmode file.
 
     Supported modes:
-        - convert relative dates like Thuesday, tomorrow, morgen and montag into org-mode dates
+        - convert dates like tomorrow, next friday, in 3 days, fri 14:00 and 01.10 into org-mode dates
         - add the date of creation to the heading
     """
     def __init__(self):
@@ -39,37 +56,28 @@ class OrgmodeEntry(object):
         # Replace absolute dates like 01.10 15:00 => <2016-10-01 Sun 15:00>
         self.replace_absolute_dates = True
 
-        # Replace relative dates
+        # Replace relative dates like next friday, in 3 days or +2w (see
+        # org_mode_dates)
         self.replace_relative_dates = True
         self.date_format = "<%s-%s-%s %s>"
-        self.date_format_regex = "<\d{4}-\d{2}-\d{2}\s[A-Z][a-z]{2}>"
-        self.weekdays = {
-            "montag": 0,
-            "monday": 0,
-            "dienstag": 1,
-            "tuesday": 1,
-            "mittwoch": 2,
-            "wednesday": 2,
-            "donnerstag": 3,
-            "thursday": 3,
-            "freitag": 4,
-            "friday": 4,
-            "samstag": 5,
-            "saturday": 5,
-            "sonntag": 6,
-            "sunday": 6
-        }
-        self.relative_dates = {
-            "heute": 0,
-            "today": 0,
-            "morgen": 1,
-            "tomorrow": 1
-        }
-        self.convenience_dates = []
-        for month in range(1, 13):
-            for day in range(1, 32):
-                date = "%s.%s" % (day, month)
-                self.convenience_dates.append(date)
+        self.date_format_regex = "<\d{4}-\d{2}-\d{2}\s[A-Z][a-z]{2}[^>\n]*>"
+        # File that keeps the resolved dates of the day for the next
+        # captures (see org_mode_dates.DateTable)
+        self.date_cache = None
+        # Languages of the date expressions (see org_mode_locales) and words
+        # added to them, e.g. {"montags": 0} and {"sometime": 7}
+        self.date_locales = ("en", "de")
+        self.weekdays = {}
+        self.relative_dates = {}
+        # Tables of the date matcher derived before (see org_mode_config)
+        self.date_tables = None
+
+        # Time of a capture: read once from clock (a function that returns a
+        # datetime.datetime; default datetime.datetime.now) at the start of
+        # each capture and passed on, so that all its dates agree; now fixes
+        # the time of all captures (see get_now)
+        self.clock = None
+        self.now = None
 
         # Schedule and deadline keywords
         self.convert_deadlines = True
@@ -85,64 +93,437 @@ class OrgmodeEntry(object):
             "Added '%s' to %s.",  # input without body
             "Added '%s\n%s' to %s."  # input with heading and body
         ]
+        self.failure_message_format = "Failed to add '%s' to %s: %s"
+        self.duplicate_message_format = [
+            "Skipped '%s': added to %s recently.",  # duplicate was skipped
+            "Added '%s' to %s again."  # duplicate was added
+        ]
+
+        # Detect entries that were added recently, e.g. with an
+        # org_mode_recent.RecentEntries instance
+        self.recent_entries = None
+        self.skip_duplicates = True  # False: add them, only report them
+
+        # Batch capture: characters collected before each write (see add_entries)
+        self.write_chunk_size = 1 << 16
+
+        # Compiled transformations (see get_engine)
+        self.engine = None
+        self.engine_lock = allocate_lock()
+
+        # Locked appends to inbox_file (see org_mode_writer)
+        self.writer = InboxWriter()
+
+        # Keep the headline index of inbox_file (see org_mode_index) up to
+        # date with each write
+        self.index_headlines = False
+
+        # Keep the search index of inbox_file (see org_mode_search) up to
+        # date with each write
+        self.index_search = False
+
+        # Insert entries under this heading of inbox_file instead of appending
+        # them, e.g. "Inbox" or "Projects/Website" (see org_mode_refile)
+        self.refile_heading = None
+
+        # File entries into a datetree of inbox_file by the date of creation,
+        # of the deadline or of the scheduled date: "created", "deadline" or
+        # "scheduled" (see org_mode_datetree)
+        self.datetree = None
+
+        # Commit entries to a journal instead of writing inbox_file directly,
+        # e.g. an org_mode_spool.CaptureSpool instance
+        self.spool = None
+
+        # Layout of the entries, an org_mode_template.CaptureTemplate (None:
+        # the heading, the planning line, the creation date and the body)
+        self.template = None
+
+        # Add each entry to these OrgmodeEntry instances as well, e.g. with
+        # other inbox files, heading levels or options; the files are written
+        # on up to max_workers threads at once (see add_to_targets)
+        self.targets = []
+        self.max_workers = 4
+
+        # Record the formatting stages and writes, e.g. with an
+        # org_mode_stats.FormatStats instance
+        self.stats = None
 
     def encode(self, string):
         """Encode the input string into unicode."""
         # if not isinstance(string, unicode):
         #     string = unicode(string, "utf-8")
+        if string.isascii():
+            # ASCII is always normalized
+            return string
+        import unicodedata
+
         string = unicodedata.normalize('NFC', string)
         return string
 
+    def get_now(self):
+        """Return the time of a new capture (now if it is set, else the clock's time)."""
+        if self.now is not None:
+            return self.now
+        if self.clock is None:
+            import datetime
+
+            return datetime.datetime.now()
+        return self.clock()
+
     def add_entry(self, string):
+        now = self.get_now()
         string = self.encode(string)
-        entry = self.format_entry(string)
-        self.write_to_file(entry)
-        message = self.create_message()
-        return message
+        if self.targets:
+            return self.add_to_targets(string, now)
+        entry = self.format(string, now)
+        duplicate = self.is_duplicate(entry.heading, entry.body)
+        if duplicate and self.skip_duplicates:
+            return self.format_duplicate_message(entry.heading, True)
+        try:
+            self.write_to_file(entry.text, now)
+        except BaseException:
+            if not duplicate:
+                self.release_recent(entry.heading, entry.body)
+            raise
+        if duplicate:
+            return self.format_duplicate_message(entry.heading, False)
+        return self.format_message(entry.heading, entry.body)
+
+    def add_to_targets(self, string, now=None):
+        """Add an entry to inbox_file and to the inbox file of each target.
+
+        The entry is formatted for each target with its own options; the
+        writes run in parallel, the writes to the same file in order. A
+        target that fails does not stop the others: the message has one line
+        per target, failed ones included. Raises the first error if all
+        writes failed.
+        """
+        from org_mode_writer import run_parallel
+
+        if now is None:
+            now = self.get_now()
+        orgs = [self] + self.targets
+        # Index of the target => message or error
+        results = [None] * len(orgs)
+        # Index of the target => its Entry
+        entries = []
+        # Path => writes to it
+        groups = {}
+
+        def write(index, org, entry, message, duplicate):
+            try:
+                org.write_to_file(entry.text, now)
+                results[index] = message
+            except Exception as error:
+                if not duplicate:
+                    org.release_recent(entry.heading, entry.body)
+                results[index] = error
+
+        for index, org in enumerate(orgs):
+            entry = org.format(string, now)
+            entries.append(entry)
+            duplicate = org.is_duplicate(entry.heading, entry.body)
+            if duplicate and org.skip_duplicates:
+                results[index] = org.format_duplicate_message(entry.heading,
+                                                              True)
+                continue
+            if duplicate:
+                message = org.format_duplicate_message(entry.heading, False)
+            else:
+                message = org.format_message(entry.heading, entry.body)
+            path = os.path.abspath(org.inbox_file)
+            groups.setdefault(path, []).append(
+                partial(write, index, org, entry, message, duplicate))
+        run_parallel(groups.values(), self.max_workers)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and len(errors) == sum(len(group) for group in groups.values()):
+            raise errors[0]
+        lines = []
+        for org, entry, result in zip(orgs, entries, results):
+            if isinstance(result, Exception):
+                result = self.failure_message_format % (
+                    entry.heading, org.get_filename(), result)
+            lines.append(result)
+        return "\n".join(lines)
+
+    def is_duplicate(self, heading, body):
+        """Return True if the same entry was added to inbox_file recently.
+
+        Otherwise the entry is recorded at once, so that of two captures at
+        once only one passes. If it cannot be written, release_recent() drops
+        the record, so that the capture can be retried.
+        """
+        if self.recent_entries is None:
+            return False
+        return self.recent_entries.reserve(self.get_recent_key(heading, body))
+
+    def release_recent(self, heading, body):
+        """Drop the record of an entry that could not be written."""
+        if self.recent_entries is not None:
+            self.recent_entries.release(self.get_recent_key(heading, body))
+
+    def get_recent_key(self, heading, body):
+        return "%s\0%s\n%s" % (self.inbox_file, heading, body or "")
+
+    def add_entries(self, strings, now=None, failures=None):
+        """Add several entries with one write per chunk.
+
+        strings may be any iterable (e.g. a generator); the entries are
+        formatted one after another and written in chunks of about
+        write_chunk_size characters. Returns the message of each entry.
+        With targets see add_entries_to_targets.
+        """
+        if self.targets:
+            return self.add_entries_to_targets(strings, now, failures)
+        return self.add_entries_to_file(strings, now)
+
+    def add_entries_to_file(self, strings, now=None):
+        """Add several entries to inbox_file only (see add_entries)."""
+        # One time for all entries
+        if now is None:
+            now = self.get_now()
+        messages = []
+        # The entries formatted but not written yet: (heading, body) if they
+        # were recorded by is_duplicate, else None
+        unwritten = []
+
+        def entries():
+            for string in strings:
+                entry = self.format(self.encode(string), now)
+                duplicate = self.is_duplicate(entry.heading, entry.body)
+                if duplicate:
+                    messages.append(self.format_duplicate_message(
+                        entry.heading, self.skip_duplicates))
+                    if self.skip_duplicates:
+                        continue
+                else:
+                    messages.append(self.format_message(entry.heading,
+                                                        entry.body))
+                unwritten.append(None if duplicate
+                                 else (entry.heading, entry.body))
+                yield entry.text
+
+        def written(count):
+            del unwritten[:count]
+
+        try:
+            self.write_entries(entries(), now, written)
+        except BaseException:
+            # They can be captured again
+            for recorded in unwritten:
+                if recorded is not None:
+                    self.release_recent(*recorded)
+            raise
+        return messages
+
+    def add_entries_to_targets(self, strings, now=None, failures=None):
+        """Add several entries to inbox_file and to the inbox file of each target.
+
+        The strings are read in chunks of about write_chunk_size characters;
+        each chunk is added with add_entries_to_file of every target (see
+        run_targets). Returns the message of each entry, one line per
+        target, failed ones included. The file names of the targets that
+        failed and their first errors are added to the dict failures.
+        """
+        if now is None:
+            now = self.get_now()
+        orgs = [self] + self.targets
+        messages = []
+        for chunk in self.get_chunks(strings):
+            results = self.run_targets(
+                lambda org: org.add_entries_to_file(chunk, now))
+            for org, result in zip(orgs, results):
+                if isinstance(result, Exception) and failures is not None:
+                    failures.setdefault(org.get_filename(), result)
+            for number, string in enumerate(chunk):
+                lines = []
+                for org, result in zip(orgs, results):
+                    if isinstance(result, Exception):
+                        lines.append(self.failure_message_format % (
+                            string.strip(), org.get_filename(), result))
+                    else:
+                        lines.append(result[number])
+                messages.append("\n".join(lines))
+        return messages
+
+    def run_targets(self, add):
+        """Call add(org) for this instance and each target; return the results.
+
+        The calls run in parallel, those for the same file in order (like the
+        writes of add_to_targets). The result of a call that failed is its
+        exception; raises the first one if all calls failed.
+        """
+        from org_mode_writer import run_parallel
+
+        orgs = [self] + self.targets
+        results = [None] * len(orgs)
+        # Path => calls for it
+        groups = {}
+
+        def call(index, org):
+            try:
+                results[index] = add(org)
+            except Exception as error:
+                results[index] = error
+
+        for index, org in enumerate(orgs):
+            path = os.path.abspath(org.inbox_file)
+            groups.setdefault(path, []).append(partial(call, index, org))
+        run_parallel(groups.values(), self.max_workers)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(orgs):
+            raise errors[0]
+        return results
+
+    def get_chunks(self, strings):
+        """Yield lists of strings of about write_chunk_size characters."""
+        chunk, size = [], 0
+        for string in strings:
+            chunk.append(string)
+            size += len(string)
+            if size >= self.write_chunk_size:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+
+    def write_to_file(self, string, now=None):
+        if self.stats is not None:
+            start = perf_counter()
+        if self.datetree or self.refile_heading:
+            # Written at once (the spool only appends; see build_config)
+            if self.datetree:
+                from org_mode_datetree import DatetreeRefiler
+
+                refiler = DatetreeRefiler(self.inbox_file,
+                                          self.get_datetree_date(string, now))
+            else:
+                from org_mode_refile import Refiler
+
+                refiler = Refiler(self.inbox_file, self.refile_heading)
+            offset, data = refiler.insert(string)
+            if self.index_search:
+                from org_mode_search import extend_search_index
 
-    def write_to_file(self, string):
-        with codecs.open(self.inbox_file, "a", encoding='utf-8') as myfile:
-            myfile.write(string)
-        pass
+                # An insert before the end updates the index instead
+                extend_search_index(self.inbox_file, offset, data, create=True)
+        elif self.spool is not None:
+            self.spool.append(self.inbox_file, string)
+        else:
+            data = string.encode('utf-8')
+            offset = self.writer.write(self.inbox_file, data)
+            if self.index_headlines:
+                from org_mode_index import extend_index
+
+                extend_index(self.inbox_file, offset, data, create=True)
+            if self.index_search:
+                from org_mode_search import extend_search_index
+
+                extend_search_index(self.inbox_file, offset, data, create=True)
+        if self.stats is not None:
+            self.stats.record("write_to_file", perf_counter() - start,
+                              len(string), len(string), 1)
+
+    def write_entries(self, entries, now=None, written=None):
+        """Append an iterable of formatted entries to inbox_file in chunks.
+
+        written is called with the number of entries after each write.
+        """
+        if self.datetree:
+            # Every entry goes to the node of its own date
+            for entry in entries:
+                self.write_to_file(entry, now)
+                if written is not None:
+                    written(1)
+            return
+        chunk, size = [], 0
+        for entry in entries:
+            chunk.append(entry)
+            size += len(entry)
+            if size >= self.write_chunk_size:
+                self.write_to_file(''.join(chunk))
+                if written is not None:
+                    written(len(chunk))
+                chunk, size = [], 0
+        if chunk:
+            self.write_to_file(''.join(chunk))
+            if written is not None:
+                written(len(chunk))
+
+    def get_datetree_date(self, entry, now=None):
+        """Return the date of the datetree node of a formatted entry.
+
+        Entries without the deadline or scheduled date are filed by the date
+        of creation (now, default: get_now()).
+        """
+        import datetime
+
+        if self.datetree == "deadline":
+            keyword = self.deadline_keyword
+        elif self.datetree == "scheduled":
+            keyword = self.scheduled_keyword
+        else:
+            keyword = None
+        if keyword is not None:
+            position = entry.find(keyword + "<")
+            if position != -1:
+                start = position + len(keyword) + 1
+                date = entry[start:start + 10]
+                try:
+                    if date[4] == date[7] == "-":
+                        # Without _strptime
+                        return datetime.date(int(date[:4]), int(date[5:7]),
+                                             int(date[8:10]))
+                except (IndexError, ValueError):
+                    pass
+        return (now or self.get_now()).date()
 
     def format_entry(self, string):
+        """Format a string and keep its heading and body for create_message."""
+        entry = self.format(string)
+        self.heading = entry.heading
+        self.body = entry.body
+        return entry.text
+
+    def compose_entry(self, string):
+        """Return a tuple (heading, body, text) of format(string)."""
+        entry = self.format(string)
+        return entry.heading, entry.body, entry.text
+
+    def format(self, string, now=None, deadline=None, scheduled=None):
+        """Format a string into an Entry without changing the instance.
+
+        now is the time of the capture (default: get_now()). deadline and
+        scheduled ("DEADLINE: <...>") are used instead of the dates found in
+        the body, e.g. the parsed dates of an import. As nothing is stored,
+        one configured instance can format entries on several threads at
+        once.
+        """
+        if now is None:
+            now = self.get_now()
+        if self.stats is not None:
+            start = perf_counter()
         items = self.split_string(string)
+        planning = deadline, scheduled
         deadline, scheduled = None, None
 
         # Format body
         if len(items) == 1:
             # String has no body
             body = ""
-            self.body = None
+            message_body = None
         else:
             # String has a body
-            body = items[1]
-
-            if self.replace_absolute_dates is True:
-                # Replace absolute dates
-                body = self.convert_absolute_date(body)
-
-            if self.replace_relative_dates is True:
-                # Replace relative dates
-                body = self.replace_date(body)
-
-            if self.smart_line_break is True:
-                # convert line breaks
-                body = self.convert_line_breaks(body)
-
-            if self.convert_deadlines is True:
-                # Replace deadlines
-                deadline, body = self.get_deadline_date(body)
-
-            if self.convert_scheduled is True:
-                # Replace deadlines
-                scheduled, body = self.get_scheduled_date(body)
-
-            if self.cleanup_spaces is True:
-                body = self.remove_double_spaces(body)
-                body = self.remove_leading_trailling_spaces(body)
-
-            self.body = body
+            deadline, scheduled, body = self.get_engine().transform_body(
+                items[1], now.date())
+            message_body = body
+        if planning[0] is not None:
+            deadline = planning[0]
+        if planning[1] is not None:
+            scheduled = planning[1]
 
         # Format heading
         heading = items[0]
@@ -150,9 +531,30 @@ class OrgmodeEntry(object):
         if self.use_priority_tags is True:
             # Search heading string for priority tag and add an orgmode
             # priority tag to the heading
-            heading = self.add_priority(heading)
-
-        self.heading = heading
+            engine = self.get_engine()
+            heading = engine.apply("add_priority", engine.add_priority,
+                                   heading)
+
+        message_heading = heading
+        todo, priority = heading_pattern.match(message_heading).groups()
+        if self.template is not None:
+            created, entry = self.render_template(
+                now, heading, todo, priority, deadline, scheduled,
+                message_body)
+        else:
+            created, entry = self.layout_entry(now, heading, deadline,
+                                               scheduled, body)
+
+        if self.stats is not None:
+            self.stats.record("format_entry", perf_counter() - start,
+                              len(string), len(entry))
+        return Entry(message_heading, todo, priority,
+                     self.strip_keyword(deadline, self.deadline_keyword),
+                     self.strip_keyword(scheduled, self.scheduled_keyword),
+                     created, message_body, entry)
+
+    def layout_entry(self, now, heading, deadline, scheduled, body):
+        """Return the time of creation (None: not added) and the text of an entry."""
         heading = self.heading_suffix + heading
 
         # Format entry
@@ -165,227 +567,142 @@ class OrgmodeEntry(object):
             else:
                 entry += '\n'
             entry += scheduled
+        created = None
         if self.add_creation_date is True:
-            entry += '\n%s' % self.get_creation_date()
+            created = now
+            entry += '\n%s' % self.get_creation_date(now)
         entry += '\n%s' % body
+        return created, entry
+
+    def render_template(self, now, heading, todo, priority, deadline,
+                        scheduled, body):
+        """Like layout_entry, with the layout of the template."""
+        template = self.template
+        created = now if "created" in template.dates else None
+        entry = "\n" + template.render({
+            "stars": self.heading_suffix.strip(),
+            "heading": heading,
+            "todo": todo,
+            "priority": priority,
+            "title": heading[heading_pattern.match(heading).end():].strip(),
+            "deadline": self.strip_keyword(deadline, self.deadline_keyword),
+            "scheduled": self.strip_keyword(scheduled, self.scheduled_keyword),
+            "planning": " ".join(date for date in (deadline, scheduled)
+                                 if date),
+            "created": created,
+            "body": body
+        })
+        return created, entry
+
+    @staticmethod
+    def strip_keyword(date, keyword):
+        """Return the timestamp of "DEADLINE: <...>" (the text if it has no keyword)."""
+        if date is not None and date.startswith(keyword):
+            return date[len(keyword):]
+        return date
 
-        return entry
+    def get_engine(self):
+        """Return the compiled transformations of the current configuration.
+
+        The patterns are compiled again only if an option changed; threads
+        that format at once share one engine.
+        """
+        signature = TransformEngine.get_signature(self)
+        engine = self.engine
+        if engine is None or engine.signature != signature:
+            with self.engine_lock:
+                engine = self.engine
+                if engine is None or engine.signature != signature:
+                    engine = self.engine = TransformEngine(self)
+        return engine
 
     def split_string(self, string):
         return string.split(self.delimiter)
 
     def replace_date(self, string):
-        dict_keys = '|'.join(self.weekdays.keys()) + "|" + '|'.join(
-            self.relative_dates.keys())
-        expression = r'\b(' + dict_keys + r')\b'
-        pattern = re.compile(expression, re.IGNORECASE)
-        string = pattern.sub(lambda x: self.convert_date(x.group()), string)
-        return string
+        return self.get_engine().replace_date(string)[0]
 
     def convert_date(self, string):
-        today = datetime.datetime.now()
-        delta = self.convert_relative_date(string)
-        date = today + datetime.timedelta(days=delta)
-        date = self.format_date(date, self.date_format)
+        """Return the org timestamp of a date expression (today if it is none)."""
+        date = self.get_engine().parse_date(string)
+        if date is None:
+            date = self.format_date(self.get_now(), self.date_format)
         return date
 
     def convert_relative_date(self, string):
         # string dictionaries with delta day value
         string = string.lower()
-        relative_dates = self.relative_dates
-        weekdays = self.weekdays
-        convenience_dates = self.convenience_dates
-
-        if string in relative_dates:
-            delta = relative_dates[string]
-        elif string in weekdays:
-            today = datetime.datetime.today()
-            current = today.weekday()
-            weekday = weekdays[string]
+        matcher = self.get_engine().pattern("dates")
+
+        if string in matcher.relative_dates:
+            delta = matcher.relative_dates[string]
+        elif string in matcher.weekdays:
+            current = self.get_now().weekday()
+            weekday = matcher.weekdays[string]
             if current == weekday:
                 delta = 7
             elif weekday < current:
                 delta = 7 - (current - weekday)
             else:
                 delta = weekday - current
-        # TODO: Extend replace date function
-        elif string in convenience_dates:
-            item = string.split(".")
-            day = item[0]
-            month = item[1]
-            print(day, month)
-            delta = False
         else:
             delta = False
         return delta
 
     def format_date(self, date, date_format):
-        year = date.strftime("%Y")
-        month = date.strftime("%m")
-        day = date.strftime("%d")
-        weekday = date.strftime("%a")
+        # year, month, day and weekday in one call
+        items = date.strftime("%Y %m %d %a").split(" ")
 
-        date = date_format % (year, month, day, weekday)
+        date = date_format % tuple(items)
         return date
 
     def convert_absolute_date(self, string):
-        # Set up pattern
-        date_pattern = [
-            '\d{1,2}\.\d{1,2}\.\d{4}',  # 01.09.2016 and 1.9.2016
-            '\d{1,2}\.\d{1,2}'
-        ]
-        time_pattern = '\s\d{2}\:\d{2}'  # HH:MM
-
-        # Search for date string
-        date = None
-        # Pattern 0
-        pattern = "(%s)" % date_pattern[0]
-        result = re.search(pattern, string)
-        # format to orgmode timestamp
-        if result is not None:
-            sub_pattern = pattern
-            date = result.group(1)
-            date = datetime.datetime.strptime(
-                date, '%d.%m.%Y').strftime('%Y-%m-%d %a')
-            # format as orgmode date format
-            # date = self.format_date(date, self.date_format)
-        else:
-            # Pattern 1
-            pattern = "(%s)" % date_pattern[1]
-            result = re.search(pattern, string)
-            if result is not None:
-                sub_pattern = pattern
-                date = result.group(1)
-                date = datetime.datetime.strptime(date,
-                                                  '%d.%m').strftime('%m-%d')
-
-                # Add year to date
-                # Compare with today's date
-                today = datetime.datetime.today()
-                date_compare = "%s-%s" % (today.year, date)
-                date_compare = datetime.datetime.strptime(
-                    date_compare, "%Y-%m-%d")
-                if date_compare > today:
-                    # Date is this year
-                    year = today.year
-                else:
-                    # Date is next year
-                    year = today.year + 1
-                # Add year to date
-                date = "%s-%s" % (year, date)
-                # format as orgmode date
-                date = datetime.datetime.strptime(
-                    date, '%Y-%m-%d').strftime('%Y-%m-%d %a')
-
-        # Search for time in string
-        time = ""
-        pattern = "(%s|%s)(%s)" % (date_pattern[0], date_pattern[1],
-                                   time_pattern)
-        result = re.search(pattern, string)
-        if result is not None:
-            sub_pattern = pattern
-            time = result.group(2)
-
-        if date is not None:
-            # format as orgmode timestamp
-            date = "<%s%s>" % (date, time)
-
-            # replace date with orgmode timestamp
-            string = re.sub(sub_pattern, date, string, count=1)
-
-        return string
+        return self.get_engine().convert_absolute_date(string)[0]
 
-    def get_creation_date(self):
-        today = datetime.datetime.now()
-        date = self.format_date(today, self.creation_date_format)
+    def get_creation_date(self, now=None):
+        date = self.format_date(now or self.get_now(),
+                                self.creation_date_format)
         return date
 
     def add_priority(self, heading):
-        # search for priority tag
-        pattern = '(.+?|.?)%s(.?)\s' % self.priority_tag
-        result = re.match(pattern, heading)
-
-        # Add orgmode's priority tag to heading
-        if result is not None:
-            # remove priority tag from heading
-            pattern = '(%s.?)\s' % self.priority_tag
-            heading = re.sub(pattern, "", heading)
-
-            # add priority to heading
-            priority = result.group(2).upper()
-            task_tag = "TODO"
-            if re.match(task_tag, heading) is not None:
-                # Heading is task: add priority after task tag
-                task_tag_pos = len(task_tag)
-                heading = "%s [#%s] %s" % (heading[:task_tag_pos], priority,
-                                           heading[task_tag_pos + 1:])
-            else:
-                # Heading is note
-                heading = "[#%s] %s" % (priority, heading)
-        return heading
+        return self.get_engine().add_priority(heading)[0]
 
     def convert_line_breaks(self, string):
-        expression = r'(' + self.line_break_pattern + ')'
-        pattern = re.compile(expression, re.IGNORECASE)
-        string = re.sub(pattern, self.line_break_char, string)
-        return string
+        return self.get_engine().convert_line_breaks(string)[0]
 
     def remove_double_spaces(self, string):
-        # remove double spaces (run twice)
-        expression = r'(' + '\s\s' + ')'
-        pattern = re.compile(expression)
-        for i in range(2):
-            string = re.sub(pattern, ' ', string)
-        return string
+        return self.get_engine().remove_double_spaces(string)[0]
 
     def remove_leading_trailling_spaces(self, string):
-        # remove leading and trailing spaces
-        expression = r'(' + '^\s|\s$' ')'
-        pattern = re.compile(expression)
-        string = re.sub(pattern, '', string)
-        return string
+        return self.get_engine().remove_leading_trailling_spaces(string)[0]
 
     def get_deadline_date(self, string):
-        # Get deadline
-        expression = r'(' + self.deadline_pattern + self.date_format_regex + ')'
-        pattern = re.compile(expression, re.IGNORECASE)
-        deadline = re.search(pattern, string)
-        if deadline is not None:
-            # DL: => DEADLINE:
-            deadline = re.sub(r'(' + self.deadline_pattern + ')',
-                              self.deadline_keyword, deadline.group(1))
-
-        # Remove deadline from string
-        pattern = re.compile(expression, re.IGNORECASE)
-        body = re.sub(pattern, '', string)
-
-        return deadline, body
+        return self.get_engine().get_deadline_date(string)[0]
 
     def get_scheduled_date(self, string):
-        # Get scheduled
-        expression = r'(' + self.scheduled_pattern + self.date_format_regex + ')'
-        pattern = re.compile(expression, re.IGNORECASE)
-        scheduled = re.search(pattern, string)
-        if scheduled is not None:
-            # S: => SCHEDULED:
-            scheduled = re.sub(r'(' + self.scheduled_pattern + ')',
-                               self.scheduled_keyword, scheduled.group(1))
-
-        # Remove scheduled from string
-        pattern = re.compile(expression, re.IGNORECASE)
-        body = re.sub(pattern, '', string)
-
-        return scheduled, body
+        return self.get_engine().get_scheduled_date(string)[0]
 
     def create_message(self):
+        return self.format_message(self.heading, self.body)
+
+    def get_filename(self):
         # Get inbox_file of file path
         filepath = self.inbox_file.split('/')
-        filename = filepath[len(filepath) - 1]
+        return filepath[len(filepath) - 1]
 
-        if self.body is None:
-            message = self.message_format[0] % (self.heading, filename)
+    def format_message(self, heading, body):
+        filename = self.get_filename()
+
+        if body is None:
+            message = self.message_format[0] % (heading, filename)
         else:
-            message = self.message_format[1] % (self.heading, self.body,
-                                                filename)
+            message = self.message_format[1] % (heading, body, filename)
 
         return message
+
+    def format_duplicate_message(self, heading, skipped):
+        if skipped:
+            message_format = self.duplicate_message_format[0]
+        else:
+            message_format = self.duplicate_message_format[1]
+        return message_format % (heading, self.get_filename())
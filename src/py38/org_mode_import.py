@@ -0,0 +1,399 @@
+# python version 3.8
+# UTF-8 encoding
+"""Import task lists of other tools as org entries.
+
+    python org_mode_import.py todo markdown tasks.md
+    python org_mode_import.py todo csv export.csv --column heading=Title \\
+        --column deadline="Due Date"
+    python org_mode_import.py note taskpaper Projects.taskpaper --dry-run
+
+The workflow variables of the action are read from the environment, like
+in a batch capture (see org_mode_capture_run). Each reader yields one
+Record per task; the Importer formats the records with the OrgmodeEntry of
+the action and writes them in chunks, so files of any size are imported
+with constant memory: the source is read line by line and neither the
+records nor the messages are kept.
+"""
+import re
+import sys
+from collections import namedtuple
+from functools import partial
+
+# A task of another tool: state is e.g. "TODO" or "DONE" (None: the default
+# of the import), priority a letter, deadline and scheduled date
+# expressions like "2026-10-20" or "tomorrow", tags a tuple of org tags
+Record = namedtuple("Record", ["heading", "body", "state", "priority",
+                               "deadline", "scheduled", "tags"])
+
+
+class ImportFormatError(ValueError):
+    """A source cannot be read as the given format."""
+
+
+# Markdown: "- [ ] task", "* [x] done task", "1. [ ] task"
+markdown_task = re.compile(r"(\s*)(?:[-*+]|\d+[.)])\s+\[([ xX])\]\s+(.*)")
+
+
+def read_markdown(stream):
+    """Yield the Record of each task of a Markdown task list.
+
+    Lines below a task that are indented deeper than its bullet (and are no
+    tasks themselves) are its body; all other lines are skipped.
+    """
+    task, indent, body = None, 0, []
+    for line in stream:
+        line = line.rstrip("\r\n")
+        match = markdown_task.match(line)
+        if match is None and task is not None:
+            if not line.strip():
+                continue
+            if len(line) - len(line.lstrip()) > indent:
+                body.append(line.strip())
+                continue
+        if task is not None:
+            yield task._replace(body="\n".join(body))
+            task = None
+        if match is not None:
+            indent = len(match.group(1))
+            state = "TODO" if match.group(2) == " " else "DONE"
+            task = Record(match.group(3).strip(), "", state, None, None, None,
+                          ())
+            body = []
+    if task is not None:
+        yield task._replace(body="\n".join(body))
+
+
+# TaskPaper: "@tag" or "@tag(value)"
+taskpaper_tag = re.compile(r"(?:^|\s)@([\w.-]+)(?:\(([^)]*)\))?")
+
+# Priorities of other tools => org priorities
+priorities = {"1": "A", "high": "A", "2": "B", "medium": "B",
+              "3": "C", "low": "C"}
+
+
+def read_taskpaper(stream):
+    """Yield the Record of each task of a TaskPaper file.
+
+    @done marks done tasks, @due and @start (or @defer) give the deadline and
+    the scheduled date, @priority(1) to @priority(3) the priority; all other
+    tags and the name of the project become org tags. Notes indented below
+    a task are its body.
+    """
+    task, indent, body, project = None, 0, [], None
+    for line in stream:
+        line = line.rstrip("\r\n")
+        text = line.strip()
+        if not text:
+            continue
+        depth = len(line) - len(line.lstrip("\t "))
+        is_task = text.startswith("- ") or text == "-"
+        if not is_task and task is not None and depth > indent:
+            body.append(text)
+            continue
+        if task is not None:
+            yield task._replace(body="\n".join(body))
+            task = None
+        if is_task:
+            task = get_taskpaper_record(text[2:], project)
+            indent, body = depth, []
+        elif depth == 0 and taskpaper_tag.sub("", text).endswith(":"):
+            project = taskpaper_tag.sub("", text)[:-1].strip()
+    if task is not None:
+        yield task._replace(body="\n".join(body))
+
+
+def get_priority(value):
+    """Return the org priority of "1" to "3", "high" to "low" or a letter (else None)."""
+    value = value.strip()
+    if value.lower() in priorities:
+        return priorities[value.lower()]
+    if len(value) == 1 and value.isalpha():
+        return value.upper()
+    return None
+
+
+def get_taskpaper_record(text, project):
+    state, priority, deadline, scheduled = None, None, None, None
+    tags = []
+    for name, value in taskpaper_tag.findall(text):
+        name = name.lower()
+        if name == "done":
+            state = "DONE"
+        elif name == "due" and value:
+            deadline = value
+        elif name in ["start", "defer"] and value:
+            scheduled = value
+        elif name == "priority" and value:
+            priority = get_priority(value)
+        else:
+            tags.append(name)
+    if project:
+        tags.insert(0, project)
+    heading = taskpaper_tag.sub("", text).strip()
+    return Record(heading, "", state, priority, deadline, scheduled,
+                  tuple(tags))
+
+
+# Fields of a Record a CSV column can be mapped to
+csv_fields = ["heading", "body", "state", "priority", "deadline", "scheduled",
+              "tags"]
+
+
+def read_csv(stream, columns=None):
+    """Yield the Record of each row of a CSV file with a header row.
+
+    columns maps fields of Record to column names, e.g. {"heading": "Title",
+    "deadline": "Due"}; unmapped fields are read from the column of the same
+    name (case-insensitive) if there is one. The tags column is split at
+    commas, spaces and colons.
+    """
+    import csv
+
+    reader = csv.reader(stream)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    names = {name.strip().lower(): index for index, name in enumerate(header)}
+    columns = dict(columns or {})
+    indexes = {}
+    for field in csv_fields:
+        column = columns.pop(field, field)
+        if column.lower() in names:
+            indexes[field] = names[column.lower()]
+        elif field == "heading" or column != field:
+            raise ImportFormatError("CSV file has no column %r (columns: %s)" %
+                                    (column, ", ".join(header)))
+    if columns:
+        raise ImportFormatError("Unknown fields: %s (use %s)" %
+                                (", ".join(columns), ", ".join(csv_fields)))
+
+    for row in reader:
+        values = dict.fromkeys(csv_fields)
+        for field, index in indexes.items():
+            if index < len(row) and row[index].strip():
+                values[field] = row[index].strip()
+        if values["heading"] is None:
+            continue
+        if values["state"] is not None:
+            values["state"] = values["state"].upper()
+        if values["priority"] is not None:
+            values["priority"] = get_priority(values["priority"])
+        values["tags"] = tuple(tag for tag in re.split(r"[\s,:]+",
+                                                       values["tags"] or "")
+                               if tag)
+        values["body"] = values["body"] or ""
+        yield Record(**values)
+
+
+# Readers of the formats
+readers = {"markdown": read_markdown, "csv": read_csv,
+           "taskpaper": read_taskpaper}
+
+
+class Importer(object):
+    """Format Records with an OrgmodeEntry and write them in chunks.
+
+    The records are turned into capture strings (heading, delimiter, body)
+    and formatted by OrgmodeEntry.format, so the options of the action
+    apply to them. Deadlines and scheduled dates are parsed by the date
+    matcher and passed to format as planning lines, whatever
+    convert_deadlines and convert_scheduled are; dates that cannot be
+    parsed stay in the body. The targets of the action get the records as
+    well, in chunks of chunk_size records formatted with their own options.
+    """
+    def __init__(self, org, keyword="TODO"):
+        self.org = org
+        # State of records without one (None: no keyword)
+        self.keyword = keyword
+        # Called with the number of entries after every progress_interval
+        # entries and at the end
+        self.progress = None
+        self.progress_interval = 1000
+        self.chunk_size = 1000  # records added to the targets at once
+        # (file name, error) of the targets that failed
+        self.failures = []
+
+    def format_record(self, record, today=None):
+        """Return the capture string, deadline and scheduled date of a Record.
+
+        The dates are planning lines ("DEADLINE: <...>") or None; relative
+        dates are read from today.
+        """
+        org = self.org
+        heading = record.heading
+        if record.priority:
+            heading = "[#%s] %s" % (record.priority, heading)
+        state = record.state or self.keyword
+        if state:
+            heading = "%s %s" % (state, heading)
+        if record.tags:
+            heading = "%s :%s:" % (heading, ":".join(
+                re.sub(r"[^\w@#%]+", "_", tag) for tag in record.tags))
+
+        body = record.body.replace(org.delimiter, " ")
+        planning = []
+        for value, keyword in [(record.deadline, org.deadline_keyword),
+                               (record.scheduled, org.scheduled_keyword)]:
+            timestamp = None
+            if value is not None:
+                # Exports of macOS may be decomposed (NFD)
+                value = org.encode(value)
+                timestamp = org.get_engine().parse_date(value, today)
+                if timestamp is None:
+                    # Kept as text
+                    body = "%s %s" % (value, body) if body else value
+            planning.append(None if timestamp is None else keyword + timestamp)
+        heading = heading.replace(org.delimiter, " ")
+        if body:
+            heading += org.delimiter + body
+        return heading, planning[0], planning[1]
+
+    def get_entries(self, records, now=None, org=None):
+        """Yield the formatted entry of each record, captured at now.
+
+        org is the OrgmodeEntry that formats them (default: that of the
+        import, else one of its targets).
+        """
+        if org is None:
+            org = self.org
+        if now is None:
+            now = org.get_now()
+        today = now.date()
+        for record in records:
+            string, deadline, scheduled = self.format_record(record, today)
+            yield org.format(org.encode(string), now, deadline,
+                             scheduled).text
+
+    def count_records(self, records):
+        """Yield the records; count them and report the progress."""
+        for record in records:
+            yield record
+            self.count += 1
+            if self.progress is not None and \
+                    self.count % self.progress_interval == 0:
+                self.progress(self.count)
+
+    def run(self, records, output=None):
+        """Add the entries of an iterable of records; return their number.
+
+        With an output stream (a dry run) the entries are written to it
+        instead of the inbox file.
+        """
+        org = self.org
+        self.count = 0
+        self.failures = []
+        records = self.count_records(records)
+        # One time for all entries
+        now = org.get_now()
+        if output is not None:
+            for entry in self.get_entries(records, now):
+                output.write(entry)
+            output.write("\n")
+        elif org.targets:
+            self.add_to_targets(records, now)
+        else:
+            org.write_entries(self.get_entries(records, now), now)
+        if output is None and org.spool is not None:
+            org.spool.flush()
+        if self.progress is not None:
+            self.progress(self.count)
+        return self.count
+
+    def add_to_targets(self, records, now):
+        """Add the records to the inbox file and to the targets of the action.
+
+        A target that fails does not stop the others; it gets no further
+        records and is added to failures. Raises the first error if all
+        failed.
+        """
+        from itertools import islice
+
+        org = self.org
+        failed = []
+
+        def add(target, chunk):
+            if target not in failed:
+                target.write_entries(self.get_entries(chunk, now, target), now)
+
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            results = org.run_targets(partial(add, chunk=chunk))
+            for target, result in zip([org] + org.targets, results):
+                if isinstance(result, Exception):
+                    failed.append(target)
+                    self.failures.append((target.get_filename(), result))
+
+
+def main(argv=None):
+    import argparse
+
+    from org_mode_capture_run import configure
+
+    parser = argparse.ArgumentParser(
+        description="Import Markdown task lists, CSV files or TaskPaper "
+                    "files into an org-mode file.")
+    parser.add_argument("action", choices=["todo", "note", "inspiration"])
+    parser.add_argument("format", choices=sorted(readers))
+    parser.add_argument("file", help="file to import (- for stdin)")
+    parser.add_argument("--column", action="append", default=[],
+                        metavar="FIELD=NAME",
+                        help="CSV column of a field (%s)" % ", ".join(csv_fields))
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the entries instead of adding them")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not report the progress")
+    args = parser.parse_args(argv)
+
+    columns = {}
+    for column in args.column:
+        field, equals, name = column.partition("=")
+        if not equals:
+            parser.error("--column must be FIELD=NAME, not %r" % column)
+        columns[field.strip()] = name.strip()
+    if columns and args.format != "csv":
+        parser.error("--column is only used with csv")
+
+    org = configure(args.action)
+    importer = Importer(org, "TODO" if args.action == "todo" else None)
+    if not args.quiet:
+        importer.progress = lambda count: sys.stderr.write(
+            "\r%s entries" % count)
+
+    if args.file == "-":
+        stream = sys.stdin
+    else:
+        stream = open(args.file, encoding="utf-8-sig", newline="")
+    try:
+        if args.format == "csv":
+            records = read_csv(stream, columns)
+        else:
+            records = readers[args.format](stream)
+        output = sys.stdout if args.dry_run else None
+        try:
+            count = importer.run(records, output)
+        except ImportFormatError as error:
+            parser.exit(1, "\n%s\n" % error)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    if not args.quiet:
+        sys.stderr.write("\n")
+    for filename, error in importer.failures:
+        print("Failed to add the entries to %s: %s" % (filename, error),
+              file=sys.stderr)
+    if args.dry_run:
+        print("Would add %s entries to %s." % (count, org.get_filename()),
+              file=sys.stderr)
+    else:
+        failed = [filename for filename, error in importer.failures]
+        filenames = [target.get_filename() for target in [org] + org.targets
+                     if target.get_filename() not in failed]
+        print("Added %s entries to %s." % (count, ", ".join(filenames)))
+
+
+if __name__ == "__main__":
+    main()
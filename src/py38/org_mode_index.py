@@ -0,0 +1,409 @@
+# python version 3.8
+# UTF-8 encoding
+import collections
+import fcntl
+import itertools
+import mmap
+import os
+import re
+import zlib
+
+Headline = collections.namedtuple("Headline", [
+    "offset", "level", "todo", "priority", "title", "created", "deadline",
+    "scheduled"
+])
+
+# Headline with the planning line and the property drawer that follow it
+headline_pattern = re.compile(
+    rb'^(\*+)[ \t]+([^\n]*)\n?'
+    rb'(?:[ \t]*((?:DEADLINE|SCHEDULED|CLOSED):[^\n]*)\n?)?'
+    rb'(?:[ \t]*:PROPERTIES:[ \t]*\n((?:[ \t]*:(?!END:)[^\n]*\n)*)[ \t]*:END:)?',
+    re.MULTILINE)
+headline_start_pattern = re.compile(rb'\*+[ \t]')
+created_pattern = re.compile(rb':CREATED:[ \t]*\[([^\]\n]*)\]')
+deadline_pattern = re.compile(rb'DEADLINE:[ \t]*<([^>\n]*)>')
+scheduled_pattern = re.compile(rb'SCHEDULED:[ \t]*<([^>\n]*)>')
+
+# Fields of the records of the sidecar
+delta_pattern = re.compile(r'^(\d+)\t', re.MULTILINE)
+level_pattern = re.compile(r'^\d+\t(\d+)\t', re.MULTILINE)
+
+
+class HeadlineIndex(object):
+    """Persistent sidecar index of the headlines of an org file.
+
+    The index maps each headline to its byte offset, level, TODO state,
+    priority and its CREATED, DEADLINE and SCHEDULED timestamps. It is kept
+    next to the org file (.<name>.index) and brought up to date by update():
+    appended text is scanned from the last indexed headline on; a file that
+    was replaced, shrank or changed anywhere in the indexed bytes (checked
+    with their CRC-32) is scanned again completely. extend() adds an append
+    without reading the org file.
+
+    Sidecar format: a fixed size header with the size, mtime, inode and
+    CRC-32 of the indexed org file and the offset of its last headline,
+    followed by one tab separated record per headline. A record keeps the
+    distance to the previous headline instead of the offset, so that text
+    inserted into the org file changes a single record (see insert()). The
+    records are kept as strings and parsed only when headlines is read.
+    """
+    todo_keywords = ["TODO", "NEXT", "WAITING", "DONE", "CANCELLED"]
+    header_format = b"ORGIDX3 %016d %020d %020d %016d %010d\n"
+    header_size = len(header_format % (0, 0, 0, 0, 0))
+    crc_block_size = 1 << 20  # bytes read at once to check the CRC
+
+    def __init__(self, path):
+        self.path = path
+        directory, name = os.path.split(os.path.abspath(path))
+        self.index_file = os.path.join(directory, ".%s.index" % name)
+        # Header values: the state of the org file covered by the index
+        self.size, self.mtime, self.inode, self.last_offset = 0, 0, 0, 0
+        self.crc = 0
+        self.records = []
+        self._headlines = None
+        self._offsets = None
+
+        keywords = b'|'.join(k.encode('utf-8') for k in self.todo_keywords)
+        self.title_pattern = re.compile(
+            rb'(?:(' + keywords + rb')(?:[ \t]+|$))?'
+            rb'(?:\[#([A-Za-z0-9])\][ \t]*)?(.*)')
+
+    @property
+    def headlines(self):
+        if self._headlines is None:
+            new = tuple.__new__
+            headlines = []
+            for offset, record in zip(self.offsets, self.records):
+                (delta, level, todo, priority, created, deadline, scheduled,
+                 title) = record.split("\t", 7)
+                headlines.append(new(Headline, (
+                    offset, int(level), todo or None, priority or None, title,
+                    created or None, deadline or None, scheduled or None)))
+            self._headlines = headlines
+        return self._headlines
+
+    @property
+    def offsets(self):
+        """The offsets of all headlines, without parsing the records."""
+        if self._offsets is None:
+            deltas = delta_pattern.findall(self.get_text())
+            self._offsets = list(itertools.accumulate(map(int, deltas)))
+        return self._offsets
+
+    def get_levels(self, start=0, end=None):
+        """Return the levels of the headlines start to end, without parsing the records."""
+        return list(map(int, level_pattern.findall(self.get_text(start, end))))
+
+    def get_text(self, start=0, end=None):
+        """Return the records start to end as one string, a record per line."""
+        return "\n".join(self.records[start:end])
+
+    def set_records(self, records):
+        self.records = records
+        self._headlines = None
+        self._offsets = None
+
+    # Reading and writing the sidecar
+    def load(self):
+        """Read the sidecar; return False if there is none (or it is unreadable)."""
+        try:
+            with open(self.index_file, "rb") as index_file:
+                data = index_file.read()
+        except FileNotFoundError:
+            return False
+        header = self.parse_header(data[:self.header_size])
+        if header is None:
+            return False
+        self.size, self.mtime, self.inode, self.last_offset, self.crc = \
+            header
+        records = data[self.header_size:].decode('utf-8').split("\n")
+        records.pop()
+        self.set_records(records)
+        return True
+
+    def save(self):
+        """Write the whole sidecar at once."""
+        temporary_file = "%s.%s.tmp" % (self.index_file, os.getpid())
+        with open(temporary_file, "wb") as index_file:
+            index_file.write(self.format_header())
+            index_file.write(self.format_text(self.records))
+        os.replace(temporary_file, self.index_file)
+
+    def parse_header(self, header):
+        fields = header.split()
+        if len(header) != self.header_size or fields[0] != b"ORGIDX3":
+            return None
+        return [int(field) for field in fields[1:]]
+
+    def format_header(self):
+        return self.header_format % (self.size, self.mtime, self.inode,
+                                     self.last_offset, self.crc)
+
+    @staticmethod
+    def format_records(headlines, previous):
+        """Return the records of headlines; previous is the offset of the headline before."""
+        records = []
+        for headline in headlines:
+            fields = [
+                str(headline.offset - previous), str(headline.level),
+                headline.todo or "", headline.priority or "",
+                headline.created or "", headline.deadline or "",
+                headline.scheduled or "", headline.title.replace("\n", " ")
+            ]
+            records.append("\t".join(fields))
+            previous = headline.offset
+        return records
+
+    @staticmethod
+    def format_text(records):
+        return "".join(record + "\n" for record in records).encode('utf-8')
+
+    def set_stat(self, stat):
+        self.size, self.mtime, self.inode = \
+            stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    # Scanning
+    def scan(self, data, start=0, base=0):
+        """Return the headlines in data (bytes or mmap) from start on.
+
+        base is the offset of data in the org file.
+        """
+        headlines = []
+        title_pattern = self.title_pattern
+        for match in headline_pattern.finditer(data, start):
+            stars, text, planning, drawer = match.groups()
+            todo, priority, title = title_pattern.match(text).groups()
+            created = deadline = scheduled = None
+            if planning is not None:
+                deadline = self.search(deadline_pattern, planning)
+                scheduled = self.search(scheduled_pattern, planning)
+            if drawer is not None:
+                created = self.search(created_pattern, drawer)
+            headlines.append(Headline(
+                base + match.start(), len(stars),
+                todo.decode('utf-8') if todo else None,
+                priority.decode('utf-8').upper() if priority else None,
+                title.decode('utf-8', 'replace').rstrip(), created, deadline,
+                scheduled))
+        return headlines
+
+    @staticmethod
+    def search(pattern, data):
+        match = pattern.search(data)
+        if match is None:
+            return None
+        return match.group(1).decode('utf-8', 'replace')
+
+    def scan_file(self, start=0, checked=0, crc=0):
+        """Scan the org file from the byte offset start on (memory mapped).
+
+        Returns the headlines, the stat of the file and its CRC-32: crc (that
+        of the first checked bytes) continued to the end.
+        """
+        with open(self.path, "rb") as org_file:
+            stat = os.fstat(org_file.fileno())
+            if stat.st_size <= start:
+                headlines = []
+            else:
+                with mmap.mmap(org_file.fileno(), 0,
+                               access=mmap.ACCESS_READ) as data:
+                    headlines = self.scan(data, start)
+                    with memoryview(data) as view, \
+                            view[checked:stat.st_size] as tail:
+                        crc = zlib.crc32(tail, crc)
+        return headlines, stat, crc
+
+    def get_crc(self, size):
+        """Return the CRC-32 of the first size bytes of the org file."""
+        crc = 0
+        with open(self.path, "rb") as org_file:
+            while size > 0:
+                block = org_file.read(min(size, self.crc_block_size))
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+                size -= len(block)
+        return crc
+
+    # Keeping the index up to date
+    def update(self):
+        """Bring the index up to date with the org file and save it if it changed.
+
+        Returns self.
+        """
+        if not self.records and not self.size:
+            self.load()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.size, self.mtime, self.inode, self.last_offset = 0, 0, 0, 0
+            self.crc = 0
+            self.set_records([])
+            return self
+        if (stat.st_size, stat.st_mtime_ns, stat.st_ino) == \
+                (self.size, self.mtime, self.inode):
+            return self
+
+        start = self.get_rescan_offset(stat)
+        if start is None or not os.path.exists(self.index_file):
+            headlines, stat, self.crc = self.scan_file()
+            self.set_records(self.format_records(headlines, 0))
+            self.last_offset = headlines[-1].offset if headlines else 0
+            self.set_stat(stat)
+            self.save()
+        else:
+            # Only the tail changed: scan from the last indexed headline on
+            # (its planning lines may have changed as well)
+            headlines, stat, self.crc = self.scan_file(start, self.size,
+                                                       self.crc)
+            removed = 0
+            if self.records and self.last_offset >= start:
+                self.last_offset -= int(self.records[-1].split("\t", 1)[0])
+                self.set_records(self.records[:-1])
+                removed = 1
+            records = self.format_records(headlines, self.last_offset)
+            self.set_records(self.records + records)
+            if headlines:
+                self.last_offset = headlines[-1].offset
+            self.set_stat(stat)
+            self.save_tail(removed, records)
+        return self
+
+    def get_rescan_offset(self, stat):
+        """Return the offset from which a changed file must be scanned again.
+
+        None means the whole file: it was replaced, shrank or changed within
+        the indexed bytes (e.g. TODO edited to DONE, which keeps the size).
+        """
+        if stat.st_ino != self.inode or stat.st_size < self.size or \
+                self.get_crc(self.size) != self.crc:
+            return None
+        return self.last_offset
+
+    def save_tail(self, removed, records):
+        """Replace the last removed records of the sidecar by records."""
+        with open(self.index_file, "r+b") as index_file:
+            fd = index_file.fileno()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            end = os.fstat(fd).st_size
+            for _ in range(removed):
+                end = self.find_record_start(index_file, end)
+            index_file.truncate(end)
+            index_file.seek(end)
+            index_file.write(self.format_text(records))
+            index_file.seek(0)
+            index_file.write(self.format_header())
+
+    def find_record_start(self, index_file, end):
+        """Return the offset of the record that ends at end in the sidecar."""
+        position = end - 1
+        while position > self.header_size:
+            start = max(self.header_size, position - 4096)
+            index_file.seek(start)
+            newline = index_file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            position = start
+        return self.header_size
+
+    def extend(self, offset, data):
+        """Add the headlines of data just appended to the org file at offset.
+
+        Without reading the org file; if the index does not end at offset or
+        data does not start with a headline (it may add to the last one), the
+        index is updated instead. Several processes may extend at once.
+        """
+        try:
+            fd = os.open(self.index_file, os.O_RDWR)
+        except FileNotFoundError:
+            self.update()
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            header = self.parse_header(os.pread(fd, self.header_size, 0))
+            stat = os.stat(self.path)
+            if header is None or header[0] != offset or \
+                    header[2] != stat.st_ino or \
+                    not self.starts_headline(offset, data):
+                header = None
+            else:
+                self.last_offset = header[3]
+                headlines = self.scan(data, base=offset)
+                os.lseek(fd, 0, os.SEEK_END)
+                os.write(fd, self.format_text(
+                    self.format_records(headlines, self.last_offset)))
+                if headlines:
+                    self.last_offset = headlines[-1].offset
+                self.size = offset + len(data)
+                self.crc = zlib.crc32(data, header[4])
+                self.inode = stat.st_ino
+                # The old mtime: the file may have been edited before the
+                # append, so the next update() checks the CRC
+                self.mtime = header[1]
+                os.pwrite(fd, self.format_header(), 0)
+        finally:
+            os.close(fd)
+        if header is None:
+            self.size = 0
+            self.set_records([])
+            self.update()
+
+    def insert(self, offset, data):
+        """Update the loaded index for data inserted into the org file at offset.
+
+        The offset must start a line. Only the record of the headline after
+        the inserted text changes; the sidecar is saved.
+        """
+        offsets = self.offsets
+        # Binary search of the first headline at or after offset
+        low, high = 0, len(offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if offsets[middle] < offset:
+                low = middle + 1
+            else:
+                high = middle
+        position = low
+
+        previous = offsets[position - 1] if position else 0
+        headlines = self.scan(data, base=offset)
+        records = self.format_records(headlines, previous)
+        if headlines:
+            previous = headlines[-1].offset
+        following = self.records[position:]
+        if following:
+            # The next headline moved by len(data)
+            rest = following[0].split("\t", 1)[1]
+            following[0] = "%d\t%s" % (
+                offsets[position] + len(data) - previous, rest)
+            self.last_offset += len(data)
+        elif headlines:
+            self.last_offset = previous
+        self.set_records(self.records[:position] + records + following)
+        stat = os.stat(self.path)
+        self.set_stat(stat)
+        # Everything after offset moved
+        self.crc = self.get_crc(stat.st_size)
+        self.save()
+
+    def starts_headline(self, offset, data):
+        """Return True if data appended at offset starts with a headline."""
+        if not data:
+            return True
+        if data[:1] == b"\n":
+            data = data[1:]
+        elif offset and self.read_byte(offset - 1) != b"\n":
+            return False
+        return headline_start_pattern.match(data) is not None
+
+    def read_byte(self, offset):
+        with open(self.path, "rb") as org_file:
+            org_file.seek(offset)
+            return org_file.read(1)
+
+
+def extend_index(path, offset, data, create=False):
+    """Extend the headline index of path (if it has one) by an append."""
+    index = HeadlineIndex(path)
+    if create or os.path.exists(index.index_file):
+        index.extend(offset, data)
@@ -0,0 +1,188 @@
+# python version 3.8
+# UTF-8 encoding
+"""Vocabularies of the date expressions (see org_mode_dates).
+
+Each locale pack is a dict with the lower case words of one language:
+
+    weekdays       weekday names => 0 (Monday) to 6 (Sunday)
+    abbreviations  abbreviated weekdays, only used with a time, a repeater
+                   or a word of next ("fri 14:00"), as they are common words
+    relative       words and phrases => days from today ("day after tomorrow")
+    units          unit words => "d", "w", "m" or "y"
+    next           words before a weekday or unit ("next friday")
+    next_after     words after a weekday or unit ("vendredi prochain")
+    in             words before a number of units ("in 3 days")
+    at             words or phrases before a time ("at 10:00", "a las 10:00")
+    end            phrases => "end_of_week", "end_of_month" or "end_of_year"
+
+The enabled packs are merged into one matcher, so more packs do not make
+matching slower. A pack for another language is added to locale_packs
+under its code before the first capture, e.g. locale_packs["pt"] = {...}.
+"""
+
+locale_packs = {
+    "en": {
+        "weekdays": {
+            "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
+            "friday": 4, "saturday": 5, "sunday": 6
+        },
+        "abbreviations": {
+            "mon": 0, "tue": 1, "tues": 1, "wed": 2, "thu": 3, "thur": 3,
+            "thurs": 3, "fri": 4, "sat": 5, "sun": 6
+        },
+        "relative": {
+            "today": 0, "tomorrow": 1, "day after tomorrow": 2,
+            "yesterday": -1
+        },
+        "units": {
+            "day": "d", "days": "d", "week": "w", "weeks": "w",
+            "month": "m", "months": "m", "year": "y", "years": "y"
+        },
+        "next": ["next"],
+        "next_after": [],
+        "in": ["in"],
+        "at": ["at"],
+        "end": {
+            "end of week": "end_of_week", "end of the week": "end_of_week",
+            "end of month": "end_of_month",
+            "end of the month": "end_of_month",
+            "end of year": "end_of_year", "end of the year": "end_of_year"
+        }
+    },
+    "de": {
+        "weekdays": {
+            "montag": 0, "dienstag": 1, "mittwoch": 2, "donnerstag": 3,
+            "freitag": 4, "samstag": 5, "sonnabend": 5, "sonntag": 6
+        },
+        "abbreviations": {
+            "mo": 0, "di": 1, "mi": 2, "do": 3, "fr": 4, "sa": 5, "so": 6
+        },
+        "relative": {
+            "heute": 0, "morgen": 1, "übermorgen": 2, "uebermorgen": 2,
+            "gestern": -1
+        },
+        "units": {
+            "tag": "d", "tage": "d", "tagen": "d", "woche": "w", "wochen": "w",
+            "monat": "m", "monate": "m", "monaten": "m", "jahr": "y",
+            "jahre": "y", "jahren": "y"
+        },
+        "next": ["nächste", "nächsten", "nächster", "naechste", "naechsten",
+                 "naechster", "kommende", "kommenden"],
+        "next_after": [],
+        "in": ["in"],
+        "at": ["um"],
+        "end": {
+            "ende der woche": "end_of_week",
+            "ende des monats": "end_of_month", "monatsende": "end_of_month",
+            "ende des jahres": "end_of_year", "jahresende": "end_of_year"
+        }
+    },
+    "fr": {
+        "weekdays": {
+            "lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3,
+            "vendredi": 4, "samedi": 5, "dimanche": 6
+        },
+        "abbreviations": {
+            "lun": 0, "mar": 1, "mer": 2, "jeu": 3, "ven": 4, "sam": 5,
+            "dim": 6
+        },
+        "relative": {
+            "aujourd'hui": 0, "demain": 1, "après-demain": 2,
+            "apres-demain": 2, "hier": -1
+        },
+        "units": {
+            "jour": "d", "jours": "d", "semaine": "w", "semaines": "w",
+            "mois": "m", "an": "y", "ans": "y", "année": "y", "années": "y"
+        },
+        "next": [],
+        "next_after": ["prochain", "prochaine"],
+        "in": ["dans"],
+        "at": ["à"],
+        "end": {
+            "fin de la semaine": "end_of_week",
+            "fin du mois": "end_of_month",
+            "fin de l'année": "end_of_year"
+        }
+    },
+    "es": {
+        "weekdays": {
+            "lunes": 0, "martes": 1, "miércoles": 2, "miercoles": 2,
+            "jueves": 3, "viernes": 4, "sábado": 5, "sabado": 5,
+            "domingo": 6
+        },
+        "abbreviations": {
+            "lun": 0, "mar": 1, "mié": 2, "jue": 3, "vie": 4, "sáb": 5,
+            "dom": 6
+        },
+        "relative": {
+            "hoy": 0, "mañana": 1, "pasado mañana": 2, "ayer": -1
+        },
+        "units": {
+            "día": "d", "días": "d", "dia": "d", "dias": "d", "semana": "w",
+            "semanas": "w", "mes": "m", "meses": "m", "año": "y", "años": "y"
+        },
+        "next": ["próximo", "próxima", "proximo", "proxima"],
+        "next_after": ["próximo", "próxima", "proximo", "proxima"],
+        "in": ["en", "dentro de"],
+        "at": ["a las", "a la"],
+        "end": {
+            "fin de la semana": "end_of_week",
+            "fin de mes": "end_of_month", "fin del mes": "end_of_month",
+            "fin de año": "end_of_year", "fin del año": "end_of_year"
+        }
+    },
+    "it": {
+        "weekdays": {
+            "lunedì": 0, "lunedi": 0, "martedì": 1, "martedi": 1,
+            "mercoledì": 2, "mercoledi": 2, "giovedì": 3, "giovedi": 3,
+            "venerdì": 4, "venerdi": 4, "sabato": 5, "domenica": 6
+        },
+        "abbreviations": {
+            "lun": 0, "mar": 1, "mer": 2, "gio": 3, "ven": 4, "sab": 5,
+            "dom": 6
+        },
+        "relative": {
+            "oggi": 0, "domani": 1, "dopodomani": 2, "ieri": -1
+        },
+        "units": {
+            "giorno": "d", "giorni": "d", "settimana": "w", "settimane": "w",
+            "mese": "m", "mesi": "m", "anno": "y", "anni": "y"
+        },
+        "next": ["prossimo", "prossima"],
+        "next_after": ["prossimo", "prossima"],
+        "in": ["tra", "fra"],
+        "at": ["alle"],
+        "end": {
+            "fine della settimana": "end_of_week",
+            "fine mese": "end_of_month", "fine del mese": "end_of_month",
+            "fine anno": "end_of_year", "fine dell'anno": "end_of_year"
+        }
+    },
+    "nl": {
+        "weekdays": {
+            "maandag": 0, "dinsdag": 1, "woensdag": 2, "donderdag": 3,
+            "vrijdag": 4, "zaterdag": 5, "zondag": 6
+        },
+        "abbreviations": {
+            "ma": 0, "di": 1, "wo": 2, "do": 3, "vr": 4, "za": 5, "zo": 6
+        },
+        "relative": {
+            "vandaag": 0, "morgen": 1, "overmorgen": 2, "gisteren": -1
+        },
+        "units": {
+            "dag": "d", "dagen": "d", "week": "w", "weken": "w",
+            "maand": "m", "maanden": "m", "jaar": "y", "jaren": "y"
+        },
+        "next": ["volgende", "komende"],
+        "next_after": [],
+        "in": ["over", "binnen"],
+        "at": ["om"],
+        "end": {
+            "eind van de week": "end_of_week", "einde van de week": "end_of_week",
+            "eind van de maand": "end_of_month",
+            "einde van de maand": "end_of_month",
+            "eind van het jaar": "end_of_year",
+            "einde van het jaar": "end_of_year"
+        }
+    }
+}
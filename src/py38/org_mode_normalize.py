@@ -0,0 +1,548 @@
+# python version 3.8
+# UTF-8 encoding
+"""Apply the transformations of a capture to the entries of an org file.
+
+    python org_mode_normalize.py inbox.org --transform replace_relative_dates \\
+        --transform smart_line_break
+    python org_mode_normalize.py inbox.org --transform normalize_timestamps --diff
+
+Entries captured before an option was enabled are brought in line with
+the newer ones. The transformations are those of OrgmodeEntry:
+replace_absolute_dates, replace_relative_dates, smart_line_break and
+cleanup_spaces apply to the body lines of each entry, normalize_timestamps
+writes every timestamp in date_format with the right weekday. With
+--action the options (date format, locales, line break pattern) are read
+from the workflow variables of the action, else the defaults are used.
+
+Dates are resolved from the CREATED date of each entry, as they were when
+it was captured; entries without one keep their dates unless --today is
+given. Headlines, planning lines, drawers, blocks and tables are not
+changed except for their timestamps.
+
+The file is split into chunks before headlines that are transformed on a
+pool of processes; the results are written in order to a copy that
+replaces the file. Captures are not blocked meanwhile: entries appended
+during the run are copied unchanged (they are formatted already) while
+the file is locked for the swap.
+"""
+import os
+import re
+import sys
+
+from org_mode_transform import TransformEngine
+
+# Transformations that can be applied
+transforms = ["replace_absolute_dates", "replace_relative_dates",
+              "smart_line_break", "cleanup_spaces", "normalize_timestamps"]
+
+# Options of an OrgmodeEntry the transformations depend on (see start_worker)
+option_names = TransformEngine.options + [
+    "date_locales", "weekdays", "relative_dates", "date_tables",
+    "line_break_char"
+]
+
+headline_pattern = re.compile(r'\*+[ \t]')
+headline_bytes_pattern = re.compile(rb'\*+[ \t]')
+planning_pattern = re.compile(r'[ \t]*(?:DEADLINE|SCHEDULED|CLOSED):')
+drawer_pattern = re.compile(r'[ \t]*:[\w-]+:[ \t]*$')
+created_pattern = re.compile(r':CREATED:[ \t]*\[(\d{4})-(\d{2})-(\d{2})')
+# <2026-10-01>, [2026-10-01 thu 15:00], <2026-10-01 Do. 9:00 +1w>
+timestamp_pattern = re.compile(
+    r'([<\[])(\d{4})-(\d{1,2})-(\d{1,2})(?:[ \t]+[^\W\d_]+\.?)?'
+    r'((?:[ \t]+[^\s>\]][^>\]\n]*?)?)[ \t]*([>\]])')
+
+
+class NormalizeError(Exception):
+    """The org file cannot be normalized, e.g. it was changed meanwhile."""
+
+
+class Normalizer(object):
+    """Apply transformations to the entries of an org file on several processes."""
+    def __init__(self, org, transforms, today=None):
+        self.org = org
+        self.transforms = list(transforms)
+        # Day the dates of entries without a CREATED date are resolved from
+        # (None: they are not resolved)
+        self.today = today
+        self.workers = os.cpu_count() or 1
+        # Bytes of the file per chunk
+        self.chunk_size = 1 << 20
+        # Lines of context of a diff
+        self.context = 3
+        # Entries of the last run and the changed ones
+        self.entries = 0
+        self.changed = 0
+
+        # Compiled transformations (see normalize_chunk)
+        self.engine = None
+        # Timestamp => normalized timestamp
+        self.timestamps = {}
+
+        # A date table per day of creation: too many to keep in a file
+        org.date_cache = None
+        self.dates = "replace_absolute_dates" in self.transforms or \
+            "replace_relative_dates" in self.transforms
+
+    def run(self, path, diff=None, dry_run=False):
+        """Normalize the org file at path; return the number of changed entries.
+
+        With diff (a stream) a unified diff of the changes is written to it
+        instead; with dry_run the changes are only counted.
+        """
+        from org_mode_refile import Refiler
+
+        self.entries = self.changed = 0
+        with open(path, "rb") as source:
+            stat = os.fstat(source.fileno())
+            # A single chunk is not worth starting processes
+            results = self.map(self.get_chunks(source), diff is not None,
+                               stat.st_size > self.chunk_size)
+            if diff is not None:
+                writer = DiffWriter(diff, path, self.context)
+                for old, data, changes in results:
+                    writer.add(old, changes)
+                writer.close()
+                return self.changed
+            if dry_run:
+                for result in results:
+                    pass
+                return self.changed
+
+            directory, name = os.path.split(os.path.abspath(path))
+            temporary_file = os.path.join(directory,
+                                          ".%s.%s.tmp" % (name, os.getpid()))
+            target = os.open(temporary_file,
+                             os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                try:
+                    os.fchmod(target, stat.st_mode & 0o7777)
+                    for old, data, changes in results:
+                        Refiler.write_all(target, data)
+                    if self.changed:
+                        self.swap(path, source.fileno(), stat, target,
+                                  temporary_file)
+                finally:
+                    os.close(target)
+            finally:
+                if os.path.exists(temporary_file):
+                    os.remove(temporary_file)
+        return self.changed
+
+    def swap(self, path, fd, stat, target, temporary_file):
+        """Replace the file with the copy, under the lock of the writers."""
+        import fcntl
+
+        from org_mode_refile import Refiler
+        from org_mode_writer import InboxWriter
+
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(fd)
+            # Appends (also those read already) are the only changes
+            # expected; the bytes read must be unchanged
+            if InboxWriter.get_inode(path) != stat.st_ino or \
+                    current.st_size < self.size or \
+                    self.get_crc(fd, self.size) != self.crc:
+                raise NormalizeError("%s was changed while it was normalized; "
+                                     "it was left as it is" % path)
+            # Appended meanwhile
+            offset = self.size
+            while offset < current.st_size:
+                data = os.pread(fd, min(current.st_size - offset,
+                                        self.chunk_size), offset)
+                offset += Refiler.write_all(target, data)
+            os.fsync(target)
+            # Writers waiting for the lock reopen the new file
+            os.replace(temporary_file, path)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def get_crc(self, fd, size):
+        """Return the CRC-32 of the first size bytes of a file."""
+        from zlib import crc32
+
+        crc = 0
+        offset = 0
+        while offset < size:
+            block = os.pread(fd, min(size - offset, self.chunk_size), offset)
+            if not block:
+                break
+            crc = crc32(block, crc)
+            offset += len(block)
+        return crc
+
+    def get_chunks(self, stream):
+        """Yield (number of the first line, bytes) of the chunks of an org file.
+
+        A chunk ends before a headline after about chunk_size bytes. The
+        number of bytes read and their CRC-32 are kept in size and crc.
+        """
+        from zlib import crc32
+
+        self.size = 0
+        self.crc = 0
+        number = 0
+        rest = b""
+        while True:
+            block = stream.read(self.chunk_size)
+            self.size += len(block)
+            self.crc = crc32(block, self.crc)
+            if not block:
+                break
+            data = rest + block
+            end = self.find_split(data)
+            if end == 0:
+                rest = data
+                continue
+            yield number, data[:end]
+            number += data.count(b"\n", 0, end)
+            rest = data[end:]
+        if rest:
+            yield number, rest
+
+    @staticmethod
+    def find_split(data):
+        """Return the offset of the last headline of data (0: none after the start)."""
+        end = len(data)
+        while True:
+            end = data.rfind(b"\n*", 0, end)
+            if end == -1:
+                return 0
+            if headline_bytes_pattern.match(data, end + 1):
+                return end + 1
+
+    def map(self, chunks, diff=False, parallel=True):
+        """Yield (bytes, new bytes, changes) of each chunk in order (see normalize_chunk).
+
+        Up to two chunks per worker are transformed at once, so the memory
+        does not grow with the file.
+        """
+        from collections import deque
+
+        if self.workers <= 1 or not parallel:
+            for number, data in chunks:
+                yield self.count(data, self.normalize_chunk(number, data, diff))
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        options = {name: getattr(self.org, name) for name in option_names}
+        with ProcessPoolExecutor(self.workers, initializer=start_worker,
+                                 initargs=(options, self.transforms,
+                                           self.today)) as pool:
+            pending = deque()
+            for number, data in chunks:
+                pending.append((data, pool.submit(normalize_chunk, number, data,
+                                                  diff)))
+                if len(pending) >= 2 * self.workers:
+                    data, future = pending.popleft()
+                    yield self.count(data, future.result())
+            while pending:
+                data, future = pending.popleft()
+                yield self.count(data, future.result())
+
+    def count(self, old, result):
+        data, entries, changed, changes = result
+        self.entries += entries
+        self.changed += changed
+        return old, data, changes
+
+    def normalize_chunk(self, number, data, diff=False):
+        """Transform the entries of a chunk.
+
+        Returns (bytes, entries, changed entries, changes); with diff the
+        changes are (number of the first line, old lines, new lines) of
+        each changed entry, else None. Text before the first headline of
+        the file is not changed.
+        """
+        self.engine = self.org.get_engine()
+        text = data.decode('utf-8', 'surrogateescape')
+        # The newline that ends the chunk ends its last line
+        newline = "\n" if text.endswith("\n") else ""
+        lines = text[:len(text) - len(newline)].split("\n")
+        starts = [i for i, line in enumerate(lines)
+                  if headline_pattern.match(line)]
+        starts.append(len(lines))
+        output = lines[:starts[0]]
+        changed = 0
+        changes = [] if diff else None
+        for start, end in zip(starts, starts[1:]):
+            old = lines[start:end]
+            new = self.normalize_entry(old)
+            if new != old:
+                changed += 1
+                if diff:
+                    changes.append((number + start, old, new))
+            output.extend(new)
+        return (("\n".join(output) + newline).encode('utf-8', 'surrogateescape'),
+                len(starts) - 1, changed, changes)
+
+    def normalize_entry(self, lines):
+        """Return the transformed lines of an entry (its headline first)."""
+        timestamps = "normalize_timestamps" in self.transforms
+        today = self.today
+        if self.dates:
+            for line in lines[1:]:
+                match = created_pattern.search(line)
+                if match is not None:
+                    today = self.get_date(*match.groups())
+                    break
+
+        result = []
+        block = False
+        drawer = False
+        for i, line in enumerate(lines):
+            text = line.strip()
+            if block:
+                block = not text.lower().startswith("#+end")
+            elif text.lower().startswith("#+begin"):
+                block = True
+            elif drawer:
+                drawer = text.upper() != ":END:"
+            elif i == 0 or not text or text[0] in "#|" or \
+                    planning_pattern.match(line):
+                pass
+            elif drawer_pattern.match(line):
+                drawer = True
+            else:
+                result.extend(self.normalize_line(line, today))
+                continue
+            if timestamps and not block:
+                line = self.normalize_timestamps(line)
+            result.append(line)
+        return result
+
+    def normalize_line(self, line, today):
+        """Return the lines a body line becomes."""
+        engine = self.engine
+        transforms = self.transforms
+        end = "\r" if line.endswith("\r") else ""
+        text = line[:len(line) - len(end)]
+        indent = text[:len(text) - len(text.lstrip())]
+        text = text[len(indent):]
+
+        if self.dates and today is not None:
+            text, count = engine.pattern("dates").replace(
+                text, today,
+                absolute="replace_absolute_dates" in transforms,
+                relative="replace_relative_dates" in transforms)
+        if "smart_line_break" in transforms:
+            text = engine.convert_line_breaks(text.rstrip())[0]
+        lines = []
+        for part in text.split("\n"):
+            if "cleanup_spaces" in transforms:
+                part = engine.remove_double_spaces(part)[0]
+                part = engine.remove_leading_trailling_spaces(part)[0]
+            if "normalize_timestamps" in transforms:
+                part = self.normalize_timestamps(part)
+            lines.append((indent + part if part else part) + end)
+        return lines
+
+    def normalize_timestamps(self, line):
+        """Write the timestamps of a line in date_format with the right weekday."""
+        if "-" not in line:
+            return line
+        return timestamp_pattern.sub(self.format_timestamp, line)
+
+    def format_timestamp(self, match):
+        try:
+            return self.timestamps[match.group()]
+        except KeyError:
+            pass
+        start, year, month, day, rest, end = match.groups()
+        date = self.get_date(year, month, day)
+        if date is None or start + end not in ["<>", "[]"]:
+            timestamp = match.group()
+        else:
+            matcher = self.engine.pattern("dates")
+            timestamp = matcher.add_time(matcher.format_date(date),
+                                         " ".join(rest.split()))
+            if start == "[" and timestamp[:1] + timestamp[-1:] == "<>":
+                timestamp = "[%s]" % timestamp[1:-1]
+        self.timestamps[match.group()] = timestamp
+        return timestamp
+
+    @staticmethod
+    def get_date(year, month, day):
+        import datetime
+
+        try:
+            return datetime.date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+
+
+class DiffWriter(object):
+    """Write the changed entries of the chunks of a file as one unified diff.
+
+    The hunks get context lines before and after like those of diff -u,
+    also across the chunks: the lines of the previous chunk are kept.
+    """
+    def __init__(self, stream, path, context=3):
+        self.stream = stream
+        self.path = path
+        self.context = context
+        # Lines of the previous and the current chunk, the number of the
+        # first one and the lines of the current chunk
+        self.lines = []
+        self.first = 0
+        self.current = 0
+        # Lines added before the current hunk
+        self.offset = 0
+        # [old start, old end, new start, lines] of the hunk being collected
+        self.hunk = None
+        self.started = False
+
+    def add(self, data, changes):
+        """Add a chunk (bytes) and its changes (see Normalizer.normalize_chunk)."""
+        import difflib
+
+        text = data.decode('utf-8', 'surrogateescape')
+        if text.endswith("\n"):
+            text = text[:-1]
+        lines = text.split("\n")
+        start = self.first + len(self.lines)
+        if self.hunk is not None and start - self.hunk[1] > 2 * self.context:
+            # No change of this chunk joins it
+            self.write_hunk()
+        # The chunk before the previous one is dropped
+        dropped = len(self.lines) - self.current
+        self.lines = self.lines[dropped:] + lines
+        self.first += dropped
+        self.current = len(lines)
+        for number, old, new in changes:
+            matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag != "equal":
+                    self.change(number + i1, number + i2, new[j1:j2])
+
+    def change(self, start, end, new):
+        """Add the replacement of the old lines start to end by new."""
+        context = self.context
+        hunk = self.hunk
+        if hunk is not None and start - hunk[1] > 2 * context:
+            self.write_hunk()
+            hunk = None
+        if hunk is None:
+            before = max(0, start - context)
+            hunk = self.hunk = [before, before, before + self.offset, []]
+        hunk[3].extend(" " + line for line in self.get_lines(hunk[1], start))
+        hunk[3].extend("-" + line for line in self.get_lines(start, end))
+        hunk[3].extend("+" + line for line in new)
+        hunk[1] = end
+        self.offset += len(new) - (end - start)
+
+    def get_lines(self, start, end):
+        return self.lines[start - self.first:end - self.first]
+
+    def write_hunk(self):
+        start, end, new_start, lines = self.hunk
+        after = self.get_lines(end, end + self.context)
+        lines.extend(" " + line for line in after)
+        end += len(after)
+        new_count = sum(1 for line in lines if line[0] != "-")
+        if not self.started:
+            self.stream.write("--- %s\n+++ %s\n" % (self.path, self.path))
+            self.started = True
+        self.stream.write("@@ -%s +%s @@\n" % (
+            format_range(start, end), format_range(new_start,
+                                                   new_start + new_count)))
+        for line in lines:
+            self.stream.write(line + "\n")
+        self.hunk = None
+
+    def close(self):
+        if self.hunk is not None:
+            self.write_hunk()
+
+
+def format_range(start, end):
+    """Return the range of the lines start to end of a hunk header (like difflib)."""
+    length = end - start
+    if length == 1:
+        return "%d" % (start + 1)
+    if not length:
+        return "%d,0" % start
+    return "%d,%d" % (start + 1, length)
+
+
+# Normalizer of a worker process (see start_worker)
+worker = None
+
+
+def start_worker(options, transforms, today):
+    """Create the Normalizer of a worker process from the options of an OrgmodeEntry."""
+    global worker
+
+    from org_mode_entry import OrgmodeEntry
+
+    org = OrgmodeEntry()
+    for name, value in options.items():
+        setattr(org, name, value)
+    worker = Normalizer(org, transforms, today)
+
+
+def normalize_chunk(number, data, diff=False):
+    return worker.normalize_chunk(number, data, diff)
+
+
+def main(argv=None):
+    import argparse
+    import datetime
+
+    parser = argparse.ArgumentParser(
+        description="Apply the transformations of a capture to the entries "
+                    "of an existing org-mode file.")
+    parser.add_argument("file")
+    parser.add_argument("--transform", action="append", default=[],
+                        choices=transforms, required=True,
+                        help="transformation to apply (repeat for several)")
+    parser.add_argument("--action", choices=["todo", "note", "inspiration"],
+                        help="read the options from the workflow variables "
+                             "of the action")
+    parser.add_argument("--today", metavar="YYYY-MM-DD",
+                        help="resolve the dates of entries without a CREATED "
+                             "date from this day")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of processes (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="count the changed entries, do not write them")
+    parser.add_argument("--diff", action="store_true",
+                        help="print the changes as a unified diff, do not "
+                             "write them")
+    args = parser.parse_args(argv)
+
+    today = None
+    if args.today is not None:
+        try:
+            today = datetime.datetime.strptime(args.today, "%Y-%m-%d").date()
+        except ValueError:
+            parser.error("--today must be YYYY-MM-DD, not %r" % args.today)
+    if args.action is not None:
+        from org_mode_capture_run import configure
+
+        org = configure(args.action)
+    else:
+        from org_mode_entry import OrgmodeEntry
+
+        org = OrgmodeEntry()
+
+    normalizer = Normalizer(org, args.transform, today)
+    normalizer.workers = max(1, args.workers)
+    try:
+        changed = normalizer.run(args.file,
+                                 sys.stdout if args.diff else None,
+                                 args.dry_run)
+    except (OSError, NormalizeError) as error:
+        parser.exit(1, "%s\n" % error)
+
+    message = "%s of %s entries of %s" % (changed, normalizer.entries,
+                                          args.file)
+    if args.diff or args.dry_run:
+        print("Would change %s." % message, file=sys.stderr)
+    else:
+        print("Changed %s." % message)
+
+
+if __name__ == "__main__":
+    main()
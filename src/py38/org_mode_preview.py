@@ -0,0 +1,130 @@
+# python version 3.8
+# UTF-8 encoding
+"""Live preview of a capture for an Alfred Script Filter.
+
+    python org_mode_preview.py todo "{query}"
+
+prints the Alfred JSON of what the capture of the query would write: the
+heading with its priority, the DEADLINE and SCHEDULED dates, the body and
+every converted date with the words it was read from. Nothing is written.
+
+The preview runs in the capture daemon if it is running (see
+org_mode_daemon), whose warm OrgmodeEntry keeps the date scan of the last
+query: while the user types, only the end of the query is scanned again.
+Without the daemon the scan is kept in the file preview_state of the
+workflow's data directory, with the signature of the date matcher that made
+it; a scan of another vocabulary or date format is not reused.
+"""
+import os
+import sys
+
+
+def preview(query, action, path=None, timeout=1.0):
+    """Return the Alfred JSON of a query, formatted by the daemon or in-process."""
+    from org_mode_daemon import get_socket_path, send
+
+    if path is None:
+        path = get_socket_path()
+    request = {"entry": query, "action": action, "environ": dict(os.environ),
+               "preview": True}
+    try:
+        response = send(path, request, timeout)
+    except OSError:
+        # No daemon, or a hung one (see org_mode_daemon.capture)
+        return run_preview(query, action)
+
+    if "error" in response:
+        raise RuntimeError("Capture daemon: %s" % response["error"])
+    return response["message"]
+
+
+def run_preview(query, action, environ=None):
+    """Format the preview in-process; the date scan is kept in a state file."""
+    import marshal
+
+    from org_mode_capture_run import configure
+
+    environ = os.environ if environ is None else environ
+    org = configure(action, environ)
+    data_directory = environ.get("alfred_workflow_data") or \
+        os.path.expanduser("~/.org-mode-capture")
+    state_file = os.path.join(data_directory, "preview_state")
+
+    matcher = None
+    if org.replace_absolute_dates is True or org.replace_relative_dates is True:
+        matcher = org.get_engine().pattern("dates")
+        try:
+            with open(state_file, "rb") as state:
+                signature, previous = marshal.loads(state.read())
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            pass
+        else:
+            # Made by a matcher with the same locales and words
+            if signature == matcher.get_signature():
+                matcher.previous = previous
+
+    output = format_preview(org, query)
+
+    if matcher is not None and matcher.previous is not None:
+        os.makedirs(data_directory, exist_ok=True)
+        temporary_file = "%s.%s.tmp" % (state_file, os.getpid())
+        with open(temporary_file, "wb") as state:
+            marshal.dump((matcher.get_signature(), matcher.previous), state)
+        os.replace(temporary_file, state_file)
+    return output
+
+
+def format_preview(org, query):
+    """Return the Alfred JSON of the entry a capture of query would add."""
+    import json
+
+    # Like org_mode_capture_run.capture
+    string = org.encode('TODO ' + query)
+    now = org.get_now()
+    entry = org.format(string, now)
+    items = org.split_string(string)
+    dates = []
+    if len(items) > 1 and (org.replace_absolute_dates is True or
+                           org.replace_relative_dates is True):
+        # The scan of format is reused
+        dates = org.get_engine().find_dates(items[1], now.date())
+
+    planning = []
+    if entry.deadline is not None:
+        planning.append(org.deadline_keyword + entry.deadline)
+    if entry.scheduled is not None:
+        planning.append(org.scheduled_keyword + entry.scheduled)
+    text = entry.text.lstrip("\n")
+    result = [{
+        "title": entry.heading,
+        "subtitle": "  ".join(planning) or "Add to %s" % org.get_filename(),
+        "arg": query,
+        "valid": bool(query.strip()),
+        "text": {"copy": text, "largetype": text}
+    }]
+    if entry.body:
+        result.append({
+            "title": " ⏎ ".join(entry.body.split("\n")),
+            "subtitle": "Body",
+            "valid": False
+        })
+    for start, end, timestamp in dates:
+        result.append({
+            "title": timestamp,
+            "subtitle": "from \"%s\"" % items[1][start:end],
+            "valid": False
+        })
+    return json.dumps({"items": result}, ensure_ascii=False)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] not in ["todo", "note", "inspiration"]:
+        sys.stderr.write("usage: org_mode_preview.py todo|note|inspiration QUERY\n")
+        return 2
+    print(preview(argv[1], argv[0]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
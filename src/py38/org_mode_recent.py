@@ -0,0 +1,120 @@
+# python version 3.8
+# UTF-8 encoding
+import fcntl
+import os
+import struct
+import time
+from contextlib import contextmanager
+
+
+class RecentEntries(object):
+    """Persistent set of the hashes of recently captured entries.
+
+    Detects entries that are captured twice within window seconds, e.g. by a
+    double-fired hotkey or a retrying script, without reading the org file.
+    The hashes are kept in a small ring buffer file of capacity records
+    (8 byte hash, capture time); a lookup reads the file once and searches
+    it as bytes, which takes microseconds. An entry is checked and recorded
+    under one lock (reserve), so that of two captures at once only one
+    passes; if it cannot be written, the record is dropped (release).
+    """
+    header = struct.Struct("<8sII")  # magic, capacity, next slot
+    record = struct.Struct("<8sd")  # hash, capture time
+    magic = b"ORGRCT1\0"
+
+    def __init__(self, path, window=600, capacity=1024):
+        self.path = path
+        self.window = window  # seconds
+        self.capacity = capacity
+
+    @staticmethod
+    def normalize(text):
+        """Ignore case and differences in whitespace."""
+        return " ".join(text.split()).casefold()
+
+    def get_hash(self, text):
+        from hashlib import blake2b
+
+        return blake2b(self.normalize(text).encode('utf-8'),
+                       digest_size=8).digest()
+
+    def reserve(self, text, now=None):
+        """Return True if text was recorded within window before; otherwise record it.
+
+        A duplicate is not recorded again, so that repeated captures do not
+        extend the window.
+        """
+        if now is None:
+            now = time.time()
+        digest = self.get_hash(text)
+        with self.open() as (fd, data):
+            if self.check_data(data, digest, now):
+                return True
+            self.add_data(fd, data, digest, now)
+            return False
+
+    def release(self, text):
+        """Drop the record of text, e.g. if the entry could not be written."""
+        digest = self.get_hash(text)
+        with self.open() as (fd, data):
+            index = self.find(data, digest)
+            if index is not None:
+                # Expired
+                os.pwrite(fd, self.record.pack(digest, 0.0),
+                          self.get_offset(index))
+
+    @contextmanager
+    def open(self):
+        """Lock the file; yield its descriptor and data."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.read(fd, self.header.size +
+                           self.capacity * self.record.size)
+            try:
+                magic, capacity, slot = self.header.unpack_from(data)
+            except struct.error:
+                magic = None
+            if magic != self.magic or capacity != self.capacity:
+                # New (or resized) file
+                data = self.header.pack(self.magic, self.capacity, 0)
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, data, 0)
+            yield fd, data
+        finally:
+            os.close(fd)
+
+    def check_data(self, data, digest, now):
+        index = self.find(data, digest)
+        if index is None:
+            return False
+        captured = self.record.unpack_from(data, self.get_offset(index))[1]
+        return now - captured <= self.window
+
+    def add_data(self, fd, data, digest, now):
+        index = self.find(data, digest)
+        if index is not None:
+            # Refresh the record
+            os.pwrite(fd, self.record.pack(digest, now), self.get_offset(index))
+            return
+        slot = self.header.unpack_from(data)[2]
+        os.pwrite(fd, self.record.pack(digest, now), self.get_offset(slot))
+        os.pwrite(fd, self.header.pack(self.magic, self.capacity,
+                                       (slot + 1) % self.capacity), 0)
+
+    def find(self, data, digest):
+        """Return the index of the record of digest in data or None."""
+        position = data.find(digest, self.header.size)
+        while position != -1:
+            index, rest = divmod(position - self.header.size, self.record.size)
+            if rest == 0:
+                return index
+            # The bytes matched across record boundaries
+            position = data.find(digest, position + 1)
+        return None
+
+    def get_offset(self, index):
+        return self.header.size + index * self.record.size
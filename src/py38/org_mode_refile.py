@@ -0,0 +1,204 @@
+# python version 3.8
+# UTF-8 encoding
+import fcntl
+import os
+import re
+
+from org_mode_index import HeadlineIndex
+
+stars_pattern = re.compile(rb'^(\*+)(?=[ \t])', re.MULTILINE)
+
+
+class Refiler(object):
+    """Insert entries at the end of the subtree of a heading of an org file.
+
+    The heading is looked up in the headline index of the file
+    (org_mode_index), e.g. "Inbox" or "Projects/Website" for a nested
+    heading; missing headings are created. The entries are moved to the
+    level below the heading. If the subtree ends the file the entries are
+    appended; otherwise a copy of the file with the entries inserted
+    replaces it atomically. The part before the insertion point is copied
+    by the kernel (copy_file_range, a reflink on some file systems), the
+    file is never loaded as a whole. With shift_in_place the tail is moved
+    within the file instead, which is faster but not crash-safe.
+    """
+    block_size = 1 << 20  # bytes copied at once without copy_file_range
+    search_block_size = 4096  # records searched at once
+
+    def __init__(self, path, heading, shift_in_place=False):
+        self.path = path
+        self.heading = heading
+        self.shift_in_place = shift_in_place
+        self.index = HeadlineIndex(path)
+
+    def insert(self, string):
+        """Insert string (formatted entries) under the heading.
+
+        Returns the offset and the bytes that were written there.
+        """
+        data = string.encode('utf-8')
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if self.get_inode() == os.fstat(fd).st_ino:
+                    break
+                # Replaced meanwhile (e.g. by another refile)
+                os.close(fd)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+            self.index.update()
+            level, offset, missing = self.find_target()
+            # Headings that have to be created first
+            prefix = b"".join(b"\n%s %s" % (b"*" * (level + i + 1),
+                                             title.encode('utf-8'))
+                              for i, title in enumerate(missing))
+            data = prefix + self.set_level(data, level + len(missing) + 1)
+
+            size = os.fstat(fd).st_size
+            if offset is None or offset >= size:
+                os.lseek(fd, 0, os.SEEK_END)
+                self.write_all(fd, data)
+                self.index.extend(size, data)
+                offset = size
+            else:
+                # Insert before the next headline: the entries start a line
+                # and end with one
+                data = data[1:] if data[:1] == b"\n" else data
+                if data[-1:] != b"\n":
+                    data += b"\n"
+                if self.shift_in_place:
+                    self.shift(fd, offset, size, data)
+                else:
+                    self.replace(fd, offset, size, data)
+                self.index.insert(offset, data)
+        finally:
+            os.close(fd)
+        return offset, data
+
+    def get_inode(self):
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def find_target(self):
+        """Return (level, insertion offset, missing titles) of the heading.
+
+        The offset is None at the end of the file. Without any matching
+        heading the level is 0. The records of the index are searched as text,
+        they are not parsed.
+        """
+        titles = [title for title in self.heading.split("/") if title]
+        level, start, end = 0, 0, len(self.index.records)
+        for depth, title in enumerate(titles):
+            i = self.find_title(title, start, end)
+            if i is None:
+                return level, self.get_offset(end), titles[depth:]
+            # Continue in the subtree of the heading
+            level = self.index.get_levels(i, i + 1)[0]
+            start, end = i + 1, self.get_subtree_end(level, i + 1, end)
+        return level, self.get_offset(end), []
+
+    def find_title(self, title, start, end):
+        """Return the index of the first headline start to end with title."""
+        pattern = re.compile(r'^(?:[^\t\n]*\t){7}%s(?:[ \t]+:\S+:)?$' %
+                             re.escape(title), re.MULTILINE)
+        return self.search_records(pattern, start, end)
+
+    def get_subtree_end(self, level, start, end):
+        """Return the index of the first headline start to end with a level up to level."""
+        pattern = re.compile(r'^\d+\t(?:%s)\t' % "|".join(
+            str(n) for n in range(1, level + 1)), re.MULTILINE)
+        i = self.search_records(pattern, start, end)
+        return end if i is None else i
+
+    def search_records(self, pattern, start, end):
+        """Return the index of the first record start to end matching pattern.
+
+        The records are searched in blocks, so a match near start is found
+        without joining all records.
+        """
+        for block in range(start, end, self.search_block_size):
+            block_end = min(end, block + self.search_block_size)
+            text = self.index.get_text(block, block_end)
+            match = pattern.search(text)
+            if match is not None:
+                return block + text.count("\n", 0, match.start())
+        return None
+
+    def get_offset(self, i):
+        offsets = self.index.offsets
+        return offsets[i] if i < len(offsets) else None
+
+    @staticmethod
+    def set_level(data, level):
+        """Move the headlines of data so that the first one has level."""
+        match = stars_pattern.search(data)
+        if match is None:
+            return data
+        delta = level - len(match.group(1))
+        if delta == 0:
+            return data
+        return stars_pattern.sub(
+            lambda m: b"*" * max(1, len(m.group(1)) + delta), data)
+
+    def replace(self, fd, offset, size, data):
+        """Write a copy of the file with data inserted at offset and swap it in."""
+        directory, name = os.path.split(os.path.abspath(self.path))
+        temporary_file = os.path.join(directory,
+                                      ".%s.%s.tmp" % (name, os.getpid()))
+        target = os.open(temporary_file,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            try:
+                os.fchmod(target, os.fstat(fd).st_mode & 0o7777)
+                self.copy(fd, target, 0, offset)
+                self.write_all(target, data)
+                self.copy(fd, target, offset, size - offset)
+                os.fsync(target)
+            finally:
+                os.close(target)
+            # Writers waiting for the lock reopen the new file
+            os.replace(temporary_file, self.path)
+        except BaseException:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+            raise
+
+    def shift(self, fd, offset, size, data):
+        """Move the tail from offset on by len(data) and write data into the gap."""
+        end = size
+        while end > offset:
+            start = max(offset, end - self.block_size)
+            block = os.pread(fd, end - start, start)
+            os.pwrite(fd, block, start + len(data))
+            end = start
+        os.pwrite(fd, data, offset)
+        os.fsync(fd)
+
+    def copy(self, source, target, offset, count):
+        """Copy count bytes from offset of source to the end of target."""
+        copy_file_range = getattr(os, "copy_file_range", None)
+        while count > 0:
+            if copy_file_range is not None:
+                try:
+                    copied = copy_file_range(source, target, count, offset)
+                except OSError:
+                    # Not supported between these file systems
+                    copy_file_range = None
+                    continue
+            else:
+                block = os.pread(source, min(count, self.block_size), offset)
+                copied = self.write_all(target, block)
+            if copied == 0:
+                raise IOError("%s is shorter than expected" % self.path)
+            offset += copied
+            count -= copied
+
+    @staticmethod
+    def write_all(fd, data):
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        return written
@@ -0,0 +1,201 @@
+# python version 3.8
+# UTF-8 encoding
+import mmap
+import os
+import re
+import time
+
+timestamp_pattern = re.compile(rb'[<\[](\d{4}-\d{2}-\d{2})')
+
+# Period => strftime format of the shard names
+period_formats = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+    "year": "%Y"
+}
+
+
+class InboxRotator(object):
+    """Roll an org file over to a shard when it grows too large or too old.
+
+    Assign an instance to InboxWriter.rotator: before an append the writer
+    asks whether the file (inbox.org) is larger than max_size bytes or was
+    started in an earlier period ("day", "week", "month" or "year") and
+    then renames it to a shard (inbox-2026-10.org) while it holds the lock;
+    the append goes to a new inbox.org. With compress the shard is gzipped.
+
+    The manifest next to the file (inbox.shards.json) lists the shards with
+    the period they were written in (start, end), the range of the dates of
+    their timestamps (first_date, last_date) and their size, so that readers
+    can skip shards (see get_shards).
+    """
+    def __init__(self, max_size=None, period=None, compress=False):
+        if period is not None and period not in period_formats:
+            raise ValueError("Unknown rotation period: %s (use one of %s)" %
+                             (period, ", ".join(sorted(period_formats))))
+        self.max_size = max_size
+        self.period = period
+        self.compress = compress
+
+    def check(self, path, size):
+        """Return True if the file at path with size bytes must be rotated."""
+        if size == 0:
+            return False
+        if self.max_size is not None and size >= self.max_size:
+            return True
+        if self.period is not None:
+            started = load_manifest(path).get("started")
+            if started is None:
+                # The file was started before rotation was enabled
+                self.set_started(path, time.localtime())
+                return False
+            return self.get_period(time.strptime(started, "%Y-%m-%d")) != \
+                self.get_period(time.localtime())
+        return False
+
+    def get_period(self, date):
+        return time.strftime(period_formats[self.period or "month"], date)
+
+    def set_started(self, path, date):
+        manifest = load_manifest(path)
+        manifest["started"] = time.strftime("%Y-%m-%d", date)
+        save_manifest(path, manifest)
+
+    def rotate(self, path):
+        """Rename the file at path to a new shard; return the path of the shard.
+
+        The caller holds the lock of the file.
+        """
+        manifest = load_manifest(path)
+        now = time.localtime()
+        started = manifest.get("started")
+        started = time.strptime(started, "%Y-%m-%d") if started else now
+
+        root, extension = os.path.splitext(path)
+        name = "%s-%s" % (root, self.get_period(started))
+        shard = name + extension
+        number = 1
+        while os.path.exists(shard) or os.path.exists(shard + ".gz"):
+            # Several shards in one period (rotated by size)
+            number += 1
+            shard = "%s-%s%s" % (name, number, extension)
+
+        first_date, last_date = get_date_range(path)
+        os.rename(path, shard)
+        # The headline index, the search index and the datetree cache stay
+        # valid for an uncompressed shard
+        directory, old_name = os.path.split(path)
+        new_name = os.path.basename(shard)
+        for suffix in ["index", "search", "search.log", "datetree"]:
+            sidecar = os.path.join(directory, ".%s.%s" % (old_name, suffix))
+            if not os.path.exists(sidecar):
+                continue
+            if self.compress:
+                os.remove(sidecar)
+            else:
+                os.rename(sidecar, os.path.join(
+                    directory, ".%s.%s" % (new_name, suffix)))
+
+        size = os.path.getsize(shard)
+        if self.compress:
+            shard = compress_file(shard)
+        manifest.setdefault("shards", []).append({
+            "file": os.path.basename(shard),
+            "start": time.strftime("%Y-%m-%d", started),
+            "end": time.strftime("%Y-%m-%d", now),
+            "first_date": first_date,
+            "last_date": last_date,
+            "size": size,
+            "compressed": self.compress
+        })
+        manifest["started"] = time.strftime("%Y-%m-%d", now)
+        save_manifest(path, manifest)
+        return shard
+
+
+def get_manifest_path(path):
+    return os.path.splitext(path)[0] + ".shards.json"
+
+
+def load_manifest(path):
+    import json
+
+    try:
+        with open(get_manifest_path(path)) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    import json
+
+    manifest_path = get_manifest_path(path)
+    temporary_path = "%s.%s.tmp" % (manifest_path, os.getpid())
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+
+def get_date_range(path):
+    """Return the first and the last date (YYYY-MM-DD) of the timestamps in a file."""
+    first_date = last_date = None
+    with open(path, "rb") as org_file:
+        if os.fstat(org_file.fileno()).st_size == 0:
+            return None, None
+        with mmap.mmap(org_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for date in set(timestamp_pattern.findall(data)):
+                if first_date is None or date < first_date:
+                    first_date = date
+                if last_date is None or date > last_date:
+                    last_date = date
+    if first_date is None:
+        return None, None
+    return first_date.decode('ascii'), last_date.decode('ascii')
+
+
+def compress_file(path):
+    """Replace a file by a gzipped copy; return the path of the copy."""
+    import gzip
+    import shutil
+
+    compressed_path = path + ".gz"
+    with open(path, "rb") as source, \
+            gzip.open(compressed_path + ".tmp", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.replace(compressed_path + ".tmp", compressed_path)
+    os.remove(path)
+    return compressed_path
+
+
+def get_shards(path, first_date=None, last_date=None):
+    """Return the shards of path that can contain dates from first_date to last_date.
+
+    Dates are strings (YYYY-MM-DD); without them all shards are returned.
+    The current file comes last.
+    """
+    directory = os.path.dirname(path)
+    shards = []
+    for shard in load_manifest(path).get("shards", []):
+        if first_date is not None and (shard["last_date"] is None or
+                                       shard["last_date"] < first_date):
+            continue
+        if last_date is not None and (shard["first_date"] is None or
+                                      shard["first_date"] > last_date):
+            continue
+        shards.append(os.path.join(directory, shard["file"]))
+    if os.path.exists(path):
+        shards.append(path)
+    return shards
+
+
+def open_shard(path, mode="r"):
+    """Open a shard for reading text (mode "rb": bytes), compressed or not."""
+    encoding = None if "b" in mode else 'utf-8'
+    if path.endswith(".gz"):
+        import gzip
+
+        return gzip.open(path, mode.replace("r", "rt") if encoding else mode,
+                         encoding=encoding)
+    return open(path, mode, encoding=encoding)
@@ -0,0 +1,583 @@
+# python version 3.8
+# UTF-8 encoding
+"""Full-text search of captured entries for an Alfred Script Filter.
+
+    python org_mode_search.py "{query}"
+
+lists the headlines of todos_inbox, notes_inbox, inspirations_inbox and
+their targets whose heading or body contain every word of the query (the
+last word may be the start of a word), the latest first. Each result
+passes the path as arg and the line of the headline as the variable line,
+e.g. for emacsclient -n +$line "$path".
+
+The words are looked up in an inverted index next to each org file (see
+SearchIndex), so that no org file is read while typing. The shards the
+files were rotated to are searched as well; compressed shards are read.
+"""
+import fcntl
+import marshal
+import mmap
+import os
+import re
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+
+# Start of a headline
+headline_start = re.compile(rb'^\*+[ \t]', re.MULTILINE)
+# Org timestamps and the words of the index
+timestamp_pattern = re.compile(r'[<\[]\d{4}-\d\d-\d\d[^>\]\n]*[>\]]')
+term_pattern = re.compile(r'\w{2,}')
+word_pattern = re.compile(r'\w+')
+
+
+class SearchIndex(object):
+    """Persistent inverted index of the words of the headlines of an org file.
+
+    Each word (term) maps to the ascending numbers of the headlines whose
+    heading or body contain it; the byte offset and the line of each
+    headline are kept as well. The index is kept next to the org file
+    (.<name>.search) and brought up to date by update(): appended text is
+    scanned from the last indexed headline on; a file that was replaced,
+    shrank or changed anywhere in the indexed text (checked with its CRC-32)
+    is scanned again completely. extend() adds an append without reading
+    the org file.
+
+    Index file: b"ORGSRC3 <state length> <headlines> <terms>\n", the
+    marshaled state of the indexed org file (size, mtime, inode, lines,
+    headlines, offset of the last headline and CRC-32 of the text), then
+    arrays of the starts of the terms and of their postings, the offsets and
+    lines of the headlines, the sorted terms (one per line) and the
+    postings. The file is memory mapped: a search reads only the postings
+    of its terms. Appends go to a log next to it (.<name>.search.log) as
+    length-prefixed marshaled records with the new state, headlines and
+    postings; the log is merged into the index file when it grows larger
+    than log_size.
+    """
+    log_size = 1 << 18
+    # Words of the org syntax
+    stop_terms = {"properties", "end", "created", "deadline", "scheduled",
+                  "closed"}
+
+    def __init__(self, path):
+        self.path = path
+        directory, name = os.path.split(os.path.abspath(path))
+        self.index_file = os.path.join(directory, ".%s.search" % name)
+        self.log_file = self.index_file + ".log"
+        self.reset()
+
+    def reset(self):
+        # State of the org file covered by the index: size, mtime, inode,
+        # number of lines, number of headlines, offset of the last headline
+        # and the CRC-32 of the indexed text
+        self.state = (0, 0, 0, 0, 0, 0, 0)
+        # The index file (memory mapped), its number of headlines, the
+        # offsets of its sections and the starts of its terms and postings
+        self.data = None
+        self.count = 0
+        self.sections = (0, 0, 0, 0)
+        self.term_starts = array("I")
+        self.posting_starts = array("I")
+        # Headlines and postings added since (the log and new scans)
+        self.added_offsets = []
+        self.added_lines = []
+        self.added_terms = {}
+
+    # Reading and writing
+    def load(self):
+        """Map the index file and read its log; return False if there is no index file."""
+        self.reset()
+        try:
+            with open(self.index_file, "rb") as index_file:
+                data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return False
+        end = data.find(b"\n", 0, 64)
+        fields = data[:end].split()
+        if len(fields) != 4 or fields[0] != b"ORGSRC3":
+            return False
+        length, count, terms = [int(field) for field in fields[1:]]
+        position = end + 1
+        try:
+            self.state = marshal.loads(data[position:position + length])
+        except (EOFError, ValueError, TypeError):
+            self.reset()
+            return False
+        position += length
+        self.term_starts.frombytes(data[position:position + 4 * (terms + 1)])
+        position += 4 * (terms + 1)
+        self.posting_starts.frombytes(
+            data[position:position + 4 * (terms + 1)])
+        position += 4 * (terms + 1)
+        # Offsets, lines, term text, postings
+        self.sections = (position, position + 8 * count,
+                         position + 12 * count,
+                         position + 12 * count + self.term_starts[-1] + 1)
+        self.data = data
+        self.count = count
+        for record in self.read_log():
+            self.apply(record)
+        return True
+
+    def read_log(self):
+        """Yield the records of the log (a torn last record is skipped)."""
+        try:
+            with open(self.log_file, "rb") as log_file:
+                data = log_file.read()
+        except FileNotFoundError:
+            return
+        position = 0
+        while True:
+            newline = data.find(b"\n", position)
+            if newline == -1:
+                return
+            try:
+                end = newline + 1 + int(data[position:newline])
+                record = marshal.loads(data[newline + 1:end])
+            except (EOFError, ValueError, TypeError):
+                return
+            yield record
+            position = end
+
+    def apply(self, record):
+        """Add a record of the log; records the index file has are skipped."""
+        state, first, offsets, lines, terms = record
+        if first != self.get_count():
+            return
+        self.add(offsets, lines, terms)
+        self.state = state
+
+    def add(self, offsets, lines, terms):
+        count = self.get_count()
+        self.added_offsets.extend(offsets)
+        self.added_lines.extend(lines)
+        for term, numbers in terms.items():
+            added = self.added_terms.setdefault(term, [])
+            if numbers[0] < count:
+                # The last headline got more text
+                last = added[-1:] or self.get_postings(term)[-1:]
+                if last and last[0] == numbers[0]:
+                    numbers = numbers[1:]
+            added.extend(numbers)
+
+    def save(self):
+        """Write the whole index at once and empty the log (under the log's lock)."""
+        terms = {}
+        for number in range(len(self.term_starts) - 1):
+            terms[self.get_term(number)] = self.get_main_postings(number)
+        for term, numbers in self.added_terms.items():
+            if numbers:
+                terms.setdefault(term, array("I")).extend(numbers)
+        names = sorted(term.encode("utf-8") for term in terms)
+        term_starts, posting_starts = array("I", [0]), array("I", [0])
+        postings = array("I")
+        for name in names:
+            term_starts.append(term_starts[-1] + len(name) + 1)
+            postings.extend(terms[name.decode("utf-8")])
+            posting_starts.append(len(postings))
+        offsets = array("Q", (self.get_offset(number)
+                              for number in range(self.get_count())))
+        lines = array("I", (self.get_line(number)
+                            for number in range(self.get_count())))
+        state = marshal.dumps(self.state)
+
+        temporary_file = "%s.%s.tmp" % (self.index_file, os.getpid())
+        with open(temporary_file, "wb") as index_file:
+            index_file.write(b"ORGSRC3 %d %d %d\n" % (len(state), len(offsets),
+                                                      len(names)))
+            index_file.write(state)
+            for items in [term_starts, posting_starts, offsets, lines]:
+                index_file.write(items.tobytes())
+            index_file.write(b"\n" + b"".join(name + b"\n" for name in names))
+            index_file.write(postings.tobytes())
+        os.replace(temporary_file, self.index_file)
+        with open(self.log_file, "wb"):
+            pass
+        self.load()
+
+    def write_record(self, fd, record):
+        """Append a record to the locked log; merge the log if it is large."""
+        data = marshal.dumps(record)
+        os.write(fd, b"%d\n" % len(data) + data)
+        if os.fstat(fd).st_size > self.log_size:
+            self.save()
+
+    def lock(self):
+        """Open and lock the log; return its file descriptor."""
+        fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    # Headlines and terms
+    def get_count(self):
+        return self.count + len(self.added_offsets)
+
+    def get_offset(self, number):
+        if number < self.count:
+            start = self.sections[0] + 8 * number
+            return array("Q", self.data[start:start + 8])[0]
+        return self.added_offsets[number - self.count]
+
+    def get_line(self, number):
+        if number < self.count:
+            start = self.sections[1] + 4 * number
+            return array("I", self.data[start:start + 4])[0]
+        return self.added_lines[number - self.count]
+
+    def get_term(self, number):
+        """Return the term number of the index file."""
+        start = self.sections[2] + self.term_starts[number] + 1
+        end = self.sections[2] + self.term_starts[number + 1]
+        return self.data[start:end].decode("utf-8")
+
+    def find_term(self, prefix, whole=True):
+        """Return the number of the (first) term of the index file that is (starts with) prefix, else None."""
+        if self.data is None:
+            return None
+        key = b"\n" + prefix.encode("utf-8") + (b"\n" if whole else b"")
+        position = self.data.find(key, self.sections[2], self.sections[3])
+        if position == -1:
+            return None
+        return bisect_left(self.term_starts, position - self.sections[2])
+
+    def get_main_postings(self, number):
+        start = self.sections[3] + 4 * self.posting_starts[number]
+        end = self.sections[3] + 4 * self.posting_starts[number + 1]
+        return array("I", self.data[start:end])
+
+    # Scanning
+    @classmethod
+    def scan(cls, data, first, base=0, base_lines=0, start=0):
+        """Return the headlines and postings of data from start on.
+
+        data (bytes or mmap) is at offset base of the org file, base_lines
+        lines are before start; first is the number of the first headline
+        found. Text before it belongs to the headline before. Returns
+        (offsets, lines, terms, number of lines from start on).
+        """
+        offsets, lines, terms = [], [], {}
+        number = first - 1
+        position = start
+        line = base_lines
+        for match in headline_start.finditer(data, start):
+            text = data[position:match.start()]
+            if number >= 0:
+                cls.add_terms(terms, number, text)
+            line += text.count(b"\n")
+            number += 1
+            position = match.start()
+            offsets.append(base + position)
+            lines.append(line + 1)
+        text = data[position:]
+        if number >= 0:
+            cls.add_terms(terms, number, text)
+        line += text.count(b"\n")
+        return offsets, lines, terms, line - base_lines
+
+    @classmethod
+    def add_terms(cls, terms, number, text):
+        for term in cls.get_terms(text.decode("utf-8", "replace")):
+            terms.setdefault(term, []).append(number)
+
+    @classmethod
+    def get_terms(cls, text):
+        """Return the set of the terms of the text of a headline."""
+        text = timestamp_pattern.sub(" ", text)
+        return set(term_pattern.findall(text.lower())) - cls.stop_terms
+
+    # Keeping the index up to date
+    def update(self):
+        """Bring the index up to date with the org file and save it if it changed.
+
+        Returns self.
+        """
+        fd = self.lock()
+        try:
+            self.load()
+            try:
+                org_file = open(self.path, "rb")
+            except FileNotFoundError:
+                if self.state[0]:
+                    self.reset()
+                    self.save()
+                return self
+            with org_file:
+                stat = os.fstat(org_file.fileno())
+                size, mtime, inode, lines, count, last_offset, crc = \
+                    self.state
+                if (stat.st_size, stat.st_mtime_ns, stat.st_ino) == \
+                        (size, mtime, inode):
+                    return self
+                if stat.st_size == 0:
+                    self.reset()
+                    self.state = (0, stat.st_mtime_ns, stat.st_ino, 0, 0, 0,
+                                  0)
+                    self.save()
+                    return self
+                with mmap.mmap(org_file.fileno(), 0,
+                               access=mmap.ACCESS_READ) as data:
+                    if stat.st_ino == inode and len(data) >= size and count \
+                            and self.get_crc(data, 0, size) == crc \
+                            and not self.has_stale_terms(data, last_offset,
+                                                         size):
+                        # Only appended to: scan from the last indexed
+                        # headline on (its text may have grown)
+                        self.extend_from(fd, data, stat, count - 1, 0,
+                                         self.get_line(count - 1) - 1,
+                                         last_offset)
+                    else:
+                        self.reset()
+                        self.extend_from(None, data, stat, 0, 0, 0, 0)
+                        self.save()
+        finally:
+            os.close(fd)
+        return self
+
+    def has_stale_terms(self, data, last_offset, size):
+        """Return True if an append to the last headline changed its indexed terms.
+
+        The terms of its text are only added to; an append that continues
+        the last line may join a word ("kappa" + "theta"), which would keep
+        the indexed part of it ("kappa").
+        """
+        if data[size - 1:size] == b"\n":
+            return False
+        match = headline_start.search(data, size)
+        end = match.start() if match else len(data)
+        old = self.get_terms(data[last_offset:size].decode("utf-8", "replace"))
+        new = self.get_terms(data[last_offset:end].decode("utf-8", "replace"))
+        return not old <= new
+
+    def extend_from(self, fd, data, stat, first, base, base_lines, start,
+                    mtime=None):
+        """Add the headlines of data (at offset base of the org file) from start on.
+
+        first is the number of the first headline found; the last indexed
+        headline may be found again. With the log's fd the additions are
+        appended to the log. mtime is recorded instead of that of stat.
+        """
+        offsets, lines, terms, lines_count = self.scan(data, first, base,
+                                                       base_lines, start)
+        previous = self.get_count()
+        if first < previous:
+            offsets, lines = offsets[1:], lines[1:]
+        self.add(offsets, lines, terms)
+        count = self.get_count()
+        last_offset = self.get_offset(count - 1) if count else 0
+        # The CRC of the text indexed so far, continued
+        crc = self.get_crc(data, self.state[0] - base, len(data), self.state[6])
+        if mtime is None:
+            mtime = stat.st_mtime_ns
+        self.state = (base + len(data), mtime, stat.st_ino,
+                      base_lines + lines_count, count, last_offset, crc)
+        if fd is not None:
+            self.write_record(fd, (self.state, previous, offsets, lines, terms))
+
+    def extend(self, offset, data):
+        """Add the headlines of data just appended to the org file at offset.
+
+        Without reading the org file; if the index does not end at offset or
+        data continues its last line, the index is updated instead. Several
+        processes may extend at once.
+        """
+        if not os.path.exists(self.index_file):
+            self.update()
+            return
+        fd = self.lock()
+        try:
+            self.load()
+            stat = os.stat(self.path)
+            size, mtime, inode, lines, count, last_offset, crc = self.state
+            # An append that continues the last line is scanned by update()
+            # from the last headline on
+            if size == offset and inode == stat.st_ino and (
+                    not offset or data[:1] == b"\n" or
+                    self.read_byte(offset - 1) == b"\n"):
+                # The old mtime: the file may have been edited before the
+                # append, so the next update() checks the CRC
+                self.extend_from(fd, data, stat, count, offset, lines, 0,
+                                 mtime)
+                return
+        finally:
+            os.close(fd)
+        self.update()
+
+    def read_byte(self, offset):
+        with open(self.path, "rb") as org_file:
+            org_file.seek(offset)
+            return org_file.read(1)
+
+    @staticmethod
+    def get_crc(data, start, end, crc=0):
+        """Return crc continued by data[start:end] (bytes or mmap) without copying it."""
+        with memoryview(data) as view, view[start:end] as part:
+            return zlib.crc32(part, crc)
+
+    # Searching
+    def get_postings(self, term, number=-1):
+        """Return the numbers of the headlines that contain term.
+
+        number is the number of the term in the index file, if known.
+        """
+        if number == -1:
+            number = self.find_term(term)
+        postings = array("I") if number is None \
+            else self.get_main_postings(number)
+        postings.extend(self.added_terms.get(term, ()))
+        return postings
+
+    def get_prefixed(self, prefix):
+        """Return the terms that start with prefix => their numbers in the index file (or None)."""
+        terms = dict.fromkeys(term for term in self.added_terms
+                              if term.startswith(prefix))
+        number = self.find_term(prefix, whole=False)
+        if number is not None:
+            while number < len(self.term_starts) - 1:
+                term = self.get_term(number)
+                if not term.startswith(prefix):
+                    break
+                terms[term] = number
+                number += 1
+        return terms
+
+    def search(self, query, limit=None):
+        """Return the numbers of the headlines that contain every word of query, the latest first.
+
+        The last word also matches the words it starts.
+        """
+        words = word_pattern.findall(query.lower())
+        if not words:
+            return []
+        # Words of one letter are not indexed, but may start one
+        lists = [self.get_postings(word) for word in words[:-1]
+                 if len(word) > 1]
+        prefixed = [self.get_postings(term, number) for term, number
+                    in self.get_prefixed(words[-1]).items()]
+        if len(prefixed) == 1:
+            lists.append(prefixed[0])
+        else:
+            lists.append(sorted(set().union(*prefixed)))
+        # The ascending postings are checked by binary search, starting with
+        # the latest headlines of the shortest
+        lists.sort(key=len)
+        numbers = []
+        for number in reversed(lists[0]):
+            for postings in lists[1:]:
+                position = bisect_left(postings, number)
+                if position == len(postings) or postings[position] != number:
+                    break
+            else:
+                numbers.append(number)
+                if len(numbers) == limit:
+                    break
+        return numbers
+
+    def get_headline(self, number):
+        """Return (offset, line, heading) of a headline number."""
+        offset = self.get_offset(number)
+        with open(self.path, "rb") as org_file:
+            org_file.seek(offset)
+            heading = org_file.readline(1 << 12)
+        heading = heading.decode("utf-8", "replace").rstrip("\n")
+        return offset, self.get_line(number), heading
+
+
+def extend_search_index(path, offset, data, create=False):
+    """Extend the search index of path (if it has one) by an append."""
+    index = SearchIndex(path)
+    if create or os.path.exists(index.index_file):
+        index.extend(offset, data)
+
+
+def search(paths, query, limit=30):
+    """Return (path, line, heading) of the headlines of paths that match query.
+
+    The shards of each path (see org_mode_rotate) are searched as well, the
+    latest first.
+    """
+    from org_mode_rotate import get_shards
+
+    results = []
+    for path in paths:
+        for shard in reversed(get_shards(path)):
+            if shard.endswith(".gz"):
+                found = search_shard(shard, query, limit - len(results))
+            else:
+                index = SearchIndex(shard).update()
+                found = [index.get_headline(number)[1:] for number
+                         in index.search(query, limit - len(results))]
+            results.extend((shard, line, heading) for line, heading in found)
+            if len(results) >= limit:
+                return results
+    return results
+
+
+def search_shard(path, query, limit=None):
+    """Return (line, heading) of the headlines of a compressed shard that match query.
+
+    The shard is read without an index; the matches are those of
+    SearchIndex.search.
+    """
+    from org_mode_rotate import open_shard
+
+    words = word_pattern.findall(query.lower())
+    if not words:
+        return []
+    found = []
+
+    def check(line, lines):
+        terms = SearchIndex.get_terms(b"".join(lines).decode("utf-8",
+                                                             "replace"))
+        if all(word in terms for word in words[:-1] if len(word) > 1) and \
+                any(term.startswith(words[-1]) for term in terms):
+            heading = lines[0].decode("utf-8", "replace").rstrip("\n")
+            found.append((line, heading))
+
+    start, lines = None, []
+    with open_shard(path, "rb") as shard:
+        for number, text in enumerate(shard, 1):
+            if headline_start.match(text):
+                if start is not None:
+                    check(start, lines)
+                start, lines = number, []
+            if start is not None:
+                lines.append(text)
+    if start is not None:
+        check(start, lines)
+    found.reverse()
+    return found[:limit]
+
+
+def format_results(results):
+    """Return the Alfred JSON of search results."""
+    import json
+
+    items = []
+    for path, line, heading in results:
+        title = heading.lstrip("*").strip()
+        items.append({
+            "title": title,
+            "subtitle": "%s:%s" % (os.path.basename(path), line),
+            "arg": path,
+            "variables": {"line": str(line)},
+            "text": {"copy": title, "largetype": heading},
+            "quicklookurl": path
+        })
+    if not items:
+        items.append({"title": "No matching entries", "valid": False})
+    return json.dumps({"items": items}, ensure_ascii=False)
+
+
+def main(argv=None):
+    from org_mode_agenda import get_agenda_files
+
+    argv = sys.argv[1:] if argv is None else argv
+    query = " ".join(argv)
+    print(format_results(search(get_agenda_files(), query)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# python version 3.8
+# UTF-8 encoding
+import fcntl
+import marshal
+import os
+import sys
+import time
+
+from org_mode_index import extend_index
+from org_mode_search import extend_search_index
+from org_mode_writer import InboxWriter
+
+
+class CaptureSpool(object):
+    """Crash-safe journal of captures that are not yet in their org files.
+
+    append() commits an entry with one fsync'd write to the journal in
+    directory and returns at once. flush() drains the journal into the org
+    files in batches and in order; start_flusher() runs it in a background
+    process.
+
+    Journal record: b"<path length> <entry length>\\n" + path + entry (UTF-8).
+    The byte offset of a record in the journal is its sequence number. The
+    state file keeps the journal's inode, the sequence number up to which it
+    is flushed and, while a batch is written, the size of each org file
+    before the batch, so that an interrupted batch is completed instead of
+    written twice. A flushed journal is replaced by an empty one.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.journal_file = os.path.join(directory, "spool.journal")
+        self.state_file = os.path.join(directory, "spool.state")
+        self.lock_file = os.path.join(directory, "spool.lock")
+
+        # Flushing
+        self.batch_size = 1 << 20  # bytes of the journal per batch
+        self.retries = 5
+        self.retry_delay = 1.0  # seconds; doubled after each failed try
+        self.writer = InboxWriter()
+
+    def append(self, path, string):
+        """Commit an entry for the org file path; return its sequence number."""
+        path = os.path.abspath(path).encode('utf-8')
+        string = string.encode('utf-8')
+        record = b"%d %d\n" % (len(path), len(string)) + path + string
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd = None
+        while fd is None:
+            # None: the flusher replaced the journal meanwhile
+            fd = self.open_journal()
+        try:
+            try:
+                sequence = os.fstat(fd).st_size
+                os.write(fd, record)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return sequence
+
+    def open_journal(self):
+        """Open and lock the journal; return None if it was replaced meanwhile.
+
+        The lock keeps records whole and their offsets unique.
+        """
+        fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if self.get_inode() != os.fstat(fd).st_ino:
+            os.close(fd)
+            return None
+        return fd
+
+    def get_inode(self):
+        try:
+            return os.stat(self.journal_file).st_ino
+        except FileNotFoundError:
+            return None
+
+    def read_records(self, offset, limit=None):
+        """Yield (sequence, next sequence, path, entry) of the complete records from offset on."""
+        try:
+            journal = open(self.journal_file, "rb")
+        except FileNotFoundError:
+            return
+        with journal:
+            journal.seek(offset)
+            while limit is None or offset < limit:
+                header = journal.readline()
+                try:
+                    path_length, length = [int(n) for n in header.split()]
+                except ValueError:
+                    # End of journal or a record cut off by a crash
+                    return
+                data = journal.read(path_length + length)
+                if len(data) < path_length + length:
+                    return
+                end = offset + len(header) + len(data)
+                yield (offset, end, data[:path_length].decode('utf-8'),
+                       data[path_length:])
+                offset = end
+
+    def read_state(self):
+        """Return the state of the current journal."""
+        inode = self.get_inode()
+        try:
+            with open(self.state_file, "rb") as state_file:
+                state = marshal.load(state_file)
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            state = None
+        if state is None or state["inode"] != inode:
+            # A new journal
+            state = {"inode": inode, "offset": 0, "pending": None}
+        return state
+
+    def write_state(self, state):
+        temporary_file = self.state_file + ".tmp"
+        with open(temporary_file, "wb") as state_file:
+            marshal.dump(state, state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(temporary_file, self.state_file)
+
+    def pending(self):
+        """Return the number of journal bytes that are not flushed yet."""
+        state = self.read_state()
+        try:
+            size = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            return 0
+        return size - state["offset"]
+
+    def has_records(self):
+        """Return True if the journal has complete records that are not flushed yet.
+
+        Unlike pending(), a record cut off by a crash does not count.
+        """
+        state = self.read_state()
+        return next(self.read_records(state["offset"]), None) is not None
+
+    def flush(self):
+        """Write all committed entries to their org files.
+
+        Returns False if another flusher is running. Failed writes are
+        retried; if they keep failing the error is raised and the entries
+        stay in the journal. Entries committed while the lock is released
+        are flushed as well: their flusher may have found it taken.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            lock = os.open(self.lock_file, os.O_WRONLY | os.O_CREAT, 0o600)
+            try:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                self.flush_retrying()
+            finally:
+                os.close(lock)
+            if not self.has_records():
+                return True
+
+    def flush_retrying(self):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                self.flush_batches()
+                return
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+    def flush_batches(self):
+        state = self.read_state()
+        while True:
+            if state["pending"] is None:
+                limit = state["offset"] + self.batch_size
+                records = list(self.read_records(state["offset"], limit))
+                if not records:
+                    self.compact(state)
+                    return
+
+                pending = {}
+                for sequence, end, path, string in records:
+                    if path not in pending:
+                        pending[path] = self.get_size(path)
+                state = dict(state, end=records[-1][1], pending=pending)
+                self.write_state(state)
+
+            # Also completes a batch that was interrupted
+            self.write_batch(state)
+            state = dict(state, offset=state["end"], pending=None)
+            self.write_state(state)
+
+    def write_batch(self, state):
+        """Append the records of a batch, skipping what is already written."""
+        batches = {}
+        for sequence, end, path, string in self.read_records(state["offset"],
+                                                             state["end"]):
+            batches.setdefault(path, []).append(string)
+
+        for path, strings in batches.items():
+            data = b"".join(strings)
+            written = self.get_written(path, state["pending"][path], data)
+            if written == len(data):
+                continue
+            offset = self.writer.write(path, data[written:], sync=True)
+            # Keep an existing headline index and search index up to date
+            extend_index(path, offset, data[written:])
+            extend_search_index(path, offset, data[written:])
+
+    def get_written(self, path, size, data):
+        """Return how much of data is already at offset size of path."""
+        try:
+            with open(path, "rb") as org_file:
+                org_file.seek(size)
+                existing = org_file.read(len(data))
+        except FileNotFoundError:
+            return 0
+        if not data.startswith(existing):
+            # The file was changed otherwise; rather write the whole batch
+            # again than lose it
+            return 0
+        return len(existing)
+
+    @staticmethod
+    def get_size(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def compact(self, state):
+        """Replace the journal by an empty one once everything in it is flushed."""
+        if not state["offset"]:
+            return
+        fd = self.open_journal()
+        if fd is None:
+            return
+        try:
+            if os.fstat(fd).st_size == state["offset"]:
+                temporary_file = self.journal_file + ".tmp"
+                os.close(os.open(temporary_file,
+                                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600))
+                os.replace(temporary_file, self.journal_file)
+                self.write_state({"inode": self.get_inode(), "offset": 0,
+                                  "pending": None})
+        finally:
+            os.close(fd)
+
+    def start_flusher(self):
+        """Flush in a detached process and return at once.
+
+        The process is forked twice, so that a long-running parent (the
+        capture daemon) is not left with a zombie, and closes the descriptors
+        it inherited (e.g. the daemon's socket).
+        """
+        pid = os.fork()
+        if pid != 0:
+            try:
+                # The first child exits at once
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                # Reaped already (SIGCHLD ignored)
+                pass
+            return
+        try:
+            os.setsid()
+            if os.fork() != 0:
+                os._exit(0)
+            # Detach from Alfred's pipes so that the capture returns
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in range(3):
+                os.dup2(devnull, fd)
+            self.close_descriptors()
+            self.flush()
+        finally:
+            os._exit(0)
+
+    @staticmethod
+    def close_descriptors():
+        """Close the file descriptors after stdin, stdout and stderr."""
+        for name in os.listdir("/dev/fd"):
+            if int(name) > 2:
+                try:
+                    os.close(int(name))
+                except OSError:
+                    # The descriptor of the listing
+                    pass
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Flush the capture spool into the org files.")
+    parser.add_argument("directory", help="spool directory")
+    args = parser.parse_args(argv)
+
+    spool = CaptureSpool(args.directory)
+    if spool.flush() is False:
+        print("Another flusher is running.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
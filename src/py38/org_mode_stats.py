@@ -0,0 +1,71 @@
+# python version 3.8
+# UTF-8 encoding
+import os
+
+
+class FormatStats(object):
+    """Aggregated timings of the formatting stages and file writes.
+
+    Assign an instance to OrgmodeEntry.stats to record every stage of
+    format_entry and write_to_file; any object with a record method works
+    as a hook. By default OrgmodeEntry.stats is None and nothing is recorded.
+    """
+    fields = ["calls", "seconds", "max_seconds", "input_length",
+              "output_length", "matches"]
+
+    def __init__(self):
+        # stage => [calls, seconds, max_seconds, input_length, output_length, matches]
+        self.stages = {}
+
+    def record(self, stage, seconds, input_length, output_length, matches=0):
+        values = self.stages.get(stage)
+        if values is None:
+            self.stages[stage] = [1, seconds, seconds, input_length,
+                                  output_length, matches]
+        else:
+            values[0] += 1
+            values[1] += seconds
+            values[2] = max(values[2], seconds)
+            values[3] += input_length
+            values[4] += output_length
+            values[5] += matches
+
+    def merge(self, stages):
+        """Add the aggregated values of as_dict() to these stats."""
+        for stage, values in stages.items():
+            values = [values[field] for field in self.fields]
+            current = self.stages.get(stage)
+            if current is None:
+                self.stages[stage] = values
+            else:
+                for i in range(len(values)):
+                    if self.fields[i] == "max_seconds":
+                        current[i] = max(current[i], values[i])
+                    else:
+                        current[i] += values[i]
+
+    def as_dict(self):
+        return {
+            stage: dict(zip(self.fields, values))
+            for stage, values in self.stages.items()
+        }
+
+    def dump(self, path):
+        """Add the stats to the aggregated stats in a JSON file."""
+        import json
+
+        stats = FormatStats()
+        stats.merge(self.as_dict())
+        if os.path.exists(path):
+            with open(path) as stats_file:
+                try:
+                    stats.merge(json.load(stats_file))
+                except ValueError:
+                    # Start over if the file is not readable
+                    pass
+
+        # Replace the file at once so that readers never see a partial file
+        temporary_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(temporary_path, "w") as stats_file:
+            json.dump(stats.as_dict(), stats_file, indent=2, sort_keys=True)
+        os.replace(temporary_path, path)
@@ -0,0 +1,132 @@
+# python version 3.8
+# UTF-8 encoding
+"""Capture templates: the layout of the entries of an action.
+
+A template is the text of an entry with fields like in org-capture:
+
+    %{stars} %{heading} :inbox:
+    %{planning}
+    :PROPERTIES:
+    :CREATED: %{created:[%Y-%m-%d %a %H:%M]}
+    :SOURCE: Alfred
+    :END:
+    %{body}
+
+Fields:
+    stars       the stars of the heading level
+    heading     the heading with its TODO keyword and priority
+    todo        the TODO keyword of the heading
+    priority    the priority letter of the heading
+    title       the heading without them
+    deadline    the DEADLINE timestamp
+    scheduled   the SCHEDULED timestamp
+    planning    DEADLINE and SCHEDULED with their keywords
+    created     the time of the capture, formatted with strftime
+                (default [%Y-%m-%d %a])
+    body        the body
+
+%% is a percent sign. A line whose fields are all empty is left out, so a
+"DEADLINE: %{deadline}" line only appears with a deadline. The template
+must start with the headline (%{stars} or stars).
+
+A template is compiled once into a plan: per line the literal text and the
+fields in turn, so rendering is a join of the line's parts.
+"""
+import re
+
+# Fields of a template
+fields = ["stars", "heading", "todo", "priority", "title", "deadline",
+          "scheduled", "planning", "created", "body"]
+# Fields formatted with strftime and their default format
+date_fields = {"created": "[%Y-%m-%d %a]"}
+
+field_pattern = re.compile(r'%(?:\{([^}:\n]*)(?::([^}\n]*))?\}|%|\{)')
+
+# Compiled templates of this process: text => CaptureTemplate
+templates = {}
+
+
+class TemplateError(ValueError):
+    """A template cannot be compiled."""
+
+
+class CaptureTemplate(object):
+    """A compiled capture template (see the module documentation)."""
+    def __init__(self, text):
+        self.text = text
+        # Per line: (parts, fields); the parts are literal text and the keys
+        # of the fields in turn, starting with text
+        self.lines = []
+        # Key of a date field => (field, strftime format)
+        self.formats = {}
+        self.compile(text)
+        # Date fields the template has
+        self.dates = set(name for name, date_format in self.formats.values())
+
+    def compile(self, text):
+        for line in text.replace("\r\n", "\n").split("\n"):
+            parts, keys = [""], []
+            position = 0
+            for match in field_pattern.finditer(line):
+                parts[-1] += line[position:match.start()]
+                position = match.end()
+                if match.group() == "%%":
+                    parts[-1] += "%"
+                    continue
+                if match.group() == "%{":
+                    raise TemplateError("Unclosed field in template line %r" %
+                                        line)
+                keys.append(self.get_key(match.group(1), match.group(2)))
+                parts.extend([keys[-1], ""])
+            parts[-1] += line[position:]
+            self.lines.append((tuple(parts), tuple(keys)))
+        first = self.lines[0][0]
+        if not first[0].startswith("*") and \
+                (first[0] or len(first) == 1 or first[1] != "stars"):
+            raise TemplateError("A template must start with the headline "
+                                "(%%{stars} or stars), not %r" %
+                                text.split("\n")[0])
+
+    def get_key(self, name, date_format):
+        name = name.strip()
+        if name not in fields:
+            raise TemplateError("Unknown field %%{%s} (use %s)" %
+                                (name, ", ".join(fields)))
+        if name in date_fields:
+            if date_format is None:
+                date_format = date_fields[name]
+            key = "%s:%s" % (name, date_format)
+            self.formats[key] = (name, date_format)
+            return key
+        if date_format is not None:
+            raise TemplateError("Field %%{%s} takes no format" % name)
+        return name
+
+    def render(self, values):
+        """Return the text of an entry; values maps the fields to their text.
+
+        The date fields are datetime.datetime objects (or None).
+        """
+        for key, (name, date_format) in self.formats.items():
+            date = values[name]
+            values[key] = "" if date is None else date.strftime(date_format)
+        lines = []
+        for parts, keys in self.lines:
+            if keys and not any(values[key] for key in keys):
+                continue
+            if not keys:
+                lines.append(parts[0])
+                continue
+            items = list(parts)
+            items[1::2] = [values[key] or "" for key in keys]
+            lines.append("".join(items))
+        return "\n".join(lines)
+
+
+def get_template(text):
+    """Return the compiled template of text (compiled once per process)."""
+    try:
+        return templates[text]
+    except KeyError:
+        template = templates[text] = CaptureTemplate(text)
+        return template
@@ -0,0 +1,254 @@
+# python version 3.8
+# UTF-8 encoding
+import re
+from time import perf_counter
+
+
+class TransformEngine(object):
+    """Compiled body and heading transformations of an OrgmodeEntry.
+
+    Every pattern is compiled once per configuration (see get_signature).
+    Absolute and relative dates are found in a single left-to-right scan of
+    the body by the date matcher (org_mode_dates); the remaining rules run
+    on precompiled patterns.
+
+    The transformations keep no state of their own: the day relative dates
+    are resolved from is passed as today (default: the day of the
+    OrgmodeEntry's get_now), and each returns its result with the number of
+    matches the stats are recorded with (see apply), so one engine can be
+    used from several threads.
+    """
+    # Options of an OrgmodeEntry the compiled patterns depend on
+    options = [
+        "replace_absolute_dates", "replace_relative_dates", "date_format",
+        "date_cache",
+        "smart_line_break", "line_break_pattern", "convert_deadlines",
+        "deadline_pattern", "deadline_keyword", "convert_scheduled",
+        "scheduled_pattern", "scheduled_keyword", "date_format_regex",
+        "cleanup_spaces", "use_priority_tags", "priority_tag"
+    ]
+
+    def __init__(self, org):
+        self.org = org
+        self.signature = self.get_signature(org)
+        self.patterns = {}
+
+        # Compile the enabled rules up front, all others on first use
+        rules = [
+            ("replace_absolute_dates", "dates"),
+            ("replace_relative_dates", "dates"),
+            ("smart_line_break", "line_break"),
+            ("convert_deadlines", "deadline"),
+            ("convert_scheduled", "scheduled"),
+            ("cleanup_spaces", "spaces"),
+            ("use_priority_tags", "priority"),
+        ]
+        for option, name in rules:
+            if getattr(org, option) is True:
+                self.pattern(name)
+
+    @classmethod
+    def get_signature(cls, org):
+        """Return a hashable snapshot of all options that affect compilation."""
+        signature = [getattr(org, option) for option in cls.options]
+        signature.append(tuple(org.date_locales))
+        signature.append(tuple(org.weekdays.items()))
+        signature.append(tuple(org.relative_dates.items()))
+        return tuple(signature)
+
+    def pattern(self, name):
+        """Return the compiled pattern set of a rule (compiled only once)."""
+        try:
+            return self.patterns[name]
+        except KeyError:
+            pattern = getattr(self, "compile_%s" % name)()
+            self.patterns[name] = pattern
+            return pattern
+
+    # Compilation
+    def compile_dates(self):
+        from org_mode_dates import DateMatcher
+
+        org = self.org
+        return DateMatcher(org.weekdays, org.relative_dates, org.date_format,
+                           org.date_cache, org.date_locales, org.date_tables)
+
+    def compile_line_break(self):
+        expression = r'(' + self.org.line_break_pattern + ')'
+        return re.compile(expression, re.IGNORECASE)
+
+    def compile_deadline(self):
+        return self.compile_keyword(self.org.deadline_pattern)
+
+    def compile_scheduled(self):
+        return self.compile_keyword(self.org.scheduled_pattern)
+
+    def compile_keyword(self, keyword_pattern):
+        expression = r'(' + keyword_pattern + self.org.date_format_regex + ')'
+        return {
+            "date": re.compile(expression, re.IGNORECASE),
+            "keyword": re.compile(r'(' + keyword_pattern + ')'),
+        }
+
+    def compile_spaces(self):
+        return {
+            "double": re.compile(r'\s\s+'),
+            "outer": re.compile(r'(' + r'^\s|\s$' + ')'),
+        }
+
+    def compile_priority(self):
+        priority_tag = self.org.priority_tag
+        return {
+            "search": re.compile(r'(.+?|.?)%s(.?)\s' % priority_tag),
+            "tag": re.compile(r'(%s.?)\s' % priority_tag),
+            "task": re.compile("TODO"),
+        }
+
+    # Transformations
+    def transform_body(self, body, today=None):
+        """Apply all enabled rules to the body of an entry.
+
+        Returns a tuple (deadline, scheduled, body).
+        """
+        org = self.org
+        apply = self.apply
+        deadline, scheduled = None, None
+
+        if org.replace_absolute_dates is True or org.replace_relative_dates is True:
+            body = apply("replace_dates", self.replace_dates, body, today)
+
+        if org.smart_line_break is True:
+            body = apply("convert_line_breaks", self.convert_line_breaks, body)
+
+        if org.convert_deadlines is True:
+            deadline, body = apply("get_deadline_date", self.get_deadline_date,
+                                   body)
+
+        if org.convert_scheduled is True:
+            scheduled, body = apply("get_scheduled_date",
+                                    self.get_scheduled_date, body)
+
+        if org.cleanup_spaces is True:
+            body = apply("remove_double_spaces", self.remove_double_spaces,
+                         body)
+            body = apply("remove_leading_trailling_spaces",
+                         self.remove_leading_trailling_spaces, body)
+
+        return deadline, scheduled, body
+
+    def apply(self, stage, transformation, string, *args):
+        """Run a transformation and record it if the OrgmodeEntry has stats.
+
+        A transformation returns (result, number of matches); the result is
+        returned.
+        """
+        stats = self.org.stats
+        if stats is None:
+            return transformation(string, *args)[0]
+
+        start = perf_counter()
+        result, matches = transformation(string, *args)
+        seconds = perf_counter() - start
+        output = result[1] if isinstance(result, tuple) else result
+        stats.record(stage, seconds, len(string), len(output), matches)
+        return result
+
+    def get_today(self, today=None):
+        return self.org.get_now().date() if today is None else today
+
+    def replace_dates(self, string, today=None):
+        """Replace absolute and relative dates of the enabled rules at once."""
+        org = self.org
+        return self.pattern("dates").replace(
+            string, self.get_today(today),
+            absolute=org.replace_absolute_dates is True,
+            relative=org.replace_relative_dates is True)
+
+    def find_dates(self, string, today=None):
+        """Return (start, end, timestamp) of the dates replace_dates converts."""
+        org = self.org
+        return self.pattern("dates").find(
+            string, self.get_today(today),
+            absolute=org.replace_absolute_dates is True,
+            relative=org.replace_relative_dates is True)
+
+    def parse_date(self, string, today=None):
+        """Return the org timestamp of a date expression (None if it is none)."""
+        return self.pattern("dates").parse(string, self.get_today(today))
+
+    def convert_absolute_date(self, string, today=None):
+        """Replace absolute dates (and times) with org timestamps."""
+        return self.pattern("dates").replace(
+            string, self.get_today(today), relative=False)
+
+    def replace_date(self, string, today=None):
+        """Replace relative dates like next friday or in 3 days with org timestamps."""
+        return self.pattern("dates").replace(
+            string, self.get_today(today), absolute=False)
+
+    def convert_line_breaks(self, string):
+        pattern = self.pattern("line_break")
+        return pattern.subn(self.org.line_break_char, string)
+
+    def get_deadline_date(self, string):
+        return self.extract_keyword_date(
+            string, self.pattern("deadline"), self.org.deadline_keyword)
+
+    def get_scheduled_date(self, string):
+        return self.extract_keyword_date(
+            string, self.pattern("scheduled"), self.org.scheduled_keyword)
+
+    def extract_keyword_date(self, string, pattern, keyword):
+        """Remove all keyword dates from string; return ((the first one, string), matches)."""
+        found = []
+
+        def remove(match):
+            if not found:
+                found.append(match.group(1))
+            return ''
+
+        body, matches = pattern["date"].subn(remove, string)
+        if not found:
+            return (None, body), matches
+
+        # DL: => DEADLINE:
+        date = pattern["keyword"].sub(keyword, found[0])
+        return (date, body), matches
+
+    def remove_double_spaces(self, string):
+        """Collapse whitespace like two passes of replacing two spaces by one."""
+        return self.pattern("spaces")["double"].subn(self._collapse, string)
+
+    @staticmethod
+    def _collapse(match):
+        spaces = match.group()
+        for i in range(2):
+            length = len(spaces)
+            spaces = ' ' * (length // 2) + (spaces[-1] if length % 2 else '')
+        return spaces
+
+    def remove_leading_trailling_spaces(self, string):
+        return self.pattern("spaces")["outer"].subn('', string)
+
+    def add_priority(self, heading):
+        pattern = self.pattern("priority")
+        # search for priority tag
+        result = pattern["search"].match(heading)
+
+        # Add orgmode's priority tag to heading
+        if result is not None:
+            # remove priority tag from heading
+            heading = pattern["tag"].sub("", heading)
+
+            # add priority to heading
+            priority = result.group(2).upper()
+            task_tag = "TODO"
+            if pattern["task"].match(heading) is not None:
+                # Heading is task: add priority after task tag
+                task_tag_pos = len(task_tag)
+                heading = "%s [#%s] %s" % (heading[:task_tag_pos], priority,
+                                           heading[task_tag_pos + 1:])
+            else:
+                # Heading is note
+                heading = "[#%s] %s" % (priority, heading)
+        return heading, 0 if result is None else 1
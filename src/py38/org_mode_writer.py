@@ -0,0 +1,131 @@
+# python version 3.8
+# UTF-8 encoding
+import fcntl
+import os
+
+
+class InboxWriter(object):
+    """Append entries to org files safely from several processes at once.
+
+    Each append takes an advisory lock (flock) on the file and writes the
+    pre-encoded entry with a single os.write, so entries of concurrent
+    captures never interleave. A file that was replaced (rotated) while it
+    was open is reopened; with keep_open the file descriptors are kept
+    between appends and a file that shrank (truncated) is reported as well.
+    With a rotator (org_mode_rotate.InboxRotator) a file that grew too large
+    or too old is rolled over to a shard before the append.
+    """
+    def __init__(self, keep_open=False):
+        self.keep_open = keep_open
+        # path => [fd, size after the last append]
+        self.files = {}
+        # Called with (path, reason), reason is "rotated" or "truncated"
+        self.on_change = None
+        # Rolls files over to shards, e.g. an org_mode_rotate.InboxRotator
+        self.rotator = None
+
+    def append(self, path, string, sync=False):
+        """Append string to path; return the offset it was written at."""
+        return self.write(path, string.encode('utf-8'), sync)
+
+    def write(self, path, data, sync=False):
+        """Append bytes to path; return the offset they were written at."""
+        fd, size = self.open(path)
+        try:
+            while True:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                stat = os.fstat(fd)
+                if self.get_inode(path) == stat.st_ino:
+                    if self.rotator is None or \
+                            not self.rotator.check(path, stat.st_size):
+                        break
+                    # Under the lock, so that no append goes to the shard
+                    self.rotator.rotate(path)
+                # Replaced or removed meanwhile: append to the file now at path
+                os.close(fd)
+                fd, size = self.open(path, reopen=True)
+                self.report(path, "rotated")
+            try:
+                if stat.st_size < size:
+                    self.report(path, "truncated")
+                offset = stat.st_size
+                written = os.write(fd, data)
+                while written < len(data):
+                    # Only after an interrupted write
+                    written += os.write(fd, data[written:])
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            if sync:
+                os.fsync(fd)
+        except BaseException:
+            self.files.pop(path, None)
+            os.close(fd)
+            raise
+
+        if self.keep_open:
+            self.files[path] = [fd, offset + len(data)]
+        else:
+            os.close(fd)
+        return offset
+
+    def open(self, path, reopen=False):
+        """Return (fd, size after the last append) of path."""
+        if path in self.files:
+            if not reopen:
+                return self.files[path]
+            del self.files[path]
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return fd, 0
+
+    @staticmethod
+    def get_inode(path):
+        try:
+            return os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def report(self, path, reason):
+        if self.on_change is not None:
+            self.on_change(path, reason)
+
+    def close(self):
+        """Close the kept file descriptors."""
+        while self.files:
+            path, (fd, size) = self.files.popitem()
+            os.close(fd)
+
+
+def run_parallel(groups, workers):
+    """Call the functions of each group in order, the groups on up to workers threads.
+
+    The calling thread works as well. The functions must not raise. Uses
+    _thread because threading takes longer to import than a capture takes.
+    """
+    import _thread
+
+    groups = list(groups)
+    groups.reverse()
+
+    def work(lock):
+        try:
+            while True:
+                try:
+                    group = groups.pop()
+                except IndexError:
+                    return
+                for function in group:
+                    function()
+        finally:
+            if lock is not None:
+                lock.release()
+
+    locks = []
+    for number in range(min(workers, len(groups)) - 1):
+        lock = _thread.allocate_lock()
+        lock.acquire()
+        _thread.start_new_thread(work, (lock,))
+        locks.append(lock)
+    work(None)
+    for lock in locks:
+        # Released when the thread is done
+        lock.acquire()
@@ -0,0 +1,102 @@
+# python version 3.8
+# UTF-8 encoding
+"""Stress test of concurrent appends to one org file.
+
+N processes each add M multi-line entries with OrgmodeEntry to the same
+file at the same time; afterwards every entry must be in the file exactly
+once and intact.
+
+    python stress_append.py --processes 8 --entries 500
+
+Exits with status 1 if an entry is missing, duplicated or corrupted.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "py38"))
+
+from org_mode_entry import OrgmodeEntry  # noqa: E402
+
+# Multi-line entries of about 12 kB (larger than the default buffer size)
+body = "  ".join("Zeile %s mit Umlauten äöü und Text" % i for i in range(300))
+
+
+def get_entry(process, number):
+    return "TODO Entry %s-%s:: %s" % (process, number, body)
+
+
+def add_entries(path, process, entries):
+    org = OrgmodeEntry()
+    org.inbox_file = path
+    org.add_creation_date = False
+    for number in range(entries):
+        org.add_entry(get_entry(process, number))
+
+
+def get_expected(process, number):
+    org = OrgmodeEntry()
+    org.add_creation_date = False
+    return org.format(get_entry(process, number)).text
+
+
+def check(path, processes, entries):
+    """Return the list of problems found in path."""
+    with open(path, encoding='utf-8') as org_file:
+        content = org_file.read()
+
+    problems = []
+    chunks = content.split("\n* ")[1:]
+    if len(chunks) != processes * entries:
+        problems.append("%s entries instead of %s" %
+                        (len(chunks), processes * entries))
+    found = set()
+    for chunk in chunks:
+        entry = "\n* " + chunk
+        heading = chunk.split("\n", 1)[0]
+        try:
+            process, number = heading.split()[-1].split("-")
+            expected = get_expected(int(process), int(number))
+        except ValueError:
+            problems.append("corrupted heading: %r" % heading[:60])
+            continue
+        if entry != expected:
+            problems.append("corrupted entry: %r" % heading[:60])
+        if (process, number) in found:
+            problems.append("duplicated entry: %r" % heading[:60])
+        found.add((process, number))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--entries", type=int, default=200,
+                        help="entries per process")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "inbox.org")
+        workers = [
+            multiprocessing.Process(target=add_entries,
+                                    args=(path, process, args.entries))
+            for process in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        problems = check(path, args.processes, args.entries)
+
+    for problem in problems[:20]:
+        print(problem)
+    print("%s processes x %s entries: %s" %
+          (args.processes, args.entries, "FAILED" if problems else "OK"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())